@@ -5,17 +5,29 @@ class ActionBase(object):
     rules. Methods are expected to provide a docstring with the appropriate productions while class
     variables values are considered to be grammar rules.  Action methods take a single argument which
     provides accessors to each lexeme in the rule.
+
+    Nodes keep their fields in slots.  Child accessors - node.expr, node.expr_2, node.concat_set_1 -
+    are computed from the children on first use rather than stored on every node.
     """
 
+    _fields = ('type', 'children', 'value', 'leaf', 'line', 'linepos', 'alt', 'match', 'count', '_sets')
+    __slots__ = _fields + ('_index', '__dict__', '__weakref__')
+
+    action_proc_format = '_{0}'
+    init = None
+
     def __init__(self, **attrs):
         self.children = []
-        self.__dict__.update(attrs)
-        if hasattr(self, 'init'):
+        self._sets = None
+        self._index = None
+        for key, value in attrs.items():
+            setattr(self, key, value)
+        if self.init is not None:
             self.init(**attrs)
-        
+
     def __str__(self):
         return '<NODE {0}>'.format(self.type)
-    
+
     def __call__(self):
         desc = getattr(self, 'action_proc_format', '_{0}')
         type = getattr(self, 'type')
@@ -26,7 +38,57 @@ class ActionBase(object):
             if getattr(self, 'leaf', False):
                 return self.value
             return self.children[0]()
-    
+
+    def __getattr__(self, name):
+        """
+        Resolves child accessors - type gives the first child of that type, type_n the nth child of
+        that type and type_set_n the items of the nth repetition of type.
+        """
+        if name.startswith('_'):
+            # slots and special methods, rule names never start with an underscore
+            raise AttributeError(name)
+        index = self._child_index()
+        if name in index:
+            return index[name][0]
+        prefix, _, number = name.rpartition('_')
+        if number.isdigit() and int(number) > 0:
+            if prefix.endswith('_set') and self._sets:
+                sets = [items for type, items in self._sets if type == prefix[:-4]]
+                if int(number) <= len(sets):
+                    return sets[int(number) - 1]
+            children = index.get(prefix, ())
+            if int(number) <= len(children):
+                return children[int(number) - 1]
+        raise AttributeError("'{0}' node has no attribute '{1}'".format(getattr(self, 'type', None), name))
+
+    def __getstate__(self):
+        state = dict((field, getattr(self, field)) for field in ActionBase._fields if hasattr(self, field))
+        return state, getattr(self, '__dict__', None)
+
+    def __setstate__(self, state):
+        slots, attrs = state
+        self._index = None
+        for key, value in slots.items():
+            setattr(self, key, value)
+        if attrs:
+            self.__dict__.update(attrs)
+
+    def _child_index(self):
+        """
+        Returns the children grouped by type, built on first use after the children change
+        """
+        index = self._index
+        if index is None:
+            index = {}
+            for child in self.children:
+                type = child.type
+                if type in index:
+                    index[type].append(child)
+                else:
+                    index[type] = [child]
+            self._index = index
+        return index
+
     def graph(self):
         """
         Generates a human readable form of the AST - can also be fed into PhpSyntaxTree for a
@@ -37,12 +99,47 @@ class ActionBase(object):
 
     def add_child(self, child):
         self.children.append(child)
-        if not hasattr(self, child.type):
-            setattr(self, child.type, child)
-        setattr(self, self.unique_id(child.type), child)
-
-    def unique_id(self, id):
-        for x in range(1, 50, 1):
-            uid = '{0}_{1}'.format(id, x)
-            if not hasattr(self, uid):
-                return uid
\ No newline at end of file
+        self._index = None
+
+    def add_set(self, type, items):
+        """
+        Records the items matched by a repetition of type, exposed as type_set_n
+        """
+        if self._sets is None:
+            self._sets = []
+        self._sets.append((type, items))
+
+
+class Binding(object):
+    """
+    An action class bound to the grammar table and AST node class of one parser.  Nodes are built as
+    instances of node_class, a subclass of the action class giving them node.table and node.ast_node,
+    so the action class itself is never changed and any number of grammars can share it.  Bound nodes
+    pickle along with their binding, which makes its node class again when unpickled.
+    """
+
+    def __init__(self, action, table, ast_node):
+        self.action = action
+        self.table = table
+        self.ast_node = ast_node
+        self.node_class = type(action.__name__, (action,), {
+            '__slots__': (),
+            '__module__': action.__module__,
+            '__reduce__': _reduce_bound,
+            'table': table,
+            'ast_node': ast_node,
+            '_binding': self,
+        })
+        # the arena node view class, made on first use
+        self.view_class = None
+
+    def __reduce__(self):
+        return Binding, (self.action, self.table, self.ast_node)
+
+
+def _reduce_bound(node):
+    return _bound_node, (node._binding,), node.__getstate__()
+
+
+def _bound_node(binding):
+    return binding.node_class.__new__(binding.node_class)
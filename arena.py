@@ -0,0 +1,340 @@
+"""
+Array backed concrete syntax trees.
+
+An Arena keeps every CST node of a parse in parallel flat arrays indexed by node number - interned
+type id, start and end offset, parent, first child and next sibling - instead of one Python object
+per node.  ActionBase style views are created only for the nodes an action or caller touches, so
+large inputs hold a few dozen bytes per node and pickle as a handful of strings.
+
+    parser = Parser(Interpreter, tree='arena')
+    root = parser.parse(code)
+    root()                      # actions run against views exactly as they do against nodes
+    arena = root.arena          # the arrays, e.g. arena.type_name(i), arena.span(i), arena.children(i)
+
+encode(arena) packs an arena into a single string and decode(data, binding) unpacks it for the
+parser binding, the format parse_cache stores and parse_many workers send their results in.
+"""
+
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from action import ActionBase
+
+
+# per node arrays and their typecodes, -1 marks a field that is not set
+COLUMNS = (
+    ('type', 'i'),
+    ('kind', 'b'),
+    ('start', 'l'),
+    ('end', 'l'),
+    ('parent', 'l'),
+    ('first_child', 'l'),
+    ('next_sibling', 'l'),
+    ('alt', 'h'),
+    ('match', 'b'),
+    ('sets', 'l'),
+)
+
+# repetitions recorded against a node, exposed on views as type_set_n
+SET_COLUMNS = (
+    ('set_type', 'i'),
+    ('set_first', 'l'),
+    ('set_count', 'l'),
+    ('set_next', 'l'),
+)
+
+# encoded arenas start with the format and the byte order and item sizes of the machine's arrays,
+# followed by the root, whether the input is unicode and the length of every part - the type names,
+# the input and each column
+MAGIC = 'CST1'
+SIGNATURE = sys.byteorder[0] + ''.join([str(array(typecode).itemsize) for name, typecode in COLUMNS + SET_COLUMNS])
+HEADER = struct.Struct('<4s16sqB{0}q'.format(2 + len(COLUMNS + SET_COLUMNS)))
+
+
+class Arena(object):
+    """
+    Parallel arrays holding the nodes of one parse.  Leaf values are not stored, a leaf is the text
+    between its start and end offsets.  A rule node ends at the parser cursor after it matched.
+
+    A node attached a second time is copied, the copy sharing the children of the original.  The
+    parser attaches copies of memoized rule nodes as well, so marks made on one use of a node never
+    show up on another.
+    """
+
+    RULE = 0
+    LEAF = 1
+    EMPTY = 2
+
+    def __init__(self, code, binding):
+        self.code = code
+        self.binding = binding
+        self.types = []
+        self.type_ids = {}
+        for name, typecode in COLUMNS + SET_COLUMNS:
+            setattr(self, name, array(typecode))
+        # only needed to append children while parsing
+        self.last_child = array('l')
+        self.root = -1
+        self.newlines = None
+
+    def __len__(self):
+        return len(self.type)
+
+    def __getstate__(self):
+        state = dict((name, getattr(self, name).tostring()) for name, typecode in COLUMNS + SET_COLUMNS)
+        state.update(code=self.code, binding=self.binding, types=self.types, root=self.root)
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(state['code'], state['binding'])
+        for name, typecode in COLUMNS + SET_COLUMNS:
+            getattr(self, name).fromstring(state[name])
+        self.types = state['types']
+        self.type_ids = dict((name, id) for id, name in enumerate(self.types))
+        self.root = state['root']
+        self.last_child = None
+
+    def new(self, type, kind, start, end=-1):
+        """Adds a node and returns its index"""
+        id = self.type_ids.get(type)
+        if id is None:
+            id = self.type_ids[type] = len(self.types)
+            self.types.append(type)
+        self.type.append(id)
+        self.kind.append(kind)
+        self.start.append(start)
+        self.end.append(end)
+        self.parent.append(-1)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.last_child.append(-1)
+        self.alt.append(-1)
+        self.match.append(-1)
+        self.sets.append(-1)
+        return len(self.type) - 1
+
+    def copy(self, node):
+        index = self.new(self.types[self.type[node]], self.kind[node], self.start[node], self.end[node])
+        for name in ('first_child', 'last_child', 'alt', 'match', 'sets'):
+            column = getattr(self, name)
+            column[index] = column[node]
+        return index
+
+    def attach(self, parent, child):
+        """Appends child to the children of parent and returns the index it was attached as"""
+        if self.parent[child] != -1:
+            child = self.copy(child)
+        self.parent[child] = parent
+        last = self.last_child[parent]
+        if last == -1:
+            self.first_child[parent] = child
+        else:
+            self.next_sibling[last] = child
+        self.last_child[parent] = child
+        return child
+
+    def truncate(self, nodes, sets=None):
+        """
+        Drops every node from nodes on, and every repetition from sets on when sets is given.
+        Repetitions left behind by dropped nodes are never reached again.
+        """
+        for name, typecode in COLUMNS:
+            del getattr(self, name)[nodes:]
+        del self.last_child[nodes:]
+        if sets is not None:
+            for name, typecode in SET_COLUMNS:
+                del getattr(self, name)[sets:]
+
+    def add_set(self, node, type, first, count):
+        """Records count items of a repetition of type attached to node starting at first"""
+        id = self.type_ids.get(type)
+        if id is None:
+            id = self.type_ids[type] = len(self.types)
+            self.types.append(type)
+        self.set_type.append(id)
+        self.set_first.append(first)
+        self.set_count.append(count)
+        self.set_next.append(self.sets[node])
+        self.sets[node] = len(self.set_type) - 1
+
+    def finish(self, root):
+        self.root = root
+        self.last_child = None
+
+    def type_name(self, node):
+        return self.types[self.type[node]]
+
+    def span(self, node):
+        return self.start[node], self.end[node]
+
+    def value(self, node):
+        kind = self.kind[node]
+        if kind == self.LEAF:
+            return self.code[self.start[node]:self.end[node]]
+        elif kind == self.EMPTY:
+            return False
+        return None
+
+    def children(self, node):
+        """Returns the indexes of the children of node"""
+        children = []
+        child = self.first_child[node]
+        while child != -1:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def repetitions(self, node):
+        """Returns (type, first, count) for each repetition recorded against node in parse order"""
+        sets = []
+        index = self.sets[node]
+        while index != -1:
+            sets.append((self.types[self.set_type[index]], self.set_first[index], self.set_count[index]))
+            index = self.set_next[index]
+        sets.reverse()
+        return sets
+
+    def position(self, offset):
+        """Returns the line and position in the line of offset"""
+        if self.newlines is None:
+            self.newlines = newlines = array('l')
+            index = self.code.find('\n')
+            while index != -1:
+                newlines.append(index)
+                index = self.code.find('\n', index + 1)
+        line = bisect_left(self.newlines, offset)
+        return line + 1, offset - (self.newlines[line - 1] + 1 if line else 0)
+
+    def view(self, node):
+        """Returns a new view of node"""
+        cls = view_class(self.binding)
+        view = cls.__new__(cls)
+        view._arena = self
+        view._node = node
+        view._index = None
+        attrs = {'type': self.types[self.type[node]]}
+        attrs['line'], attrs['linepos'] = self.position(self.start[node])
+        kind = self.kind[node]
+        if kind == self.LEAF:
+            attrs['value'] = self.code[self.start[node]:self.end[node]]
+            attrs['leaf'] = True
+        elif kind == self.EMPTY:
+            attrs['value'] = False
+        if self.alt[node] != -1:
+            attrs['alt'] = self.alt[node]
+        if self.match[node] != -1:
+            attrs['match'] = bool(self.match[node])
+        if self.sets[node] != -1:
+            attrs['count'] = self.set_count[self.sets[node]]
+        for key, value in attrs.items():
+            setattr(view, key, value)
+        if view.init is not None:
+            view.init(**attrs)
+        return view
+
+
+_children = ActionBase.__dict__['children']
+_sets = ActionBase.__dict__['_sets']
+
+
+class NodeView(object):
+    """
+    Mixin giving an action class the children and repetitions of an arena node, created on first use
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return _arena_view, (self._arena, self._node)
+
+    @property
+    def arena(self):
+        return self._arena
+
+    @property
+    def children(self):
+        try:
+            return _children.__get__(self)
+        except AttributeError:
+            children = [self._arena.view(child) for child in self._arena.children(self._node)]
+            _children.__set__(self, children)
+            return children
+
+    @property
+    def _sets(self):
+        try:
+            return _sets.__get__(self)
+        except AttributeError:
+            sets = None
+            repetitions = self._arena.repetitions(self._node)
+            if repetitions:
+                children = self.children
+                positions = dict((child._node, idx) for idx, child in enumerate(children))
+                sets = []
+                for type, first, count in repetitions:
+                    position = positions.get(first, 0)
+                    sets.append((type, children[position:position + count]))
+            _sets.__set__(self, sets)
+            return sets
+
+    def add_child(self, child):
+        raise TypeError('arena nodes are read only')
+
+
+def encode(arena):
+    """
+    Returns the nodes of finished arena packed into a string - the interned type names, the input
+    leaf values are read from and the raw bytes of every column.  The binding is left out, decode
+    is given one.
+    """
+    code = arena.code
+    unicode_code = isinstance(code, unicode)
+    if unicode_code:
+        code = code.encode('utf-8')
+    parts = ['\n'.join(arena.types), code]
+    parts.extend([getattr(arena, name).tostring() for name, typecode in COLUMNS + SET_COLUMNS])
+    header = HEADER.pack(MAGIC, SIGNATURE, arena.root, unicode_code, *[len(part) for part in parts])
+    return header + ''.join(parts)
+
+
+def decode(data, binding):
+    """
+    Returns the arena encode packed into data, its views built from action.Binding binding.  Raises
+    ValueError for data that is not an arena encoded on a machine like this one.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError('data is not an encoded arena')
+    fields = HEADER.unpack_from(data)
+    if fields[0] != MAGIC or fields[1].rstrip('\0') != SIGNATURE:
+        raise ValueError('data is not an arena encoded by this version on this kind of machine')
+    root, unicode_code, lengths = fields[2], fields[3], fields[4:]
+    if HEADER.size + sum(lengths) != len(data):
+        raise ValueError('encoded arena is truncated')
+    parts = []
+    offset = HEADER.size
+    for length in lengths:
+        parts.append(data[offset:offset + length])
+        offset += length
+    code = parts[1].decode('utf-8') if unicode_code else parts[1]
+    arena = Arena(code, binding)
+    for (name, typecode), part in zip(COLUMNS + SET_COLUMNS, parts[2:]):
+        getattr(arena, name).fromstring(part)
+    arena.types = parts[0].split('\n') if parts[0] else []
+    arena.type_ids = dict((name, id) for id, name in enumerate(arena.types))
+    arena.root = root
+    arena.last_child = None
+    return arena
+
+
+def view_class(binding):
+    """Returns the view class for the nodes of action.Binding binding"""
+    if binding.view_class is None:
+        node = binding.node_class
+        binding.view_class = type(node.__name__ + 'View', (NodeView, node), {'__slots__': ('_arena', '_node')})
+    return binding.view_class
+
+
+def _arena_view(arena, node):
+    return arena.view(node)
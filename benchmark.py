@@ -0,0 +1,459 @@
+"""
+Benchmarks for the table parser.
+
+    python benchmark.py scaling [--max-size 100M]
+    python benchmark.py memory [--size 1M] [--tree arena]
+    python benchmark.py stream [--size 10M]
+    python benchmark.py incremental [--size 1M]
+    python benchmark.py many [--workers 1,2,4]
+    python benchmark.py suite [--max-size 100M] [--output results.json]
+    python benchmark.py compare baseline.json results.json [--threshold 0.1]
+    python benchmark.py grammar [--rules 10000]
+
+scaling parses generated inputs of growing size and reports the time spent per input byte, which
+should stay flat as the input grows.  memory parses one input and reports the bytes held per CST
+node, for either tree representation.  stream feeds a generated input to iterparse without holding
+it and reports the peak memory used.  incremental edits a parsed document and reports how long each
+reparse takes.  many reports the throughput of parse_many for each pool mode and worker count.
+
+suite runs every reference grammar of benchmark_grammars over generated inputs from 1K up to
+--max-size with each engine, measuring the time Parser takes to compile the grammar, parse and
+action evaluation throughput and the peak memory of parsing.  Each case runs in a fresh process so
+peak memory is its own.  Results are written as JSON keyed on 'grammar engine size', sorted so that
+runs diff cleanly; compare reads two result files and flags every case whose throughput dropped or
+peak memory grew by more than --threshold, exiting with status 1 if any did.
+
+grammar times the grammar DSL itself over synthetic grammars of 10 rules up to --rules, reporting
+the time taken to scan, to parse (scanning included), to build the descriptor table and to work out
+its first_sets.guards, the best of at least three runs each.  Each step does the same work per rule
+at every size, so the time per rule should stay level once the grammar no longer fits the processor
+caches - the smallest grammars are faster, their patterns stay in re's cache of compiled patterns.
+"""
+
+import argparse
+from array import array
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+from action import ActionBase
+from benchmark_grammars import GRAMMARS
+from first_sets import guards
+from grammar_lexer import Lexer
+from grammar_parser import GrammarParser
+from incremental import Document
+from parser import Parser
+
+
+# statement lists never hold more than FANOUT items, deeper inputs nest blocks instead
+FANOUT = 40
+
+SIZES = ['1K', '10K', '100K', '1M', '10M', '100M']
+
+# version of the suite result format
+FORMAT = 1
+
+# fields of a suite result checked by compare, and whether higher is better
+CHECKED = [('parse_mbps', True), ('eval_mbps', True), ('peak_kb', False)]
+
+
+class Program(ActionBase):
+    _statement_list = "*statement"
+    _statement = "(condition | assign) ';'"
+    _condition = "'if' expr 'then' '{' statement_list '}'"
+    _assign = "ident '=' expr"
+    _expr = "term *(('+'|'-') term)"
+    _term = "factor *(('*'|'/') factor)"
+    _factor = "number | ident | '(' expr ')'"
+    _number = "/[0-9]+/"
+    _ident = "/[a-z][a-z0-9]*/"
+
+
+def parse_size(size):
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    size = size.upper()
+    if size[-1] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size)
+
+
+def generate_program(size):
+    """
+    Generates roughly size bytes of Program source.  Statements are nested in if blocks so that no
+    statement list grows past FANOUT items however large the input gets.
+    """
+    statements = ['v{0} = {0} * (w + {1}) - x / 3;'.format(idx, idx % 7) for idx in range(FANOUT)]
+    units = ['if 1 then { ' + ' '.join(statements) + ' };']
+    while len(units[-1]) * FANOUT < size:
+        units.append('if 1 then { ' + ' '.join([units[-1]] * FANOUT) + ' };')
+    count = max(1, int(round(float(size) / len(units[-1]))))
+    return ' '.join([units[-1]] * count)
+
+
+class ProgramStream(object):
+    """File like object reading size bytes of generated Program source without holding all of it"""
+
+    def __init__(self, size):
+        self.unit = generate_program(64 * 1024) + ' '
+        # whole units only so the input never ends inside a statement
+        self.remaining = max(1, size // len(self.unit)) * len(self.unit)
+        self.offset = 0
+
+    def read(self, size):
+        size = min(size, self.remaining)
+        data = []
+        while size > 0:
+            chunk = self.unit[self.offset:self.offset + size]
+            self.offset = (self.offset + len(chunk)) % len(self.unit)
+            self.remaining -= len(chunk)
+            size -= len(chunk)
+            data.append(chunk)
+        return ''.join(data)
+
+
+def time_parse(parser, code, rule=None):
+    start = time.time()
+    if not parser.parse(code, rule):
+        raise RuntimeError('benchmark input failed to parse')
+    return time.time() - start
+
+
+def tree_memory(root):
+    """
+    Returns the number of nodes under root and the bytes they hold - the node objects plus any dicts,
+    lists and tuples hanging off them.  Leaf values are not counted, shared objects are counted once.
+    """
+    seen = set()
+    nodes = size = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, ActionBase):
+            nodes += 1
+        for referent in gc.get_referents(obj):
+            if isinstance(referent, (ActionBase, dict, list, tuple)):
+                stack.append(referent)
+    return nodes, size
+
+
+def arena_memory(arena):
+    """Returns the number of nodes in arena and the bytes held by its arrays"""
+    size = 0
+    for value in vars(arena).values():
+        if isinstance(value, array):
+            size += sys.getsizeof(value)
+    return len(arena), size
+
+
+def resident_memory():
+    """Current resident set size in bytes, 0 where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return 0
+
+
+def memory(args):
+    parser = Parser(Program, entry='statement_list', engine=args.engine, tree=args.tree)
+    code = generate_program(parse_size(args.size))
+    gc.collect()
+    before = resident_memory()
+    tree = parser.parse(code)
+    gc.collect()
+    resident = resident_memory() - before
+    if args.tree == 'arena':
+        nodes, size = arena_memory(tree.arena)
+    else:
+        nodes, size = tree_memory(tree)
+    print('{0:>12} {1:>12} {2:>12} {3:>12}'.format('bytes', 'nodes', 'bytes/node', 'rss/node'))
+    print('{0:>12} {1:>12} {2:>12.1f} {3:>12.1f}'.format(len(code), nodes, float(size) / nodes,
+                                                         float(resident) / nodes))
+
+
+def stream(args):
+    parser = Parser(Program, entry='statement_list', engine=args.engine)
+    size = parse_size(args.size)
+    print('{0:>12} {1:>12} {2:>12} {3:>12}'.format('bytes', 'items', 'seconds', 'peak rss'))
+    start = time.time()
+    before = resident_memory()
+    peak = items = 0
+    for item in parser.iterparse(ProgramStream(size)):
+        # items are large, reading the resident size after each one costs little
+        items += 1
+        peak = max(peak, resident_memory() - before)
+    peak = max(peak, resident_memory() - before)
+    print('{0:>12} {1:>12} {2:>12.3f} {3:>12}'.format(size, items, time.time() - start, peak))
+
+
+def incremental(args):
+    parser = Parser(Program, entry='statement_list', engine=args.engine)
+    code = generate_program(parse_size(args.size))
+    start = time.time()
+    document = Document(parser, code)
+    full = time.time() - start
+    # retype a number in statements spread over the document
+    random.seed(0)
+    edits = []
+    for offset in random.sample([idx for idx, char in enumerate(code) if char.isdigit()], args.edits):
+        start = time.time()
+        if not document.edit(offset, 1, '7'):
+            raise RuntimeError('edited benchmark input failed to parse')
+        edits.append(time.time() - start)
+    print('{0:>12} {1:>12} {2:>12} {3:>12}'.format('bytes', 'parse', 'mean edit', 'max edit'))
+    print('{0:>12} {1:>12.3f} {2:>12.4f} {3:>12.4f}'.format(len(code), full, sum(edits) / len(edits), max(edits)))
+
+
+def naive_parse(code):
+    """Parses code the hand rolled way - compiling the grammar and pickling the whole CST back"""
+    return Parser(Program, entry='statement_list').parse(code)
+
+
+def many(args):
+    parser = Parser(Program, entry='statement_list', engine=args.engine)
+    inputs = [generate_program(parse_size(args.size))] * args.count
+    total = sum(len(code) for code in inputs)
+    print('{0:>12} {1:>12} {2:>12} {3:>12}'.format('mode', 'workers', 'seconds', 'MB/s'))
+    runs = [('serial', 1)] + [(mode, int(workers)) for mode in args.mode.split(',')
+                              for workers in args.workers.split(',')]
+    for mode, workers in runs:
+        start = time.time()
+        if mode == 'serial':
+            for code in inputs:
+                parser.parse(code)
+        elif mode == 'naive':
+            pool = multiprocessing.Pool(workers)
+            list(pool.imap(naive_parse, inputs))
+            pool.terminate()
+        else:
+            list(parser.parse_many(inputs, workers=workers, mode=mode))
+        elapsed = time.time() - start
+        print('{0:>12} {1:>12} {2:>12.3f} {3:>12.3f}'.format(mode, workers, elapsed, total / elapsed / 1024 ** 2))
+
+
+def scaling(args):
+    parser = Parser(Program, entry='statement_list', engine=args.engine, tree=args.tree)
+    print('{0:>12} {1:>12} {2:>12}'.format('bytes', 'seconds', 'us/byte'))
+    for size in SIZES:
+        size = parse_size(size)
+        if size > parse_size(args.max_size):
+            break
+        code = generate_program(size)
+        elapsed = time_parse(parser, code)
+        print('{0:>12} {1:>12.3f} {2:>12.3f}'.format(len(code), elapsed, elapsed * 1e6 / len(code)))
+
+
+def generate_rules(count):
+    """
+    Generates a grammar of count rules and count operator rules using every construct of the grammar
+    DSL, each rule referring to rules further on so that the whole grammar is connected.
+    """
+    rules = []
+    for idx in range(count):
+        rules.append("# rule {0}\nrule{0} = 'kw{0}' ?rule{1} *(('+' | '-' | 'it\\'s') sum{2}) {{1}} | ?!='x' "
+                     "/[a-z]+\\/{0}/ | +(ident '=' ?=-) !<rule{0}> | - $$ [skip];\n"
+                     "sum{0} = rule{0} [left '+' '-', right '^'];".format(idx, (idx * 7 + 1) % count, (idx + 3) % count))
+    rules.append("ident = /[a-z]+/;")
+    return '\n'.join(rules)
+
+
+def grammar(args):
+    print('{0:>8} {1:>12} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}'.format(
+        'rules', 'bytes', 'scan s', 'parse s', 'table s', 'guards s', 'us/rule'))
+    # compiling a grammar runs with the collector off throughout, the scan included
+    gc.disable()
+    count = 10
+    while count <= args.rules:
+        code = generate_rules(count)
+        # the first run of a large grammar also pays for the memory it is the first to use
+        scan_time = best_time(lambda: Lexer(code).tokenise(), min_runs=3)
+        parse_time = best_time(lambda: GrammarParser(code).parse(), min_runs=3)
+        rules = GrammarParser(code).parse()
+        table_time = best_time(rules.table, min_runs=3)
+        table = rules.table()
+        guards_time = best_time(lambda: guards(table), min_runs=3)
+        print('{0:>8} {1:>12} {2:>10.4f} {3:>10.4f} {4:>10.4f} {5:>10.4f} {6:>10.2f}'.format(
+            count, len(code), scan_time, parse_time, table_time, guards_time,
+            (parse_time + table_time + guards_time) * 1e6 / count))
+        count *= 10
+
+
+def best_time(func, min_time=0.2, max_runs=100, min_runs=1):
+    """Returns the fastest of as many runs of func as fit in min_time, at least min_runs"""
+    best = None
+    total = 0.0
+    for run in range(max_runs):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        if total >= min_time and run + 1 >= min_runs:
+            break
+    return best
+
+
+def peak_memory():
+    """Peak resident set size of the process so far in KB"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on OS X, KB elsewhere
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def run_case(case):
+    """Runs one suite case, (grammar, engine, size), returning its result dict"""
+    name, engine, size = case
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    action, entry, generate, evaluate = GRAMMARS[name]
+    code = generate(parse_size(size))
+    start = time.time()
+    parser = Parser(action, entry=entry, engine=engine)
+    compile_time = time.time() - start
+    # the peak of parsing once, before timing repeats them
+    before = peak_memory()
+    tree = parser.parse(code)
+    if not tree:
+        raise RuntimeError('{0} benchmark input failed to parse'.format(name))
+    peak = peak_memory() - before
+    parse_time = best_time(lambda: time_parse(parser, code))
+    eval_time = best_time(lambda: evaluate(tree))
+    megabytes = len(code) / 1024.0 ** 2
+    return {
+        'grammar': name,
+        'engine': engine,
+        'size': size,
+        'bytes': len(code),
+        'compile_s': round(compile_time, 6),
+        'parse_s': round(parse_time, 6),
+        'parse_mbps': round(megabytes / parse_time, 4),
+        'eval_s': round(eval_time, 6),
+        'eval_mbps': round(megabytes / eval_time, 4),
+        'peak_kb': peak,
+    }
+
+
+def suite(args):
+    grammars = args.grammars.split(',') if args.grammars else sorted(GRAMMARS)
+    sizes = [size for size in SIZES if parse_size(size) <= parse_size(args.max_size)]
+    results = {}
+    print('{0:<12} {1:<12} {2:>6} {3:>10} {4:>10} {5:>10} {6:>10}'.format(
+        'grammar', 'engine', 'size', 'compile s', 'parse MB/s', 'eval MB/s', 'peak KB'))
+    for name in grammars:
+        for engine in args.engines.split(','):
+            for size in sizes:
+                # a fresh process per case keeps peak memory and caches its own
+                pool = multiprocessing.Pool(1)
+                try:
+                    result = pool.apply(run_case, ((name, engine, size),))
+                finally:
+                    pool.terminate()
+                results['{0} {1} {2}'.format(name, engine, size)] = result
+                print('{grammar:<12} {engine:<12} {size:>6} {compile_s:>10.4f} {parse_mbps:>10.3f} '
+                      '{eval_mbps:>10.3f} {peak_kb:>10}'.format(**result))
+    document = {'format': FORMAT, 'python': platform.python_version(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+    if baseline.get('format') != FORMAT or results.get('format') != FORMAT:
+        raise ValueError('result files must both be format {0}'.format(FORMAT))
+    regressions = 0
+    print('{0:<32} {1:<12} {2:>12} {3:>12} {4:>8}'.format('case', 'field', 'baseline', 'result', 'change'))
+    for key in sorted(set(baseline['results']) & set(results['results'])):
+        for field, higher in CHECKED:
+            old, new = baseline['results'][key][field], results['results'][key][field]
+            if not old:
+                continue
+            change = float(new - old) / old
+            worse = -change if higher else change
+            flag = ''
+            if worse > args.threshold:
+                flag = 'REGRESSION'
+                regressions += 1
+            elif -worse > args.threshold:
+                flag = 'improved'
+            print('{0:<32} {1:<12} {2:>12} {3:>12} {4:>+7.1%} {5}'.format(key, field, old, new, change, flag))
+    for key in sorted(set(baseline['results']) ^ set(results['results'])):
+        print('{0:<32} only in {1}'.format(key, args.baseline if key in baseline['results'] else args.results))
+    print('{0} regressions'.format(regressions))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='table parser benchmarks')
+    commands = arg_parser.add_subparsers()
+
+    command = commands.add_parser('scaling', help='parse time per byte as the input grows')
+    command.add_argument('--max-size', default=SIZES[-1], help='largest input to generate, e.g. 10M')
+    command.add_argument('--engine', default='interpreter', help='parser engine, interpreter, closure or vm')
+    command.add_argument('--tree', default='objects', help='CST representation, objects or arena')
+    command.set_defaults(func=scaling)
+
+    command = commands.add_parser('memory', help='bytes held per CST node')
+    command.add_argument('--size', default='1M', help='input size, e.g. 10M')
+    command.add_argument('--engine', default='interpreter', help='parser engine, interpreter, closure or vm')
+    command.add_argument('--tree', default='objects', help='CST representation, objects or arena')
+    command.set_defaults(func=memory)
+
+    command = commands.add_parser('stream', help='peak memory of iterparse over a generated input')
+    command.add_argument('--size', default='10M', help='input size, e.g. 100M')
+    command.add_argument('--engine', default='interpreter', help='parser engine, interpreter, closure or vm')
+    command.set_defaults(func=stream)
+
+    command = commands.add_parser('incremental', help='reparse time after small edits')
+    command.add_argument('--size', default='1M', help='document size, e.g. 10M')
+    command.add_argument('--edits', default=100, type=int, help='number of edits')
+    command.add_argument('--engine', default='interpreter', help='parser engine, interpreter, closure or vm')
+    command.set_defaults(func=incremental)
+
+    command = commands.add_parser('many', help='parse_many throughput by worker count')
+    command.add_argument('--count', default=64, type=int, help='number of inputs')
+    command.add_argument('--size', default='16K', help='size of each input')
+    command.add_argument('--workers', default='1,2,4', help='comma separated worker counts')
+    command.add_argument('--mode', default='process,thread,naive',
+                         help='comma separated pool modes, naive is a hand rolled process pool')
+    command.add_argument('--engine', default='interpreter', help='parser engine, interpreter, closure or vm')
+    command.set_defaults(func=many)
+
+    command = commands.add_parser('suite', help='reference grammars over growing inputs')
+    command.add_argument('--max-size', default='1M', help='largest input to generate, e.g. 100M')
+    command.add_argument('--grammars', default=None,
+                         help='comma separated grammars, all of {0} by default'.format(', '.join(sorted(GRAMMARS))))
+    command.add_argument('--engines', default='interpreter,closure,vm', help='comma separated engines')
+    command.add_argument('--output', default=None, help='file to write the results to as JSON')
+    command.set_defaults(func=suite)
+
+    command = commands.add_parser('compare', help='flag regressions between two suite result files')
+    command.add_argument('baseline', help='results of the earlier run')
+    command.add_argument('results', help='results of the later run')
+    command.add_argument('--threshold', default=0.1, type=float, help='relative change flagged, 0.1 is 10%%')
+    command.set_defaults(func=compare)
+
+    command = commands.add_parser('grammar', help='grammar DSL parse time as the grammar grows')
+    command.add_argument('--rules', default=10000, type=int, help='rules in the largest grammar')
+    command.set_defaults(func=grammar)
+
+    args = arg_parser.parse_args(argv)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+Reference grammars for the benchmark suite, each with a generator for inputs of any size.
+
+    interpreter     the README Interpreter - statements, loops and conditions over expressions
+    json            JSON documents, evaluated to Python values
+    arithmetic      expression lines built with action_helper.operator, evaluated to numbers
+    config          a keyword heavy configuration language of sections and settings
+
+Generated inputs repeat a fixed unit, so any two runs of the same size parse the same text.  Where a
+grammar can nest, units are nested in blocks so that no repetition grows past FANOUT items - large
+inputs test the parser's scaling rather than one enormous list.
+"""
+
+from action import ActionBase
+from action_helper import leaf, operator
+
+
+FANOUT = 40
+
+
+class Interpreter(ActionBase):
+    symbols = {}
+
+    def _program(program):
+        """statement_list $$ """
+        program.statement_list()
+
+    def _statement_list(statement_list):
+        """*statement"""
+        for statement in statement_list.statement_set_1:
+            statement()
+
+    _statement = " (show | assign | loop | condition) ';' "
+
+    def _loop(loop):
+        """'for' ident '=' expr 'to' expr '{' statement_list '}' """
+        loopid = loop.ident.regex.value
+        start = loop.expr_1()
+        end = loop.expr_2()
+        step = 1 + (end < start * -2)
+        for idx in range(start, end, step):
+            Interpreter.symbols[loopid] = idx
+            loop.statement_list()
+
+    def _condition(condition):
+        """'if' expr 'then' '{' statement_list '}'"""
+        if condition.expr():
+            condition.statement_list()
+
+    def _show(show):
+        """'show' expr"""
+        print(show.expr())
+
+    def _assign(assign):
+        '''ident '=' expr'''
+        Interpreter.symbols[assign.ident.regex.value] = assign.expr()
+
+    def _expr(expr):
+        """cmp *(('<'|'>'|'=='|'!=') cmp)"""
+        value = expr.cmp()
+        ops = expr.concat_set_1[::2]
+        cmps = expr.concat_set_1[1::2]
+        for op, cmp in zip(ops, cmps):
+            if op.value == '<':
+                value = value < cmp()
+            elif op.value == '>':
+                value = value > cmp()
+            elif op.value == '==':
+                value = value == cmp()
+            elif op.value == '!=':
+                value = value != cmp()
+        return value
+
+    def _cmp(cmp):
+        '''term *(('+'|'-') term)'''
+        value = cmp.term()
+        ops = cmp.concat_set_1[::2]
+        terms = cmp.concat_set_1[1::2]
+        for op, term in zip(ops, terms):
+            if op.value == '+':
+                value += term()
+            else:
+                value -= term()
+        return value
+
+    def _term(term):
+        '''factor *(('*'|'/') factor)'''
+        value = term.factor()
+        ops = term.concat_set_1[::2]
+        factors = term.concat_set_1[1::2]
+        for op, factor in zip(ops, factors):
+            if op.value == '*':
+                value *= factor()
+            else:
+                value /= factor()
+        return value
+
+    _factor = '''number | ident | subexpr'''
+
+    def _number(number):
+        '''/[0-9]+/'''
+        return int(number.regex.value)
+
+    def _ident(ident):
+        '''/[a-z][a-z0-9]*/'''
+        if ident.regex.value in Interpreter.symbols:
+            return Interpreter.symbols[ident.regex.value]
+        raise ValueError('Variable read before write [{0}]'.format(ident.regex.value))
+
+    def _subexpr(subexpr):
+        """'(' expr ')'"""
+        return subexpr.expr()
+
+
+class Json(ActionBase):
+    def _document(document):
+        """value $$"""
+        return document.value()
+
+    def _value(value):
+        """object | array | string | number | 'true' | 'false' | 'null'"""
+        if value.alt == 4:
+            return True
+        elif value.alt == 5:
+            return False
+        elif value.alt == 6:
+            return None
+        return value.children[0]()
+
+    def _object(object):
+        """'{' members '}' | '{' '}'"""
+        if object.alt == 1:
+            return {}
+        return object.members()
+
+    def _members(members):
+        """member *(',' member)"""
+        return dict([members.member()] + [member() for member in members.concat_set_1[1::2]])
+
+    def _member(member):
+        """string ':' value"""
+        return member.string(), member.value()
+
+    def _array(array):
+        """'[' elements ']' | '[' ']'"""
+        if array.alt == 1:
+            return []
+        return array.elements()
+
+    def _elements(elements):
+        """value *(',' value)"""
+        return [elements.value()] + [value() for value in elements.concat_set_1[1::2]]
+
+    def _string(string):
+        r'''/"(?:[^"\\]|\\.)*"/'''
+        return string.regex.value[1:-1]
+
+    def _number(number):
+        """/-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?/"""
+        value = number.regex.value
+        if '.' in value or 'e' in value or 'E' in value:
+            return float(value)
+        return int(value)
+
+
+class Arithmetic(ActionBase):
+    def _lines(lines):
+        """*line $$"""
+        return [line() for line in lines.line_set_1]
+
+    def _line(line):
+        """expr ';'"""
+        return evaluate(line.expr())
+
+    @operator('left')
+    def _expr(expr, ast):
+        """term expr_tail"""
+
+    _expr_tail = "add_op term expr_tail | -"
+
+    @operator('left')
+    def _term(term, ast):
+        """power term_tail"""
+
+    _term_tail = "mul_op power term_tail | -"
+
+    @operator('right')
+    def _power(power, ast):
+        """factor power_tail"""
+
+    _power_tail = "pow_op factor power_tail | -"
+
+    _add_op = "'+' | '-'"
+    _mul_op = "'*' | '/'"
+    _pow_op = "'^'"
+
+    def _factor(factor):
+        """number | '(' expr ')'"""
+        if factor.alt == 0:
+            return factor.number()
+        return factor.expr()
+
+    @leaf
+    def _number(number, ast):
+        """/[0-9]+/"""
+
+
+def evaluate(node):
+    """Evaluates an Arithmetic AST"""
+    if node.type == 'number':
+        return int(node.value)
+    left, right = evaluate(node.left), evaluate(node.right)
+    if node.type == '+':
+        return left + right
+    elif node.type == '-':
+        return left - right
+    elif node.type == '*':
+        return left * right
+    elif node.type == '/':
+        return left / right
+    return left ** right
+
+
+class Config(ActionBase):
+    def _config(config):
+        """*entry $$"""
+        return [entry() for entry in config.entry_set_1]
+
+    _entry = "section | setting"
+
+    def _section(section):
+        """'section' name '{' *setting '}'"""
+        return section.name(), dict(setting() for setting in section.setting_set_1)
+
+    def _setting(setting):
+        """key value ';'"""
+        return setting.key(), setting.value()
+
+    _key = ("'listen' | 'host' | 'port' | 'timeout' | 'workers' | 'user' | 'group' | 'log_level' | 'log_file' | "
+            "'max_connections' | 'keepalive' | 'compress' | 'ssl' | 'cert' | 'key' | 'root' | 'index' | 'proxy' | "
+            "'cache' | 'include' | 'allow' | 'deny' | 'retries' | 'backlog'")
+
+    def _value(value):
+        """string | duration | number | boolean | name"""
+        return value.children[0]()
+
+    def _string(string):
+        """/"[^"]*"/"""
+        return string.regex.value[1:-1]
+
+    def _duration(duration):
+        """/[0-9]+(?:ms|s|m|h)/"""
+        return duration.regex.value
+
+    def _number(number):
+        """/[0-9]+/"""
+        return int(number.regex.value)
+
+    def _boolean(boolean):
+        """'on' | 'off'"""
+        return boolean.alt == 0
+
+    def _name(name):
+        """/[a-z_][a-z0-9_.]*/"""
+        return name.regex.value
+
+
+def nest(items, block, size, separator=' '):
+    """
+    Returns roughly size bytes made of items, joined by separator and wrapped by block, which takes
+    the text of a block's contents.  Blocks are nested FANOUT to a level until one level is large
+    enough, then repeated at the top.
+    """
+    units = [block(separator.join(items))]
+    while len(units[-1]) * FANOUT < size:
+        units.append(block(separator.join([units[-1]] * FANOUT)))
+    count = max(1, int(round(float(size) / len(units[-1]))))
+    return separator.join([units[-1]] * count)
+
+
+def generate_interpreter(size):
+    statements = ['v{0} = {0} * (w + {1}) - x / 3;'.format(idx, idx % 7) for idx in range(FANOUT - 4)]
+    statements += ['for i = 0 to 3 { w = w + i; };', 'if w > 10 then { w = 1; };',
+                   'x = (x + w) * 2 - x;', 'if x == 3 then { x = 2; };']
+    return 'w = 1; x = 3; ' + nest(statements, lambda body: 'if 1 then { ' + body + ' };', size)
+
+
+def generate_json(size):
+    records = ['{{"id": {0}, "name": "item {0}", "price": {1}.25, "tags": ["a", "b\\"c"], "active": true, '
+               '"meta": {{"owner": null, "ratio": -1.5e3, "points": [1, 2, 3], "empty": {{}}}}}}'.format(idx, idx % 9)
+               for idx in range(8)]
+    return '[' + nest(records, lambda body: '[' + body + ']', size, ', ') + ']'
+
+
+def generate_arithmetic(size):
+    lines = ['(1 + {0}) * 3 - 4 / 2 + 2 ^ 3 ^ 1 - (5 * ({0} - 7));'.format(idx % 9 + 1) for idx in range(FANOUT)]
+    lines.append('1 + 2 + 3 + 4 + 5 + 6 + 7 + 8 + 9;')
+    line = ' '.join(lines)
+    return ' '.join([line] * max(1, int(round(float(size) / (len(line) + 1)))))
+
+
+def generate_config(size):
+    settings = ['listen {0};'.format(8000 + idx) for idx in range(2)] + [
+        'host "www{0}.example.com";', 'timeout 30s;', 'keepalive on;', 'compress off;', 'workers 4;',
+        'log_level info;', 'log_file "/var/log/site.log";', 'max_connections 1024;', 'root "/srv/www";',
+        'proxy backend.internal;', 'cache 5m;', 'allow all;', 'deny none;', 'retries 3;', 'backlog 128;']
+    section = 'section site{0} {{ ' + ' '.join(settings) + ' }}'
+    sections = ' '.join([section.format(idx) for idx in range(8)] + ['include "extra.conf";', 'user www;'])
+    return ' '.join([sections] * max(1, int(round(float(size) / (len(sections) + 1)))))
+
+
+def evaluate_interpreter(tree):
+    Interpreter.symbols.clear()
+    return tree()
+
+
+# name: (action class, entry rule, input generator, evaluation of a parsed tree)
+GRAMMARS = {
+    'interpreter': (Interpreter, 'program', generate_interpreter, evaluate_interpreter),
+    'json': (Json, 'document', generate_json, lambda tree: tree()),
+    'arithmetic': (Arithmetic, 'lines', generate_arithmetic, lambda tree: tree()),
+    'config': (Config, 'config', generate_config, lambda tree: tree()),
+}
@@ -6,4 +6,37 @@ class GrammarError(Exception):
     """
     Thrown by grammar parse when there is an error in the rules
     """
-    pass
\ No newline at end of file
+    pass
+
+class ParseError(SyntaxError):
+    """
+    Returned by table_parser.Parser.parse when the input does not match, and raised where a parse
+    cannot return it.  It is false, so `if not tree` tells a failed parse as it did when parse
+    returned False.  offset, line and pos locate the farthest point the parse got to before failing,
+    expected lists the terminals that could have matched there and text is the line of the input.
+    """
+
+    def __init__(self, offset, line, pos, expected, text):
+        SyntaxError.__init__(self, 'Expected {0}'.format(describe(expected)) if expected else 'Unexpected input')
+        self.offset = offset
+        self.line = line
+        self.pos = pos
+        self.expected = expected
+        self.text = text
+
+    def __nonzero__(self):
+        return False
+
+    __bool__ = __nonzero__
+
+    def __reduce__(self):
+        return self.__class__, (self.offset, self.line, self.pos, self.expected, self.text)
+
+    def __str__(self):
+        return '{0}\nLine: {1}, Pos: {2}\n{3}\n{4}'.format(self.msg, self.line, self.pos, self.text, ' ' * self.pos + '^')
+
+
+def describe(expected):
+    if len(expected) == 1:
+        return expected[0]
+    return '{0} or {1}'.format(', '.join(expected[:-1]), expected[-1])
@@ -0,0 +1,491 @@
+"""
+FIRST set analysis of grammar descriptor tables.
+
+For every lexeme the analysis works out the characters a match can start with and whether it can
+match without consuming anything.  Sets are exact over ASCII; characters outside ASCII are only
+tracked as a flag saying whether a match may start with one.  Each first set is a tuple
+(chars, other, nullable) -
+
+    chars       frozenset of the ASCII characters a match can start with
+    other       whether a match can start with a character outside ASCII
+    nullable    whether the lexeme can match without consuming input, or do anything else before it
+                looks at the input - aborts, undefined rules and lexemes too involved to analyse are
+                taken to be nullable so they are never skipped
+
+Terminals match at the cursor and skipped text is consumed after each terminal, so the next input
+character is exactly what the next terminal sees.  The engines use guards(table) to skip options
+and end repetitions whose first set rules out the next character without descending into them.
+
+last_set(lexeme, table) works out the same tuple for the characters a match can end with, which
+push parsers use to tell input that may end an item.  regex_reach(pattern) works out how far past its
+match a regular expression may have looked.
+"""
+
+import gc
+import sre_constants
+import sre_parse
+
+from table_descriptor import *
+
+
+ASCII = frozenset(chr(code) for code in range(128))
+DIGITS = frozenset('0123456789')
+SPACES = frozenset(' \t\n\r\f\v')
+WORD = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
+# the first set of a lexeme that matches nothing, and of one that can do anything
+NOTHING = (frozenset(), False, False)
+UNKNOWN = (ASCII, True, True)
+
+# regular expression items that match a single character
+SINGLE = (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN)
+
+CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: DIGITS,
+    sre_constants.CATEGORY_NOT_DIGIT: ASCII - DIGITS,
+    sre_constants.CATEGORY_SPACE: SPACES,
+    sre_constants.CATEGORY_NOT_SPACE: ASCII - SPACES,
+    sre_constants.CATEGORY_WORD: WORD,
+    sre_constants.CATEGORY_NOT_WORD: ASCII - WORD,
+}
+
+
+def guards(table):
+    """
+    Returns a dict of id(lexeme) to the frozenset of characters the next input character must be in
+    for lexeme to match, for every lexeme in table that can be skipped by looking at it.  Lexemes that
+    are nullable or can start with a character outside ASCII are left out.
+    """
+    # the sets hold no reference cycles, collections triggered while those of a large grammar are
+    # allocated would only walk every set still alive again and again
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        firsts = first_sets(table)
+        return dict((key, chars) for key, (chars, other, nullable) in firsts.iteritems()
+                    if not other and not nullable)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def first_sets(table):
+    """Returns a dict of id(lexeme) to the first set of lexeme for every lexeme in table"""
+    # rules can be recursive, so grow their first sets until none of them changes
+    rules = dict((name, NOTHING) for name in table)
+    regexes = {}
+    while True:
+        firsts = {}
+        changed = False
+        for name, rule in table.items():
+            first = _lexeme_first(rule, rules, regexes, firsts)
+            if first != rules[name]:
+                rules[name] = first
+                changed = True
+        if not changed:
+            return firsts
+
+
+def last_set(lexeme, table):
+    """
+    Returns the last set of lexeme, a tuple like a first set of the characters a match can end with.
+    A rule needed while its own set is being worked out, as in right recursion, is taken to end with
+    anything.
+    """
+    return _lexeme_first(lexeme, _LastSets(table), {}, {}, True)
+
+
+class _LastSets(object):
+    """The last sets of the rules of table, worked out as they are asked for"""
+
+    def __init__(self, table):
+        self.table = table
+        self.sets = {}
+        self.regexes = {}
+
+    def get(self, name, default):
+        if name not in self.sets:
+            if name not in self.table:
+                return default
+            self.sets[name] = UNKNOWN
+            self.sets[name] = _lexeme_first(self.table[name], self, self.regexes, {}, True)
+        return self.sets[name]
+
+
+def _lexeme_first(lexeme, rules, regexes, firsts, last=False):
+    """
+    Returns the first set of lexeme, or its last set when last is True, taking the sets of rules from
+    rules and recording the set of every lexeme in firsts by id
+    """
+    def first(lexeme):
+        if isinstance(lexeme, (Empty, EOF, Cut)):
+            result = (frozenset(), False, True)
+        elif isinstance(lexeme, Literal):
+            char = lexeme.value[-1:] if last else lexeme.value[:1]
+            if not char:
+                result = (frozenset(), False, True)
+            elif char in ASCII:
+                result = (frozenset(char), False, False)
+            else:
+                result = (frozenset(), True, False)
+        elif isinstance(lexeme, Regex):
+            if lexeme.value not in regexes:
+                regexes[lexeme.value] = regex_first(lexeme.value, last)
+            result = regexes[lexeme.value]
+        elif isinstance(lexeme, Ident):
+            result = rules.get(lexeme.value, UNKNOWN)
+        elif isinstance(lexeme, Precedence):
+            first(lexeme.value)
+            result = rules.get(lexeme.value.value, UNKNOWN)
+        elif isinstance(lexeme, (Option, LiteralOption)):
+            result = union([first(option) for option in lexeme.value])
+        elif isinstance(lexeme, Concat):
+            result = sequence([first(child) for child in (reversed(lexeme.value) if last else lexeme.value)])
+        elif isinstance(lexeme, (Optional, OptionalRepeat, PositiveLookahead, NegativeLookahead)):
+            # zero width lookaheads still run their body, which may abort
+            chars, other, nullable = first(lexeme.value)
+            result = (chars, other, True)
+        elif isinstance(lexeme, (Repeat, Rule)):
+            result = first(lexeme.value)
+        else:
+            # aborts, back references and anything else run before they look at the input
+            result = UNKNOWN
+        firsts[id(lexeme)] = result
+        return result
+
+    return first(lexeme)
+
+
+def first_terminals(lexeme, table):
+    """
+    Returns the terminals - literals, regular expressions and end of input lexemes - a match of lexeme
+    can start with, in grammar order.  Describes what a parse expected where lexeme failed or was
+    skipped by its guard.
+    """
+    terminals = []
+    # whether each rule reached can match nothing, False while it is being worked out
+    rules = {}
+
+    def first(lexeme):
+        """Adds the terminals lexeme can start with, returns whether it can match nothing"""
+        if isinstance(lexeme, (Literal, Regex, EOF)):
+            if lexeme not in terminals:
+                terminals.append(lexeme)
+            if isinstance(lexeme, Regex):
+                return regex_first(lexeme.value)[2]
+            return isinstance(lexeme, Literal) and not lexeme.value
+        elif isinstance(lexeme, Ident):
+            if lexeme.value not in rules and lexeme.value in table:
+                rules[lexeme.value] = False
+                rules[lexeme.value] = first(table[lexeme.value])
+            return rules.get(lexeme.value, False)
+        elif isinstance(lexeme, (Option, LiteralOption)):
+            return any([first(option) for option in lexeme.value])
+        elif isinstance(lexeme, Concat):
+            for child in lexeme.value:
+                if not first(child):
+                    return False
+            return True
+        elif isinstance(lexeme, (Optional, OptionalRepeat)):
+            first(lexeme.value)
+            return True
+        elif isinstance(lexeme, (Repeat, Rule, Precedence)):
+            return first(lexeme.value)
+        # lookaheads, empty lexemes and cuts match nothing, aborts never match
+        return not isinstance(lexeme, Abort)
+
+    first(lexeme)
+    return terminals
+
+
+def union(firsts):
+    chars, other, nullable = frozenset(), False, False
+    for chars_, other_, nullable_ in firsts:
+        chars |= chars_
+        other = other or other_
+        nullable = nullable or nullable_
+    return chars, other, nullable
+
+
+def sequence(firsts):
+    """The first set of firsts matched one after the other"""
+    chars, other = frozenset(), False
+    for chars_, other_, nullable_ in firsts:
+        chars |= chars_
+        other = other or other_
+        if not nullable_:
+            return chars, other, False
+    return chars, other, True
+
+
+def regex_first(pattern, last=False):
+    """
+    Returns the first set of regular expression pattern, or its last set when last is True, UNKNOWN
+    when it is too involved to tell
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, TypeError):
+        return UNKNOWN
+    flags = parsed.pattern.flags
+    if flags & sre_constants.SRE_FLAG_LOCALE:
+        return UNKNOWN
+    first = _pattern_first(parsed, flags, last)
+    if first is None:
+        return UNKNOWN
+    chars, other, nullable = first
+    if flags & sre_constants.SRE_FLAG_IGNORECASE:
+        chars = chars | frozenset(char.swapcase() for char in chars)
+        other = other or bool(flags & sre_constants.SRE_FLAG_UNICODE)
+    return chars, other, nullable
+
+
+def _pattern_first(subpattern, flags, last=False):
+    firsts = []
+    for op, av in (reversed(subpattern) if last else subpattern):
+        if op in SINGLE:
+            first = _char_first(op, av, flags)
+        elif op == sre_constants.SUBPATTERN:
+            first = _pattern_first(av[-1], flags, last)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            first = _pattern_first(av[2], flags, last)
+            if first is not None and av[0] == 0:
+                first = first[:2] + (True,)
+        elif op == sre_constants.BRANCH:
+            branches = [_pattern_first(branch, flags, last) for branch in av[1]]
+            first = None if None in branches else union(branches)
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            # zero width, the character after it starts the match
+            first = (frozenset(), False, True)
+        else:
+            first = None
+        if first is None:
+            return None
+        firsts.append(first)
+        if not first[2]:
+            break
+    return sequence(firsts)
+
+
+def _char_first(op, av, flags):
+    if op == sre_constants.LITERAL:
+        return (frozenset(chr(av)), False, False) if av < 128 else (frozenset(), True, False)
+    elif op == sre_constants.NOT_LITERAL:
+        return (ASCII - frozenset(chr(av)) if av < 128 else ASCII), True, False
+    elif op == sre_constants.ANY:
+        return ASCII, True, False
+    members = set()
+    other = negate = False
+    for item, value in av:
+        if item == sre_constants.NEGATE:
+            negate = True
+        elif item == sre_constants.LITERAL:
+            if value < 128:
+                members.add(chr(value))
+            else:
+                other = True
+        elif item == sre_constants.RANGE:
+            members.update(chr(code) for code in range(value[0], min(value[1], 127) + 1))
+            other = other or value[1] >= 128
+        elif item == sre_constants.CATEGORY and value in CATEGORIES and not flags & sre_constants.SRE_FLAG_UNICODE:
+            members.update(CATEGORIES[value])
+            # the negated categories also match every character outside ASCII
+            other = other or value in (sre_constants.CATEGORY_NOT_DIGIT, sre_constants.CATEGORY_NOT_SPACE,
+                                       sre_constants.CATEGORY_NOT_WORD)
+        else:
+            return None
+    if negate:
+        return ASCII - members, True, False
+    return frozenset(members), other, False
+
+
+def regex_reach(pattern):
+    """
+    Returns how far a match of regular expression pattern may have looked at the input, as a tuple
+    (past start, past end, chars) of the most characters looked at past the start of the match, the
+    most past its end or None when that is unbounded, and the first set of every character the
+    pattern can match.  See regex_looked.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, TypeError):
+        return 0, None, UNKNOWN
+    flags = parsed.pattern.flags
+    chars = _pattern_chars(parsed, flags)
+    if not flags & (sre_constants.SRE_FLAG_LOCALE | sre_constants.SRE_FLAG_IGNORECASE):
+        reach = _reach(parsed.pattern, list(parsed), NOTHING, flags, True)
+        if reach is not None:
+            return 0, reach, chars
+    if _looks_around(parsed):
+        return 0, None, chars
+    width = parsed.getwidth()[1]
+    if width >= sre_constants.MAXREPEAT - 1:
+        return 0, None, chars
+    # the character after the longest match, which $, \b and repetitions look at
+    return width + 1, 0, chars
+
+
+def regex_looked(reach, code, start, end):
+    """
+    Returns the offset in code just past the last character a match from start to end may have
+    looked at, reach being the regex_reach of its pattern, or None when that is unbounded.  A match
+    only looks past a character it matched, so it looked no further than the character after its end
+    when nothing in the pattern matches that character.
+    """
+    past_start, past_end, chars = reach
+    if end < len(code):
+        char = code[end]
+        if char not in chars[0] and not (chars[1] and char not in ASCII):
+            return end + 1
+    if past_end is None:
+        return None
+    return max(start + past_start, end + past_end)
+
+
+def _reach(state, items, follow, flags, anchors):
+    """
+    Returns how many characters past its end a match of the sequence items may have looked, or None
+    when the sequence is not deterministic.  It is when every repetition and alternative is decided by
+    the next character - what each can start with is disjoint from what its alternatives and follow,
+    the first set of what comes after the sequence, can - so a match never gives back what it matched
+    and only looks past its end where a repetition or an alternative failed.  anchors is whether zero
+    width assertions are allowed, which they are until there is a choice to backtrack into.
+    """
+    reach = 0
+    for idx, (op, av) in enumerate(items):
+        rest = _pattern_first(items[idx + 1:], flags)
+        if rest is None:
+            return None
+        after = union([rest, follow]) if rest[2] else rest
+        if op in SINGLE:
+            if _char_first(op, av, flags) is None:
+                return None
+            continue
+        if op == sre_constants.AT:
+            if not anchors:
+                return None
+            # \b and $ look at the character after them
+            reach = max(reach, 1)
+            continue
+        anchors = False
+        if op == sre_constants.SUBPATTERN:
+            item = _reach(state, list(av[-1]), after, flags, False)
+        elif op == sre_constants.MAX_REPEAT:
+            body = list(av[2])
+            first = _pattern_first(body, flags)
+            if first is None or first[2] or not _disjoint(first, after):
+                return None
+            # the repetition stops where its body failed, which looked on from there
+            item = _reach(state, body, union([first, after]), flags, False)
+            failed = _fails(state, body, flags)
+            item = None if item is None or failed is None else max(item, failed)
+        elif op == sre_constants.BRANCH:
+            branches = [list(branch) for branch in av[1]]
+            firsts = [_pattern_first(branch, flags) for branch in branches]
+            if None in firsts or any(first[2] for first in firsts) or not all(
+                    _disjoint(first, other) for idx, first in enumerate(firsts) for other in firsts[idx + 1:]):
+                return None
+            # the alternatives before the one that matched failed, looking on from its start
+            reaches = [_reach(state, branch, after, flags, False) for branch in branches]
+            reaches += [_fails(state, branch, flags) for branch in branches]
+            item = None if None in reaches else max(reaches)
+        else:
+            return None
+        if item is None:
+            return None
+        reach = max(reach, item)
+    return reach
+
+
+def _fails(state, items, flags):
+    """
+    Returns how many characters a failed match of the deterministic sequence items may have looked at
+    from its start, or None when it can fail after matching something of unbounded width
+    """
+    width = over = reach = 0
+    for op, av in items:
+        item = [(op, av)]
+        first = _pattern_first(item, flags)
+        if first is None:
+            return None
+        if not first[2]:
+            # the items before it matched, each may have looked past its end
+            failed = _failed(state, op, av, flags)
+            if width is None or failed is None:
+                return None
+            reach = max(reach, width + max(failed, over))
+        past = _reach(state, item, NOTHING, flags, False)
+        if past is None:
+            return None
+        over = max(over, past)
+        high = sre_parse.SubPattern(state, item).getwidth()[1]
+        width = None if width is None or high >= sre_constants.MAXREPEAT - 1 else width + high
+    return reach
+
+
+def _failed(state, op, av, flags):
+    """Returns how many characters the item op, av may have looked at when it failed"""
+    if op in SINGLE or op == sre_constants.AT:
+        return 1
+    if op == sre_constants.SUBPATTERN:
+        return _fails(state, list(av[-1]), flags)
+    if op == sre_constants.BRANCH:
+        failed = [_fails(state, list(branch), flags) for branch in av[1]]
+        return None if None in failed else max(failed)
+    if op == sre_constants.MAX_REPEAT:
+        # it fails matching fewer than its minimum, failing in the iteration after the ones it matched
+        body = list(av[2])
+        failed = _fails(state, body, flags)
+        high = sre_parse.SubPattern(state, body).getwidth()[1]
+        if failed is None or av[0] > 1 and high >= sre_constants.MAXREPEAT - 1:
+            return None
+        return (av[0] - 1) * high + failed
+    return None
+
+
+def _pattern_chars(subpattern, flags):
+    """Returns the first set of every character subpattern can match, UNKNOWN when it cannot tell"""
+    if flags & sre_constants.SRE_FLAG_LOCALE:
+        return UNKNOWN
+    firsts = []
+    for op, av in subpattern:
+        if op in SINGLE:
+            first = _char_first(op, av, flags)
+        elif op == sre_constants.AT:
+            continue
+        elif op in (sre_constants.SUBPATTERN, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            first = _pattern_chars(av[-1], flags)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            first = _pattern_chars(av[2], flags)
+        elif op == sre_constants.BRANCH:
+            first = union([_pattern_chars(branch, flags) for branch in av[1]])
+        else:
+            # back references match whatever their group did
+            first = None
+        if first is None or first is UNKNOWN:
+            return UNKNOWN
+        firsts.append(first)
+    chars, other, nullable = union(firsts)
+    if flags & sre_constants.SRE_FLAG_IGNORECASE:
+        chars = chars | frozenset(char.swapcase() for char in chars)
+        other = other or bool(flags & sre_constants.SRE_FLAG_UNICODE)
+    return chars, other, False
+
+
+def _disjoint(first, other):
+    return not first[0] & other[0] and not (first[1] and other[1])
+
+
+def _looks_around(subpattern):
+    """Whether subpattern has lookarounds or back references, which look at text outside its width"""
+    for op, av in subpattern:
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT, sre_constants.GROUPREF,
+                  sre_constants.GROUPREF_EXISTS):
+            return True
+        if op == sre_constants.SUBPATTERN and _looks_around(av[-1]):
+            return True
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and _looks_around(av[2]):
+            return True
+        if op == sre_constants.BRANCH and any(_looks_around(branch) for branch in av[1]):
+            return True
+    return False
@@ -1,4 +1,7 @@
+import gc
+
 import table_descriptor as descriptor
+from error import GrammarError
 
 #===============================================================================
 # 
@@ -55,20 +58,45 @@ class Rules(Node):
         return '\n'.join([rule for rule in self.value])
     
     def table(self):
-        table = {}
-        for rule in self.value:
-            table[rule.name] = rule.table()  
-        return table
+        # descriptors hold no reference cycles, collections triggered while those of a large grammar
+        # are allocated would only walk every descriptor still alive again and again
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            table = {}
+            for rule in self.value:
+                table[rule.name] = rule.table()
+            return table
+        finally:
+            if enabled:
+                gc.enable()
 
 
 class Rule(Node):    
     
     def bnf(self):
-        directive = '[{0}]'.format(', '.join(self.directives)) if self.directives != [] else ''
+        directive = '[{0}]'.format(', '.join([d.bnf() for d in self.directives])) if self.directives != [] else ''
         return '{0} = {1} {2};'.format(self.name, self.value.bnf(), directive)
         
     def table(self):
-        return descriptor.Rule(name=self.name, value=self.value.table(), directive=self.directives)
+        levels = [(d.assoc, [literal.value for literal in d.value]) for d in self.directives if isinstance(d, Operators)]
+        directives = [d for d in self.directives if not isinstance(d, Operators)]
+        value = self.value.table()
+        if levels:
+            if not isinstance(self.value, Ident):
+                raise GrammarError('Operator rule {0} must have a single rule as its operand'.format(self.name))
+            for assoc, operators in levels:
+                if assoc not in ('left', 'right'):
+                    raise GrammarError('Operator associativity must be left or right, not {0}'.format(assoc))
+            value = descriptor.Precedence(name=self.name, value=value, levels=levels)
+        return descriptor.Rule(name=self.name, value=value, directive=directives)
+
+
+class Operators(Node):
+    """One precedence level of an operator rule - rule = operand [left '+' '-', right '^'];"""
+
+    def bnf(self):
+        return '{0} {1}'.format(self.assoc, ' '.join([literal.bnf() for literal in self.value]))
 
 
 #===============================================================================
@@ -228,3 +256,13 @@ class EOF(Node):
     
     def table(self):
         return descriptor.EOF()
+
+
+class Cut(Node):
+    leaf = True
+    
+    def bnf(self):
+        return '~'
+    
+    def table(self):
+        return descriptor.Cut()
@@ -0,0 +1,95 @@
+import os
+import zlib
+import errno
+import hashlib
+import tempfile
+import cPickle as pickle
+
+from parser import __version__
+
+
+# version of the compiled tables, raised whenever the same grammar text compiles to a different table
+TABLE_FORMAT = 1
+
+
+class GrammarCache(object):
+    """
+    On-disk cache of compiled grammar descriptor tables, shared by every process pointing at the same
+    directory.  Entries are keyed on a hash of the grammar's rules, the library version and the table
+    format, stored as compressed pickles and written atomically so concurrent writers never leave a
+    partial entry.
+
+        cache = GrammarCache('/var/cache/grammars')
+        p = Parser(Interpreter, cache=cache)
+    """
+
+    suffix = '.grammar'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def key(self, grammar):
+        return hashlib.sha1('{0}\n{1}\n{2}'.format(__version__, TABLE_FORMAT, grammar)).hexdigest()
+
+    def path(self, grammar):
+        return os.path.join(self.directory, self.key(grammar) + self.suffix)
+
+    def get(self, grammar):
+        """
+        Returns the cached table for grammar, or None when there is no usable entry
+        """
+        try:
+            with open(self.path(grammar), 'rb') as f:
+                table = pickle.loads(zlib.decompress(f.read()))
+        except (IOError, OSError):
+            table = None
+        except Exception:
+            # unreadable entry, e.g. written by an incompatible version - drop it and recompile
+            self.remove(self.path(grammar))
+            table = None
+        if table is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return table
+
+    def put(self, grammar, table):
+        data = zlib.compress(pickle.dumps(table, pickle.HIGHEST_PROTOCOL))
+        temp = None
+        try:
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(temp, self.path(grammar))
+        except (IOError, OSError):
+            # the cache is an optimisation, failing to write it is not an error
+            if temp is not None:
+                self.remove(temp)
+
+    def invalidate(self, grammar=None):
+        """
+        Removes the entry for grammar, or every entry when grammar is None.  Use
+        Parser.generate_grammar(action) for the grammar of an action class.
+        """
+        if grammar is not None:
+            self.remove(self.path(grammar))
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                self.remove(os.path.join(self.directory, name))
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
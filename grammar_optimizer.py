@@ -0,0 +1,117 @@
+"""
+Optimizes grammar descriptor tables before they are parsed with.
+
+Grammars written as ActionBase subclasses nest groups freely, and every group becomes a descriptor
+the engines descend into.  optimize rewrites a table into one that parses faster and builds exactly
+the same CST, so action methods see no difference -
+
+    concatenations directly inside a concatenation are flattened into it - they add their nodes to
+    the same parent and restore the same state on failure
+
+    options directly inside an option are flattened into it, each alternative recording the alt of
+    the alternative it came from so parent.alt is unchanged - unless an alternative has a cut, which
+    would stop the outer option's alternatives as well
+
+    options whose alternatives are all literals become a LiteralOption, trying only the literals that
+    start with the next input character
+
+    rules the entry rule cannot reach are removed when an entry is given, the skip rule is kept
+
+Rules are never inlined into the rules using them and adjacent literals never merged - the first
+would remove the rule's node from the CST, the second the leaf of each literal and the text skipped
+between them.  The table passed in is left untouched.
+"""
+
+from table_descriptor import *
+
+
+def optimize(table, entry=None):
+    """
+    Returns an optimized copy of table and a report listing what was rewritten, one line per rewrite.
+    When entry is given only the rules it reaches and the skip rule are kept.
+    """
+    report = []
+    optimized = {}
+    for name in sorted(table):
+        counts = {}
+        optimized[name] = rewrite(table[name], counts)
+        for change in sorted(counts):
+            report.append('{0}: {1} {2}'.format(name, counts[change], change))
+    if entry is not None and entry in optimized:
+        reached = reachable(optimized, [entry, 'skip'])
+        for name in sorted(optimized):
+            if name not in reached:
+                del optimized[name]
+                report.append('{0}: removed, unreachable from {1}'.format(name, entry))
+    return optimized, report
+
+
+def rewrite(lexeme, counts):
+    """Returns lexeme rewritten, counting each rewrite made in counts"""
+    if isinstance(lexeme, Rule):
+        return Rule(name=lexeme.name, value=rewrite(lexeme.value, counts), directive=lexeme.directive)
+    elif isinstance(lexeme, Concat):
+        values = []
+        for child in lexeme.value:
+            child = rewrite(child, counts)
+            if isinstance(child, Concat):
+                values.extend(child.value)
+                count(counts, 'nested concatenations flattened')
+            else:
+                values.append(child)
+        return Concat(value=values)
+    elif isinstance(lexeme, Option):
+        values = []
+        alts = []
+        for idx, child in enumerate(lexeme.value):
+            alt = idx if lexeme.alts is None else lexeme.alts[idx]
+            child = rewrite(child, counts)
+            if isinstance(child, LiteralOption):
+                # merged below along with the option's own literals
+                child = Option(value=child.value)
+            if isinstance(child, Option) and not any(isinstance(value, Concat) and value.cut is not None
+                                                     for value in child.value):
+                # whichever alternative matches, the outer option records its own alt last
+                values.extend(child.value)
+                alts.extend([alt] * len(child.value))
+                count(counts, 'nested options flattened')
+            else:
+                values.append(child)
+                alts.append(alt)
+        if alts == list(range(len(values))):
+            alts = None
+        if all(isinstance(value, Literal) and value.value for value in values):
+            count(counts, 'literal options merged')
+            return LiteralOption(value=values, alts=alts)
+        return Option(value=values, alts=alts)
+    elif isinstance(lexeme, (Optional, Repeat, OptionalRepeat, PositiveLookahead, NegativeLookahead)):
+        # the type of the body names repetition sets and missing optionals, kept by every rewrite
+        return lexeme.__class__(value=rewrite(lexeme.value, counts))
+    return lexeme
+
+
+def count(counts, change):
+    counts[change] = counts.get(change, 0) + 1
+
+
+def reachable(table, roots):
+    """Returns the set of rule names in table reached from the rules roots"""
+    reached = set()
+    stack = [root for root in roots if root in table]
+    while stack:
+        name = stack.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        lexemes = [table[name]]
+        while lexemes:
+            lexeme = lexemes.pop()
+            if isinstance(lexeme, Ident):
+                if lexeme.value in table:
+                    stack.append(lexeme.value)
+            elif isinstance(lexeme, (Precedence, Rule, Optional, Repeat, OptionalRepeat, PositiveLookahead,
+                                     NegativeLookahead)):
+                lexemes.append(lexeme.value)
+            elif isinstance(lexeme, (Option, Concat)):
+                lexemes.extend(lexeme.value)
+    return reached
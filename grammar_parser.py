@@ -1,162 +1,182 @@
-import re
+import gc
+import sre_constants
+import sre_parse
 
 from grammar_ast import *
-
-debug = False
-depth = 0
-
-
-def trace(func):
-    def wrap(*args, **kwargs):
-        global depth
-        print('  ' * depth + '%s entry'.format(func.func_name))
-        depth += 1
-        # print '  ' * depth + str(args[0].token)
-        val = func(*args, **kwargs)
-        # print '  ' * depth + str(args[0].token)
-        depth -= 1
-        print('  ' * depth + '%s exit'.format(func.func_name, val))
-        return val
-
-    return wrap if debug else func
+from grammar_lexer import Lexer, Token, error
+from error import GrammarError
+from profiler import Recorder
+
+# anchors matching only at the start of the input, which terminals are matched at an offset into
+ANCHORS = (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING)
+
+
+def grammar_rule(func):
+    """Marks a GrammarParser method as a grammar rule, recorded when the parser is profiled"""
+    func.grammar_rule = True
+    return func
+
+
+def unanchored(pattern):
+    """
+    Returns regular expression terminal pattern without a leading ^ or \\A, which says no more than
+    that the match starts at the cursor.  An anchor anywhere else could only match at the start of the
+    input and raises GrammarError.  With the MULTILINE flag ^ matches at the start of any line and is
+    left as it is.
+    """
+    stripped = pattern
+    for anchor in ('^', '\\A'):
+        if pattern.startswith(anchor):
+            stripped = pattern[len(anchor):]
+            break
+    parsed = sre_parse.parse(stripped)
+    anchors = ANCHORS[1:] if parsed.pattern.flags & sre_constants.SRE_FLAG_MULTILINE else ANCHORS
+    if _anchors(parsed, anchors):
+        raise GrammarError('Regex /{0}/ can only match at the start of the input, terminals are matched '
+                           'at the cursor'.format(pattern))
+    return stripped
+
+
+def _anchors(subpattern, anchors):
+    for op, av in subpattern:
+        if op == sre_constants.AT and av in anchors:
+            return True
+        if op == sre_constants.SUBPATTERN and _anchors(av[-1], anchors):
+            return True
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and _anchors(av[2], anchors):
+            return True
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT) and _anchors(av[1], anchors):
+            return True
+        if op == sre_constants.BRANCH and any(_anchors(branch, anchors) for branch in av[1]):
+            return True
+        if op == sre_constants.GROUPREF_EXISTS and any(_anchors(branch, anchors) for branch in av[1:] if branch):
+            return True
+    return False
 
 
 class GrammarParser(object):
-    def __init__(self, code):
-        self._seen = []
-        self._state = []
-        self.code = code.strip()
-        self.matched = None
-        self.token = None
-        self.cursor = 0
-        self.state = 0
-        self.line_pos = 1
-        self.line = 1
-        self.lines = code.split('\n')
-        self.end = False
-
-    def advance(self, amount):
-        self.cursor += amount
-        self.line_pos += amount
-        if self.cursor < len(self.code) and self.code[self.cursor] in ' \r\n\t':
-            if self.code[self.cursor] == '\n':
-                self.line += 1
-                self.line_pos = 1
-            self.advance(1)
-        if self.cursor >= len(self.code) - 1:
-            self.end = True
-
-    def push_state(self):
-        self._state.append(self.cursor)
-        return True
-
-    def pop_state(self):
-        self.cursor = self._state.pop()
-        return True
+    """
+    Parser for the grammar DSL.  With a profiler.Profile as profile the rule methods are recorded
+    into it on each parse - GrammarParser(grammar, profile).parse() then profile.report().
+
+    The grammar is scanned into tokens by grammar_lexer.Lexer up front and parsed a token at a time,
+    nothing is ever backtracked.
+    """
+
+    def __init__(self, code, profile=None):
+        self.code = code
+        self.tokens = None
+        self.index = 0
+        self.profile = profile
+        self.recorder = None
+        if profile is not None:
+            self.instrument()
+
+    def instrument(self):
+        recorder = self.recorder = Recorder(self)
+        for name in dir(type(self)):
+            if getattr(getattr(type(self), name), 'grammar_rule', False):
+                setattr(self, name, recorder.method(name, getattr(self, name)))
+
+    @property
+    def cursor(self):
+        """Offset into the grammar of the next token"""
+        return self.tokens[self.index].offset
 
     def error(self, msg):
-        raise SyntaxError(
-            'Expecting {5}, got {0}...\nLine: {1}, Pos: {2}\n{3}\n{4}'.format(self.code[self.cursor:15], self.line,
-                                                                              self.line_pos, self.lines[self.line],
-                                                                              ' ' * self.line_pos + '^', msg))
-
-    def parse_literal(self, match):
-        if self.code[self.cursor:].startswith(match):
-            self.advance(len(match))
-            return match
+        token = self.tokens[self.index]
+        got = 'end of file' if token.type == Token.END else repr(self.code[token.offset:token.offset + 15]) + '...'
+        error(self.code, token.offset, 'Expecting {0}, got {1}'.format(msg, got))
+
+    def accept(self, type):
+        """Returns the next token and moves past it if it is of type, otherwise False"""
+        token = self.tokens[self.index]
+        if token.type == type:
+            self.index += 1
+            return token
         return False
 
-    def parse_regex(self, pattern):
-        matchobj = re.match(pattern, self.code[self.cursor:])
-        if not matchobj:
-            return False
-        match = matchobj.group()
-        # print '###', pattern, match
-        self.advance(len(match))
-        return match
+    def expect(self, type):
+        token = self.accept(type)
+        if token is False:
+            self.error(repr(type) if type not in (Token.IDENT, Token.END) else type)
+        return token
 
     def parse(self):
-        rules = self.rules()
-        return rules
-
-    @trace
+        # tokens and grammar nodes hold no reference cycles, collecting while hundreds of thousands
+        # of them are allocated for a large grammar only slows the parse down
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.tokens = Lexer(self.code).tokenise()
+            self.index = 0
+            return self.rules()
+        finally:
+            if enabled:
+                gc.enable()
+            if self.recorder is not None:
+                self.profile.merge(self.recorder)
+
+    @grammar_rule
     def rules(self):
         rules = []
-        while (1):
-            rule = self.rule()
-            if rule is not False:
-                rules.append(rule)
-                continue
-            comment = self.comment()
-            if comment is False:
-                break
-        if not self.end:
-            self.error('end of file')
+        while self.tokens[self.index].type != Token.END:
+            rules.append(self.rule())
         return Rules(value=rules)
 
-    @trace
-    def comment(self):
-        comment = self.parse_regex('#.*?#')
-        if comment is not False:
-            self.advance(1)
-            return True
-        return False
-
-    @trace
+    @grammar_rule
     def rule(self):
-        self.push_state()
-        ident = self.ident()
-        if not ident:
-            return False
-        if self.parse_literal('=') is False:
-            self.pop_state()
-            return False
+        ident = self.expect(Token.IDENT)
+        self.expect('=')
         rule = self.option()
-        if not rule:
-            self.pop_state()
-            return False
         directives = self.directive()
-        if not self.parse_literal(';'):
-            self.pop_state()
-            return False
-        self._seen.append(ident.value)
+        self.expect(';')
         return Rule(name=ident.value, value=rule, directives=directives)
 
-    @trace
+    @grammar_rule
     def directive(self):
-        self.push_state()
-        if self.parse_literal('[') is False:
+        if self.accept('[') is False:
             return []
         directives = self.directive_list()
-        if self.parse_literal(']') is False:
-            self.pop_state()
-            return []
+        self.expect(']')
         return directives
 
-    @trace
+    @grammar_rule
     def directive_list(self):
+        directives = [self.directive_item()]
+        while self.accept(',') is not False:
+            directives.append(self.directive_item())
+        return directives
+
+    @grammar_rule
+    def directive_item(self):
         directive = self.ident()
         if directive is False:
             self.error('ident (in directive string)')
-        directives = [directive]
-        while (self.parse_literal(',') is not False):
-            directives.append(directive)
-        return directives
-
-    @trace
+        # an associativity followed by operators is a precedence level, left '+' '-'
+        operators = []
+        literal = self.literal()
+        while literal is not False:
+            operators.append(literal)
+            literal = self.literal()
+        if operators:
+            return Operators(assoc=directive.value, value=operators)
+        return directive
+
+    @grammar_rule
     def option(self):
         concat = self.concat()
         options = [concat]
-        while (self.parse_literal('|') is not False):
+        while self.accept('|') is not False:
             options.append(self.concat())
         if len(options) == 1:
             return concat
         return Or(value=options)
 
-    @trace
+    @grammar_rule
     def concat(self):
         lexemes = [self.lexeme()]
-        while (lexemes[-1] is not False):
+        while lexemes[-1] is not False:
             lexemes.append(self.lexeme())
         if len(lexemes) == 1:
             self.error('lexeme')
@@ -165,175 +185,101 @@ class GrammarParser(object):
         else:
             return Concatenate(value=lexemes[:-1])
 
-    @trace
+    @grammar_rule
     def lexeme(self):
-        self.push_state()
+        # the name of the next rule is not a lexeme of this one, a missing ; is reported by rule
+        if self.tokens[self.index].type == Token.IDENT and self.tokens[self.index + 1].type == '=':
+            return False
         prefix = self.prefix()
         atom = self.atom()
-        if not atom:
-            self.pop_state()
+        if atom is False:
+            if prefix is not False:
+                self.error('lexeme after prefix')
             return False
         if prefix is not False:
             prefix.value = atom
             return prefix
         return atom
 
-    @trace
+    @grammar_rule
     def prefix(self):
-        if self.parse_literal('?='):
-            return PositiveLookahead()
-        if self.parse_literal('?!='):
-            return NegativeLookahead()
-        if self.parse_literal('?'):
-            return Optional()
-        if self.parse_literal('*'):
-            return OptionalRepeat()
-        if self.parse_literal('+'):
-            return Repeat()
-        return False
+        prefix = self.prefixes.get(self.tokens[self.index].type)
+        if prefix is None:
+            return False
+        self.index += 1
+        return prefix()
+
+    prefixes = {'?=': PositiveLookahead, '?!=': NegativeLookahead, '?': Optional, '*': OptionalRepeat,
+                '+': Repeat}
 
-    @trace
+    @grammar_rule
     def atom(self):
-        self.push_state()
-        ident = self.ident()
-        if ident is not False:
-            return ident
-        literal = self.literal()
-        if literal is not False:
-            return literal
-        regex = self.regex()
-        if regex is not False:
-            return regex
-        ref = self.ref()
-        if ref is not False:
-            return ref
-        empty = self.empty()
-        if empty is not False:
-            return empty
-        subexpr = self.subexpr()
-        if subexpr is not False:
-            return subexpr
-        eof = self.eof()
-        if eof is not False:
-            return eof
-        abort = self.abort()
-        if abort is not False:
-            return abort
-        self.pop_state()
-        return False
+        atom = self.atoms.get(self.tokens[self.index].type)
+        if atom is None:
+            return False
+        return getattr(self, atom)()
 
-    @trace
+    # the rule method parsing each type of token starting an atom
+    atoms = {Token.IDENT: 'ident', Token.LITERAL: 'literal', Token.REGEX: 'regex', Token.REF: 'ref',
+             '-': 'empty', '(': 'subexpr', '$$': 'eof', Token.ABORT: 'abort', '~': 'cut'}
+
+    @grammar_rule
     def abort(self):
-        re = self.parse_regex('\!\<[^>]*?\>')
-        if re is not False:
-            return Abort(value=re[2:-1])
+        token = self.accept(Token.ABORT)
+        if token is not False:
+            return Abort(value=token.value)
         return False
 
-    @trace
+    @grammar_rule
     def subexpr(self):
-        self.push_state()
-        if self.parse_literal('(') is False:
+        if self.accept('(') is False:
             return False
         subexpr = self.option()
-        if not subexpr:
-            self.pop_state()
-            return False
-        if self.parse_literal(')') is False:
-            self.pop_state()
-            return False
+        self.expect(')')
         return subexpr
 
-    @trace
+    @grammar_rule
     def ref(self):
-        re = self.parse_regex('\{[0-9]+\}')
-        if re is not False:
-            return BackReference(value=re[1:-1])
+        token = self.accept(Token.REF)
+        if token is not False:
+            return BackReference(value=token.value)
         return False
 
-    @trace
+    @grammar_rule
     def empty(self):
-        empty = self.parse_literal('-')
-        if empty:
+        if self.accept('-') is not False:
             return Empty()
         return False
 
-    @trace
+    @grammar_rule
     def regex(self):
-        self.push_state()
-        if self.parse_literal('/') is False:
-            return False
-        pos = self.cursor
-        regex = ''
-        while True:
-            if regex and regex[-1] == '\\' and self.code[pos] == '/':
-                regex = regex[:-1] + '/'
-            elif self.code[pos] == '/':
-                break
-            else:
-                regex += self.code[pos]
-            pos += 1
-        if regex == '':
-            self.pop_state()
-            return False
-        self.advance(pos - self.cursor)
-        if self.parse_literal('/') is False:
-            self.pop_state()
-            return False
-        return Regex(value=regex)
+        token = self.accept(Token.REGEX)
+        if token is not False:
+            return Regex(value=unanchored(token.value))
+        return False
 
-    @trace
+    @grammar_rule
     def literal(self):
-        self.push_state()
-        if self.parse_literal("'") is False:
-            return False
-        pos = self.cursor
-        literal = ''
-        while True:
-            if literal and literal[-1] == '\\' and self.code[pos] == "'":
-                literal = literal[:-1] + "/"
-            elif self.code[pos] == "'":
-                break
-            else:
-                literal += self.code[pos]
-            pos += 1
-        if literal == '':
-            self.pop_state()
-            return False
-        self.advance(pos - self.cursor)
-        if self.parse_literal("'") is False:
-            self.pop_state()
-            return False
-        return Literal(value=literal)
+        token = self.accept(Token.LITERAL)
+        if token is not False:
+            return Literal(value=token.value)
+        return False
 
-    @trace
+    @grammar_rule
     def ident(self):
-        id = self.parse_regex('[a-zA-Z_][a-zA-Z0-9_]*')
-        if id is not False:
-            return Ident(value=id)
+        token = self.accept(Token.IDENT)
+        if token is not False:
+            return Ident(value=token.value)
         return False
 
-    @trace
+    @grammar_rule
     def eof(self):
-        if self.parse_literal('$$'):
+        if self.accept('$$') is not False:
             return EOF(value=None)
         return False
 
-
-# p = GrammarParser()
-# grammar = """
-# statement =  *((show | assign) ';') ;
-# statement_list = *statement;
-# show = 'show' expr;
-# ssign = ident '=' expr;
-# actor = number | ident | subexpr;
-# term = factor *(('*'|'/') factor);
-# expr = term *(('+'|'-') term);
-# ident = /[a-z][a-z0-9]*/;
-# subexpr = '(' expr ')';
-# number = /[0-9]+/;
-# """
-# ast = p.parse(grammar)
-# for key, val in ast.iteritems():#
-# print '[{0} {1}]'.format(key, val.graph())
-
-# print ast
+    @grammar_rule
+    def cut(self):
+        if self.accept('~') is not False:
+            return Cut()
+        return False
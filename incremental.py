@@ -0,0 +1,293 @@
+"""
+Incremental reparsing of edited documents.
+
+A Document keeps the text it was parsed from together with the memo entries of its parses.  After
+an edit only the rules whose results could have changed are parsed again - every other rule
+application is replayed from the memo and its subtree reused, moved to its new line and position.
+
+    document = Document(parser, code, 'statement_list')
+    document.edit(120, 3, 'foo')        # replace the 3 characters at offset 120, returns the new tree
+
+A rule result can be reused when no edit touched the text it examined.  Every rule application
+records how far past its start it looked; text after an edit is unchanged, so results starting there
+are always reusable.  A regular expression terminal that matched looked as far as first_sets.regex_looked
+works out, the character after its match for most, further when an optional tail it gave up on may
+have gone on, and any distance when that is unbounded.  A failed match looked at its first character
+when no match can start with it - when one could, the failure is never reused before the edit.
+
+Reused nodes are shared with the previous tree, so only the latest tree of a document should be
+used.  A node keeps the offset, line and position it was parsed at along with the number of edits
+made by then, and reading its line or position moves them past the edits made since - an edit never
+touches the nodes after it, however many lines it adds or removes.
+"""
+
+import sys
+
+from action import ActionBase
+from first_sets import ASCII, regex_first, regex_looked, regex_reach
+from table_parser import Parser
+
+
+# reach of a failed regular expression that could have matched with more input
+UNBOUNDED = sys.maxsize
+
+
+class Document(object):
+    """
+    Text parsed with parser that can be edited and reparsed incrementally.  parser is only used for
+    its grammar and options, the document parses with its own IncrementalParser.
+    """
+
+    def __init__(self, parser, code, rule=None):
+        if parser.options.get('tree', 'objects') != 'objects':
+            raise ValueError('incremental parsing builds node objects, it is not supported with tree=arena')
+        self.parser = IncrementalParser(parser.table, parser.binding.action, **parser.options)
+        self.rule = rule
+        self.code = code
+        self.tree = self.parser.parse(code, rule)
+
+    def edit(self, offset, deleted, inserted):
+        """
+        Replaces deleted characters at offset with the text inserted and returns the reparsed tree, or
+        the error.ParseError of the reparse when the edited text does not parse - its expected
+        terminals are those of the rules that were reparsed, reused failures are not tried again
+        """
+        if offset < 0 or deleted < 0 or offset + deleted > len(self.code):
+            raise ValueError('edit outside the document')
+        self.parser.add_edit(self.code, offset, deleted, inserted)
+        self.code = self.code[:offset] + inserted + self.code[offset + deleted:]
+        self.tree = self.parser.parse(self.code, self.rule)
+        return self.tree
+
+
+class IncrementalParser(Parser):
+    """
+    Parser memoizing every rule application along with how far into the input it looked.  The memo
+    has a slot for each input position holding a dict of rule name to entry; an edit splices the slots
+    so entries after it move with their text.  Entries are (edits, matched, length, lines, line_pos,
+    reach, node) with positions relative to the start of the rule, where edits is the number of edits
+    made when the entry was last checked.
+
+    An entry before an edit is no longer valid when it looked at text the edit changed.  Entries are
+    checked against the edits made since then when they are next used, as are the positions of nodes
+    when they are next read, see position_class.  Unlike Parser it parses in place, keeping the memo
+    from one parse to the next.
+    """
+
+    def __init__(self, table, node, **options):
+        if options.get('engine') == 'vm':
+            # rule calls inside the vm loop do not go through apply_rule
+            raise ValueError('incremental parsing needs the interpreter or closure engine, not vm')
+        if options.get('profile'):
+            # the memo outlives the parses a profile is recorded for
+            raise ValueError('incremental parsing is not supported with profile')
+        if options.get('tokens'):
+            # edits would leave the tokens of the previous text behind
+            raise ValueError('incremental parsing is not supported with tokens')
+        Parser.__init__(self, table, node, **options)
+        self.columns = None
+        self.edits = []
+        # how each edit moves the text after it, see position_class
+        self.moves = []
+        self.node = position_class(self.node, self)
+        self.reach = 0
+        self.first = {}
+        self.reaches = {}
+
+    def context(self):
+        # the memo outlives each parse, a document is parsed by one thread at a time
+        return self
+
+    def initialise(self, code):
+        Parser.initialise(self, code)
+        self.memo = None
+        self.reach = 0
+        if self.columns is None:
+            self.columns = [None] * (len(self.code) + 1)
+
+    def add_edit(self, code, offset, deleted, inserted):
+        """Records replacing deleted characters of code at offset with the text inserted"""
+        end = offset + deleted
+        newline = inserted.rfind('\n')
+        if newline == -1:
+            column = offset - code.rfind('\n', 0, offset) - 1 + len(inserted)
+        else:
+            column = len(inserted) - newline - 1
+        self.moves.append((end, len(inserted) - deleted, code.rfind('\n', 0, end) + 1,
+                           inserted.count('\n') - code.count('\n', offset, end), column))
+        self.columns[offset:end] = [None] * len(inserted)
+        self.edits.append((offset, deleted, len(inserted)))
+
+    def parse_literal(self, literal, parent):
+        reach = self.cursor + len(literal.value)
+        if reach > self.reach:
+            self.reach = reach
+        if Parser.parse_literal(self, literal, parent):
+            # the skipped text stops at the first character that is not skipped
+            if self.cursor + 1 > self.reach:
+                self.reach = self.cursor + 1
+            return True
+        return False
+
+    def parse_regex(self, regex, parent):
+        start = self.cursor
+        matched = Parser.parse_regex(self, regex, parent)
+        if matched:
+            if regex not in self.reaches:
+                self.reaches[regex] = regex_reach(regex.value)
+            looked = regex_looked(self.reaches[regex], self.code, start, start + len(parent.children[-1].value))
+            # the skipped text after it stops at the first character that is not skipped
+            reach = max(self.cursor + 1, looked) if looked is not None else UNBOUNDED
+        elif start >= len(self.code) or not self.can_start(regex, self.code[start]):
+            reach = start + 1
+        else:
+            reach = UNBOUNDED
+        if reach > self.reach:
+            self.reach = reach
+        return matched
+
+    def can_start(self, regex, char):
+        if regex not in self.first:
+            self.first[regex] = regex_first(regex.value)
+        chars, other, nullable = self.first[regex]
+        return nullable or char in chars or other and char not in ASCII
+
+    def peek(self):
+        # looking at the next character is looking at the text
+        if self.cursor + 1 > self.reach:
+            self.reach = self.cursor + 1
+        return Parser.peek(self)
+
+    def apply_rule(self, name, parse, lexeme, parent):
+        start = self.cursor
+        column = self.columns[start]
+        if column is None:
+            column = self.columns[start] = {}
+        entry = column.get(name)
+        if entry is not None and entry[0] != len(self.edits):
+            entry = self.check(name, start, entry)
+        if entry is None:
+            outer = self.reach
+            # a rule looks at its first character at least, if only to find the end of the input
+            self.reach = start + 1
+            line, line_pos = self.line, self.line_pos
+            node = self.new_node(name)
+            if parse(lexeme, node):
+                end_pos = self.line_pos if self.line != line else self.line_pos - line_pos
+                entry = (len(self.edits), True, self.cursor - start, self.line - line, end_pos, self.reach - start,
+                         node)
+            else:
+                entry = (len(self.edits), False, 0, 0, 0, self.reach - start, None)
+            column[name] = entry
+            if outer > self.reach:
+                self.reach = outer
+        else:
+            if start + entry[5] > self.reach:
+                self.reach = start + entry[5]
+            if not entry[1]:
+                return False
+            self.cursor = start + entry[2]
+            if entry[3]:
+                self.line += entry[3]
+                self.line_pos = entry[4]
+            else:
+                self.line_pos += entry[4]
+            self.end = self.cursor >= len(self.code) - 1
+        if entry[1]:
+            self.attach(parent, entry[6])
+            return True
+        return False
+
+    def new_binary(self, type, left, operator, right):
+        node = Parser.new_binary(self, type, left, operator, right)
+        # made once the right operand is parsed, it starts where the left one does
+        node._start = left._start
+        return node
+
+    def set_matched(self, parent):
+        # reused nodes are shared like memoized ones, only this use of the node is marked
+        self.copy_last(parent)
+        Parser.set_matched(self, parent)
+
+    def check(self, name, start, entry):
+        """Returns entry when none of the edits made since it was checked changed text it looked at"""
+        position = start
+        reach = entry[5]
+        for offset, deleted, inserted in reversed(self.edits[entry[0]:]):
+            # map position back to the text before the edit
+            if position >= offset + inserted:
+                position += deleted - inserted
+            elif position >= offset or position + reach > offset:
+                del self.columns[start][name]
+                return None
+        entry = (len(self.edits),) + entry[1:]
+        self.columns[start][name] = entry
+        return entry
+
+
+def position_class(node, parser):
+    """
+    Returns a subclass of the node class node for the nodes parser builds, keeping the offset each
+    node starts at and how many of parser.moves it has been moved past.  Reading line or linepos
+    first moves the node past the edits made since - text after an edit shifts by the length it
+    changed, lines after it by the newlines it added or removed, and a node on the line the edit
+    ended on starts as far past the end of the inserted text as it did past the deleted text.  Nodes
+    inside an edited span are never reused, so they are never read after it.
+    """
+    moves = parser.moves
+    line_slot = ActionBase.__dict__['line']
+    linepos_slot = ActionBase.__dict__['linepos']
+
+    def move(node):
+        start = node._start
+        line = line_slot.__get__(node)
+        linepos = linepos_slot.__get__(node)
+        for end, shift, line_start, lines, column in moves[node._moved:]:
+            if start >= end:
+                if start - linepos == line_start:
+                    linepos = column + start - end
+                line += lines
+                start += shift
+        node._start = start
+        node._moved = len(moves)
+        line_slot.__set__(node, line)
+        linepos_slot.__set__(node, linepos)
+
+    def get_line(node):
+        if node._moved != len(moves):
+            move(node)
+        return line_slot.__get__(node)
+
+    def get_linepos(node):
+        if node._moved != len(moves):
+            move(node)
+        return linepos_slot.__get__(node)
+
+    def __init__(self, **attrs):
+        self._start = parser.cursor
+        self._moved = len(moves)
+        node.__init__(self, **attrs)
+
+    def __copy__(self):
+        # ActionBase pickles nodes as the plain bound class, copies must keep moving
+        copy = cls.__new__(cls)
+        for name in ActionBase.__slots__ + cls.__slots__:
+            if name in ('__dict__', '__weakref__'):
+                continue
+            slot = ActionBase.__dict__.get(name) or cls.__dict__[name]
+            try:
+                slot.__set__(copy, slot.__get__(self))
+            except AttributeError:
+                pass
+        copy.__dict__.update(self.__dict__)
+        return copy
+
+    cls = type(node.__name__, (node,), {
+        '__slots__': ('_start', '_moved'),
+        '__module__': node.__module__,
+        '__init__': __init__,
+        '__copy__': __copy__,
+        'line': property(get_line, line_slot.__set__),
+        'linepos': property(get_linepos, linepos_slot.__set__),
+    })
+    return cls
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class Memo(object):
+    """
+    Packrat memo table for the table parser.  Entries are keyed on (rule name, cursor) and hold the
+    outcome of parsing that rule at that position so backtracking never parses the same rule at the
+    same place twice.  The table is bounded - once it holds more than size entries the least recently
+    used entry is evicted.  A size of None leaves the table unbounded.
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        # re-insert to mark the entry as most recently used
+        self.entries[key] = entry
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        if self.size is not None and len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def release(self, cursor):
+        """
+        Drops the least recently used entries for positions behind cursor, stopping at the first entry
+        that is not - once the parser can no longer backtrack past cursor those entries can never be hit
+        again, and as entries are mostly used in input order this frees them without looking at the
+        whole table.
+        """
+        entries = self.entries
+        while entries:
+            key = next(iter(entries))
+            if key[1] >= cursor:
+                break
+            del entries[key]
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,165 @@
+import os
+import zlib
+import errno
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from arena import encode, decode
+from parser import Parser, __version__
+
+
+class ParseCache(object):
+    """
+    Cache of parse results, so input that has not changed since it was last parsed is not parsed
+    again.  Entries are keyed on a hash of the grammar, the rule parsed and the input, and hold the
+    tree as an arena packed by arena.encode - a hit unpacks the arrays and returns a view of the root,
+    far less work than parsing.  The size most recently used entries are kept in memory and, given a
+    directory, every entry is also stored there compressed and written atomically like GrammarCache
+    entries, so later processes find it.
+
+        cache = ParseCache('/var/cache/parses')
+        p = Parser(Interpreter, tree='arena', parse_cache=cache)
+
+    Only trees are cached, input that does not parse is parsed again.  One cache can be shared by any
+    number of parsers and threads, the memory tier and counters are guarded by a lock that is never
+    held while reading or writing the directory; a process worker gets an empty memory tier of its own.
+    """
+
+    suffix = '.cst'
+
+    def __init__(self, directory=None, size=256):
+        self.directory = directory
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if directory is not None:
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['entries'] = OrderedDict()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def grammar_key(self, parser):
+        """
+        Returns what identifies the trees parser builds - the library version, the hash of its action
+        class grammar and the options that change what the grammar matches
+        """
+        return '{0}\n{1}\n{2}\n{3}'.format(__version__, Parser.grammar_hash(parser.binding.action), parser.skip.pattern,
+                                          parser.scanner is not None)
+
+    def key(self, grammar_key, rule, code):
+        digest = hashlib.sha1('{0}\n{1}\n'.format(grammar_key, rule))
+        digest.update(code.encode('utf-8') if isinstance(code, unicode) else code)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def parse(self, parser, code, rule=None):
+        """Returns parser.parse(code, rule) from the cache, parsing and storing it on a miss"""
+        rule = parser.entry_rule(rule)
+        key = self.key(parser.grammar_key, rule, code)
+        data = self.get(key)
+        if data is not None:
+            try:
+                arena = decode(data, parser.binding)
+            except ValueError:
+                self.invalidate(key)
+            else:
+                return arena.view(arena.root)
+        tree = parser.context().run(code, rule)
+        if tree:
+            self.put(key, encode(tree.arena))
+        return tree
+
+    def get(self, key):
+        """
+        Returns the encoded arena stored for key, or None when there is no usable entry
+        """
+        with self.lock:
+            data = self.entries.pop(key, None)
+            if data is not None:
+                self.hits += 1
+                self.remember(key, data)
+                return data
+        if self.directory is not None:
+            try:
+                with open(self.path(key), 'rb') as f:
+                    data = zlib.decompress(f.read())
+            except (IOError, OSError):
+                data = None
+            except zlib.error:
+                # unreadable entry, e.g. cut short by a full disk - drop it and parse again
+                self.remove(self.path(key))
+                data = None
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.remember(key, data)
+        return data
+
+    def put(self, key, data):
+        with self.lock:
+            self.remember(key, data)
+        if self.directory is None:
+            return
+        temp = None
+        try:
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(data))
+            os.rename(temp, self.path(key))
+        except (IOError, OSError):
+            # the cache is an optimisation, failing to write it is not an error
+            if temp is not None:
+                self.remove(temp)
+
+    def remember(self, key, data):
+        """
+        Keeps data in memory as the most recently used entry, evicting the least recently used.  Called
+        with the lock held.
+        """
+        self.entries[key] = data
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Removes the entry for key, or every entry when key is None"""
+        if key is not None:
+            with self.lock:
+                self.entries.pop(key, None)
+            if self.directory is not None:
+                self.remove(self.path(key))
+            return
+        with self.lock:
+            self.entries.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.suffix):
+                    self.remove(os.path.join(self.directory, name))
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
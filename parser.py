@@ -1,16 +1,27 @@
 import types
+import hashlib
 import inspect
 
 import action as action
 import table_parser as tparse
 import grammar_parser as gparse
+from grammar_lexer import position
 from error import ImproperlyConfigured, GrammarError
 
+__version__ = '0.1.0'
+
+
 class Parser(object):
     def __new__(cls, action_node, **options):
+        cls.check_action(action_node)
+        grammar_table = cls.compile_grammar(action_node, options.get('cache'))
         
-        cls.action = action_node
-                
+        table_parser = tparse.create_parser(grammar_table, action_node, **options)
+        
+        return table_parser
+
+    @classmethod
+    def check_action(cls, action_node):
         # check that action is a subclass of ActionBase
         if action.ActionBase not in action_node.__bases__:
             raise ImproperlyConfigured('Parse first argument must be ActionBase subclass')
@@ -18,28 +29,39 @@ class Parser(object):
         # check that action subclass accepts **kwargs
         if not inspect.getargspec(action_node.__init__).keywords:
             raise ImproperlyConfigured('Parse first argument ActionBase subclass must accept **kwargs')
-        
-        grammar = cls.generate_grammar(action_node)   
+
+    @classmethod
+    def compile_grammar(cls, action, cache=None):
+        # build the grammar descriptor table from action subclass
+        grammar = cls.generate_grammar(action)   
+        if cache is not None:
+            grammar_table = cache.get(grammar)
+            if grammar_table is not None:
+                return grammar_table
+
         grammar_parser = gparse.GrammarParser(grammar)
         grammar_rules = grammar_parser.parse()
         grammar_table = grammar_rules.table()
 
         if not grammar_table:
-            print(grammar_parser.last_match, grammar_parser.last_line, grammar_parser.last_pos)
-            print(grammar)
-            raise GrammarError()
-        
-        table_parser = tparse.Parser(grammar_table, action_node, **options)
-        
-        return table_parser
+            line, pos = position(grammar, grammar_parser.cursor)
+            raise GrammarError('{0} has no grammar rules\nLine: {1}, Pos: {2}'.format(action.__name__, line, pos))
+
+        if cache is not None:
+            cache.put(grammar, grammar_table)
+        return grammar_table
+
+    @classmethod
+    def grammar_hash(cls, action):
+        # stable digest of the grammar generated from action subclass
+        return hashlib.sha1(cls.generate_grammar(action)).hexdigest()
     
     @classmethod    
-    def generate_grammar(cls, action=None):
-        # construct grammar from action subclass
-        if not action:
-            action = cls.action
+    def generate_grammar(cls, action):
+        # construct grammar from action subclass, rules sorted by name so every process generates the
+        # same text whatever order the class dict lists them in
         grammar = []
-        for key, value in action.__dict__.iteritems():
+        for key, value in sorted(action.__dict__.iteritems()):
             if key.startswith('__'):
                 continue
             if key.startswith('_'):
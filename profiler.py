@@ -0,0 +1,157 @@
+"""
+Per rule profiling of parses.
+
+A parser created with profile=True records every rule it parses in its profile, a Profile, adding
+up for each rule -
+
+    calls       times the rule body was parsed, memoized results replayed without parsing are not
+                counted
+    matched     calls that matched
+    failed      calls that failed
+    backtracks  parser states restored while the rule was the innermost rule being parsed
+    bytes       input consumed by the calls that matched
+    nodes       CST nodes allocated while the rule was the innermost rule being parsed
+    total       seconds spent in the rule and the rules it called, recursive calls counted once
+    self        seconds spent in the rule itself
+
+    p = Parser(Program, entry='statement_list', profile=True)
+    p.parse(code)
+    print(p.profile.report())
+
+Each parse records into a Recorder of its own and adds it to the profile when it ends, so parsers
+shared by threads profile every thread.  Parsers without the option are left untouched and run at
+full speed; the recording is hooked into the profiled parses only.
+"""
+
+import json
+import threading
+from timeit import default_timer as timer
+
+
+FIELDS = ('calls', 'matched', 'failed', 'backtracks', 'bytes', 'nodes', 'total', 'self')
+CALLS, MATCHED, FAILED, BACKTRACKS, BYTES, NODES, TOTAL, SELF = range(len(FIELDS))
+
+
+class Profile(object):
+    """Statistics of each rule parsed, as lists of counters in FIELDS order keyed on rule name"""
+
+    def __init__(self):
+        self.rules = {}
+        self.lock = threading.Lock()
+
+    def merge(self, recorder):
+        """Adds the statistics recorded by recorder, which starts over afterwards"""
+        rules, recorder.rules = recorder.rules, {}
+        with self.lock:
+            for name, stats in rules.items():
+                totals = self.rules.get(name)
+                if totals is None:
+                    self.rules[name] = stats
+                else:
+                    for idx, value in enumerate(stats):
+                        totals[idx] += value
+
+    def clear(self):
+        with self.lock:
+            self.rules = {}
+
+    def as_dict(self):
+        """Returns a dict of rule name to a dict of field name to value"""
+        with self.lock:
+            return dict((name, dict(zip(FIELDS, stats))) for name, stats in self.rules.items())
+
+    def to_json(self, indent=None):
+        return json.dumps(self.as_dict(), indent=indent, sort_keys=True)
+
+    def report(self, sort='self', limit=None):
+        """Returns the statistics as a text table, the rules sorted on field sort highest first"""
+        if sort not in FIELDS:
+            raise ValueError('sort must be one of {0}'.format(', '.join(FIELDS)))
+        key = FIELDS.index(sort)
+        with self.lock:
+            rules = sorted(self.rules.items(), key=lambda item: (-item[1][key], item[0]))
+        if limit is not None:
+            rules = rules[:limit]
+        width = max([len('rule')] + [len(name) for name, stats in rules])
+        lines = ['{0:<{1}} {2:>10} {3:>10} {4:>10} {5:>10} {6:>12} {7:>10} {8:>10} {9:>10}'.format(
+            'rule', width, *FIELDS)]
+        for name, stats in rules:
+            lines.append('{0:<{1}} {2:>10} {3:>10} {4:>10} {5:>10} {6:>12} {7:>10} {8:>10.4f} {9:>10.4f}'.format(
+                name, width, *stats))
+        return '\n'.join(lines)
+
+
+class Recorder(object):
+    """
+    Records the rules parsed by one parse of parser.  enter and exit bracket parsing a rule body,
+    allocated returns the number of nodes allocated so far - by default the nodes counted in nodes.
+    """
+
+    def __init__(self, parser, allocated=None):
+        self.parser = parser
+        self.allocated = allocated if allocated is not None else lambda: self.nodes
+        self.nodes = 0
+        self.rules = {}
+        # calls being parsed as [name, cursor, allocated, start time, child time, child nodes]
+        self.stack = []
+        # calls of each rule on the stack, total time is only added by the outermost
+        self.active = {}
+
+    def enter(self, name):
+        self.active[name] = self.active.get(name, 0) + 1
+        self.stack.append([name, self.parser.cursor, self.allocated(), timer(), 0.0, 0])
+
+    def exit(self, matched):
+        name, cursor, allocated, start, child_time, child_nodes = self.stack.pop()
+        elapsed = timer() - start
+        nodes = self.allocated() - allocated
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = [0, 0, 0, 0, 0, 0, 0.0, 0.0]
+        stats[CALLS] += 1
+        if matched:
+            stats[MATCHED] += 1
+            stats[BYTES] += self.parser.cursor - cursor
+        else:
+            stats[FAILED] += 1
+        stats[NODES] += nodes - child_nodes
+        stats[SELF] += elapsed - child_time
+        self.active[name] -= 1
+        if not self.active[name]:
+            stats[TOTAL] += elapsed
+        if self.stack:
+            caller = self.stack[-1]
+            caller[4] += elapsed
+            caller[5] += nodes
+
+    def backtrack(self):
+        if self.stack:
+            name = self.stack[-1][0]
+            stats = self.rules.get(name)
+            if stats is None:
+                stats = self.rules[name] = [0, 0, 0, 0, 0, 0, 0.0, 0.0]
+            stats[BACKTRACKS] += 1
+
+    def body(self, name, parse):
+        """Returns parse(lexeme, node), the body of rule name, recording each call"""
+        def profiled(lexeme, node):
+            self.enter(name)
+            matched = False
+            try:
+                matched = parse(lexeme, node)
+            finally:
+                self.exit(matched)
+            return matched
+        return profiled
+
+    def method(self, name, parse):
+        """Returns the grammar_parser.GrammarParser rule method parse, recording each call"""
+        def profiled():
+            self.enter(name)
+            result = False
+            try:
+                result = parse()
+            finally:
+                self.exit(result is not False)
+            return result
+        return profiled
@@ -0,0 +1,209 @@
+"""
+Push parsing of input that arrives in pieces.
+
+A PushParser is fed the input as it arrives - from a socket, an event loop callback or a file read
+a chunk at a time - and yields each item of a top level repetition once it has been parsed, so a
+request never needs to be buffered whole before parsing starts.
+
+    push = parser.push_parser('statement_list')
+
+    def data_received(data):
+        push.feed(data)
+        for statement in push:
+            statement()
+
+    def connection_lost(reason):
+        push.close()
+        for statement in push:
+            statement()
+
+Iterating stops as soon as the items parsed so far are used up, so a caller sharing its thread with
+other work - an event loop serving other connections - can stop between any two items and carry on
+with the rest later.  An item is yielded as soon as its parse did not look at the end of the input
+fed so far, so a request that arrives whole is parsed as soon as it is fed.
+
+What a push parser does not do: it cannot stop inside an item.  An item cut short by the end of the
+input is parsed again from its start once more input has arrived - when the input fed so far ends
+with a character an item can end with, or the input has doubled since the last try, so a long item
+is only parsed again a few times.  Nor does it return to the caller every so many steps while
+parsing an item, control only comes back between items.  The tree is Python 2, so there is no
+asyncio coroutine API either; feed and iterate are plain calls that any event loop can make.
+"""
+
+from first_sets import last_set, regex_first, regex_looked, regex_reach, ASCII
+from table_descriptor import Ident, OptionalRepeat, Repeat
+
+
+class PushParser(object):
+    """
+    Parses rule, whose body must be a repetition such as statement_list = *statement, from input
+    passed to feed.  Iterating yields the items parsed from the input fed so far; call close at the
+    end of the input, after which iterating yields the remaining items and raises SyntaxError when
+    input is left that is not an item.
+
+    An item is accepted once its parse did not look at the end of the input fed so far, or the input
+    is closed.  Literals look as far as they match; regular expressions look as far past their match
+    as first_sets.regex_looked works out, and when that is unbounded or they fail where a match could
+    start, chunk_size characters on - such an item waits until that much input follows it.  Items and
+    the input they were parsed from are not kept.
+    """
+
+    def __init__(self, parser, rule=None, chunk_size=65536):
+        # the parse runs in a context of its own, parser can go on being used meanwhile
+        self.parser = parser = parser.context()
+        rule = parser.entry_rule(rule)
+        body = parser.table[rule].value
+        if not isinstance(body, (Repeat, OptionalRepeat)):
+            raise ValueError('push parsing needs a rule whose body is a repetition, {0} is not'.format(rule))
+        self.item = item = body.value
+        if parser.rules is not None and isinstance(item, Ident) and item.value in parser.rules:
+            parse = parser.rules[item.value]
+            self.parse_item = lambda parent: parser.apply_rule(item.value, parse, parser, parent)
+        else:
+            self.parse_item = lambda parent: parser.parse_lexeme(item, parent)
+        self.chunk_size = chunk_size
+        # the characters an item can end with, and the characters skipped text is made of
+        self.ends = last_set(item, parser.table)
+        self.skipped = ''.join([char for char in ASCII if parser.skip.match(char).end()])
+        # terminals report whether they looked at the end of the input
+        self.short = False
+        self.firsts = {}
+        self.reaches = {}
+        self.match_literal = parser.parse_literal
+        self.match_regex = parser.parse_regex
+        parser.parse_literal = self.parse_literal
+        parser.parse_regex = self.parse_regex
+        # input fed but not yet added to the buffer
+        self.pending = []
+        self.pending_size = 0
+        self.buffer = ''
+        # start of the input not yet parsed
+        self.offset = 0
+        # input to hold before trying to parse the next item, unless the input may end one
+        self.need = 1
+        self.boundary = False
+        self.closed = False
+        parser.initialise('')
+        self.set_code()
+
+    def feed(self, data):
+        if self.closed:
+            raise ValueError('input fed after close')
+        if not data:
+            return
+        self.pending.append(data)
+        self.pending_size += len(data)
+        last = data.rstrip(self.skipped)[-1:]
+        if not last or self.can_end(last):
+            self.boundary = True
+
+    def close(self):
+        """Marks the end of the input"""
+        self.closed = True
+        self.set_code()
+
+    def can_end(self, char):
+        chars, other, nullable = self.ends
+        return nullable or char in chars or other and char not in ASCII
+
+    def available(self):
+        return len(self.buffer) - self.offset + self.pending_size
+
+    def set_code(self):
+        """
+        Sets the parser's input to the buffer.  Until the input is closed it ends with two characters
+        no skip rule matches, so the end of the input is never reached and $$ never matches.
+        """
+        parser = self.parser
+        parser.code = self.buffer + ('$' if self.closed else '$$')
+        parser.end = self.closed and parser.cursor >= len(self.buffer)
+
+    def refill(self):
+        """Moves the pending input into the buffer, dropping the input already parsed"""
+        parser = self.parser
+        # cursors are offsets into the buffer
+        self.buffer = self.buffer[self.offset:] + ''.join(self.pending)
+        parser.cursor -= self.offset
+        self.offset = 0
+        self.pending = []
+        self.pending_size = 0
+        self.set_code()
+        # memoized results are keyed on the old offsets and may have failed for want of input
+        if parser.memo is not None:
+            parser.memo.clear()
+
+    def parse_literal(self, literal, parent):
+        parser = self.parser
+        cursor = parser.cursor
+        matched = self.match_literal(literal, parent)
+        size = len(self.buffer)
+        if cursor + len(literal.value) > size and (matched or literal.value.startswith(parser.code[cursor:size])):
+            self.short = True
+        return matched
+
+    def parse_regex(self, regex, parent):
+        parser = self.parser
+        cursor = parser.cursor
+        size = len(self.buffer)
+        if self.match_regex(regex, parent):
+            if regex.value not in self.reaches:
+                self.reaches[regex.value] = regex_reach(regex.value)
+            # the end of the buffer is not the end of the input, the sentinel after it is left out
+            looked = regex_looked(self.reaches[regex.value], self.buffer, cursor,
+                                  cursor + len(parent.children[-1].value))
+            if looked is None:
+                # it may have looked any distance past its match, as far on as a failure could
+                looked = cursor + self.chunk_size
+            if looked > size:
+                self.short = True
+            return True
+        if cursor >= size or size - cursor < self.chunk_size and self.can_start(regex, parser.code[cursor]):
+            self.short = True
+        return False
+
+    def can_start(self, regex, char):
+        if regex.value not in self.firsts:
+            self.firsts[regex.value] = regex_first(regex.value)
+        chars, other, nullable = self.firsts[regex.value]
+        return nullable or char in chars or other and char not in ASCII
+
+    def __iter__(self):
+        parser = self.parser
+        try:
+            while True:
+                available = self.available()
+                if not self.closed and available < self.need and not (self.boundary and available < self.chunk_size):
+                    return
+                self.boundary = False
+                if self.pending:
+                    self.refill()
+                # skipped text before the item
+                parser.advance(0)
+                self.offset = parser.cursor
+                parser.push_state()
+                # failures are reported from the item that failed, and the offsets of earlier ones
+                # are gone once the buffer is refilled
+                parser.farthest = -1
+                self.short = False
+                node = parser.new_collector(self.item.type)
+                if self.parse_item(node) and parser.cursor > self.offset and (
+                        self.closed or not self.short and parser.farthest < len(self.buffer)):
+                    parser.drop_state()
+                    self.offset = parser.cursor
+                    self.need = 1
+                    if parser.memo is not None:
+                        parser.memo.clear()
+                    for child in node.children:
+                        yield child
+                    continue
+                parser.pop_state()
+                if self.closed:
+                    if self.offset < len(self.buffer):
+                        raise parser.error()
+                    return
+                # the item may run past the end of the input, wait for it to end an item or double
+                self.need = available + max(1, available)
+                return
+        finally:
+            # rules parsed so far go into the profile of profiled parsers
+            parser.record_profile()
@@ -0,0 +1,181 @@
+"""
+Tokenising the input up front for parsers created with tokens=True.
+
+By default every terminal is matched against the input characters each time a parse reaches it, so
+a terminal reached again after backtracking is matched again.  A Scanner collects every literal and
+regular expression terminal of a grammar table and splits the input into tokens once, before the
+parse starts; the parser then matches a terminal by comparing the id of the token at the cursor with
+the terminal's id and moves on by reading the next token's position out of the token arrays.
+
+At each position the scanner takes the longest match of any terminal, a literal winning over a
+regular expression matching as much - keywords are literals and never identifiers.  When regular
+expressions alone tie the token is accepted by each of them.  The text skipped between terminals is
+skipped between tokens.  Regular expressions are matched together - for each first character one
+master expression captures the match of every regular expression that can start with it.
+
+This changes what a grammar accepts: a terminal only ever matches a whole token.  The mode suits
+grammars whose terminals make up a token language, as in hand written lexers, and is wrong for
+grammars that rely on matching part of what a longer terminal would take.  A regular expression that
+can match nothing still matches nothing where no token of its own starts.
+"""
+
+from array import array
+import re
+
+from first_sets import ASCII, regex_first
+from table_descriptor import *
+
+
+class Tokens(object):
+    """
+    The tokens of one input.  Token n starts at offset starts[n], spans lengths[n] characters on line
+    lines[n] at positions[n] and is of kind kinds[n], the id of the terminal it matches or, for a tie
+    of regular expressions, Scanner.count plus the index of the ids of the tied terminals in ties.
+    index[offset] is the token starting at offset, -1 elsewhere.  The last token marks the end of the
+    tokens with kind -1, at the end of the input or at the first character no terminal matches.
+    """
+
+    __slots__ = ('starts', 'lengths', 'lines', 'positions', 'kinds', 'ties', 'index')
+
+    def __init__(self, size):
+        self.starts = array('i')
+        self.lengths = array('i')
+        self.lines = array('i')
+        self.positions = array('i')
+        self.kinds = array('i')
+        self.ties = []
+        self.index = array('i', [-1]) * (size + 1)
+
+
+class Scanner(object):
+    """Tokeniser for the terminals of table, skipping the text matched by the compiled regex skip"""
+
+    def __init__(self, table, skip):
+        self.skip = skip
+        # terminal ids by literal value and by regular expression pattern
+        self.literals = {}
+        self.regexes = {}
+        for name, rule in table.items():
+            # the skip rule is the text between tokens
+            if name != 'skip' or not isinstance(rule.value, Regex):
+                self.collect(rule)
+        self.count = len(self.literals) + len(self.regexes)
+        self.nullable = set(pattern for pattern in self.regexes if re.match(pattern, ''))
+        self.firsts = dict((pattern, regex_first(pattern)) for pattern in self.regexes)
+        # (literals longest first, master expression, [(group, id)], [(compiled, id)]) by first character
+        self.entries = {}
+
+    def collect(self, lexeme):
+        if isinstance(lexeme, Literal):
+            if lexeme.value and lexeme.value not in self.literals:
+                self.literals[lexeme.value] = len(self.literals) + len(self.regexes)
+        elif isinstance(lexeme, Regex):
+            if lexeme.value not in self.regexes:
+                self.regexes[lexeme.value] = len(self.literals) + len(self.regexes)
+        elif isinstance(lexeme, (Option, LiteralOption, Concat)):
+            for child in lexeme.value:
+                self.collect(child)
+        elif isinstance(lexeme, Precedence):
+            for literal, level, right in lexeme.operators:
+                self.collect(literal)
+        elif isinstance(lexeme, (Rule, Optional, Repeat, OptionalRepeat, PositiveLookahead, NegativeLookahead)):
+            self.collect(lexeme.value)
+
+    def entry(self, char):
+        """Returns the terminals that can match starting with char, see entries"""
+        entry = self.entries.get(char)
+        if entry is not None:
+            return entry
+        literals = sorted([(value, id) for value, id in self.literals.items() if value[0] == char],
+                          key=lambda literal: -len(literal[0]))
+        groups = []
+        alone = []
+        parts = []
+        for pattern, id in sorted(self.regexes.items(), key=lambda regex: regex[1]):
+            chars, other, nullable = self.firsts[pattern]
+            if not (nullable or (char in chars if char in ASCII else other)):
+                continue
+            compiled = re.compile(pattern)
+            if compiled.flags or re.search(r'\\[1-9]|\(\?P[<=]', pattern):
+                # inline flags would apply to every expression of the master, group references
+                # and names would refer to its groups
+                alone.append((compiled, id))
+            else:
+                groups.append(('t{0}'.format(id), id))
+                parts.append('(?:(?=(?P<t{0}>{1})))?'.format(id, pattern))
+        master = re.compile(''.join(parts)).match if parts else None
+        entry = self.entries[char] = (literals, master, groups, alone)
+        return entry
+
+    def tokenise(self, code):
+        """Returns the Tokens of code, which the parser ends with a '$' the scanner does not read"""
+        size = len(code) - 1
+        tokens = Tokens(len(code))
+        starts, lengths, lines, positions, kinds, ties, index = (
+            tokens.starts, tokens.lengths, tokens.lines, tokens.positions, tokens.kinds, tokens.ties, tokens.index)
+        skip = self.skip.match
+        entries = self.entries
+        cursor = skip(code, 0).end()
+        line = code.count('\n', 0, cursor) + 1
+        line_pos = cursor - code.rfind('\n', 0, cursor) - 1
+        while cursor < size:
+            char = code[cursor]
+            literals, master, groups, alone = entries[char] if char in entries else self.entry(char)
+            length = 0
+            kind = -1
+            for value, id in literals:
+                if code.startswith(value, cursor, size):
+                    length = len(value)
+                    kind = id
+                    break
+            # regular expressions only take the token by matching more than any literal
+            longest = length
+            tied = []
+            if master is not None:
+                matchobj = master(code, cursor, size)
+                for group, id in groups:
+                    end = matchobj.end(group)
+                    if end - cursor > longest:
+                        longest = end - cursor
+                        tied = [id]
+                    elif end - cursor == longest and longest > length:
+                        tied.append(id)
+            for compiled, id in alone:
+                matchobj = compiled.match(code, cursor, size)
+                if matchobj is not None:
+                    end = matchobj.end()
+                    if end - cursor > longest:
+                        longest = end - cursor
+                        tied = [id]
+                    elif end - cursor == longest and longest > length:
+                        tied.append(id)
+            if longest > length:
+                length = longest
+                if len(tied) == 1:
+                    kind = tied[0]
+                else:
+                    kind = self.count + len(ties)
+                    ties.append(frozenset(tied))
+            if kind == -1:
+                break
+            index[cursor] = len(kinds)
+            starts.append(cursor)
+            lengths.append(length)
+            lines.append(line)
+            positions.append(line_pos)
+            kinds.append(kind)
+            end = skip(code, cursor + length).end()
+            newlines = code.count('\n', cursor, end)
+            if newlines:
+                line += newlines
+                line_pos = end - code.rfind('\n', cursor, end) - 1
+            else:
+                line_pos += end - cursor
+            cursor = end
+        index[cursor] = len(kinds)
+        starts.append(cursor)
+        lengths.append(0)
+        lines.append(line)
+        positions.append(line_pos)
+        kinds.append(-1)
+        return tokens
@@ -0,0 +1,271 @@
+"""
+Compiles a grammar descriptor table into Python closures.
+
+Each descriptor node becomes one closure specialised for its type, taking the parser and the parent
+node - parse(parser, parent) - and returning True on a match, exactly as the matching
+table_parser.Parser.parse_* method would.  Idents are linked straight to the compiled body of the
+rule they reference, so parsing runs without per-lexeme type dispatch or table lookups.  The tree is
+still built through the parser so both engines produce the same CST.
+
+Options and repetitions are guarded by the first character sets of first_sets.guards, skipping the
+lexemes that cannot start with the next input character as the interpreter does.
+"""
+
+from first_sets import guards as first_guards
+from table_descriptor import *
+
+
+def compile_table(table, guards=None):
+    """
+    Compiles every rule in table and returns a dict of rule name to the closure parsing its body.
+    guards is first_sets.guards(table), worked out here when not given.
+    """
+    if guards is None:
+        guards = first_guards(table)
+    # one cell per rule so that idents can be linked before the rule they reference is compiled
+    cells = dict((name, [None]) for name in table)
+    for name, rule in table.items():
+        cells[name][0] = compile_lexeme(rule, cells, guards)
+    return dict((name, cell[0]) for name, cell in cells.items())
+
+
+def compile_lexeme(lexeme, cells, guards):
+    for cls, compiler in COMPILERS:
+        if isinstance(lexeme, cls):
+            return compiler(lexeme, cells, guards)
+
+    def unsupported(parser, parent):
+        raise RuntimeError('unsupported lexeme {0}: {1}'.format(type(lexeme).__name__, lexeme))
+    return unsupported
+
+
+def compile_empty(lexeme, cells, guards):
+    def empty(parser, parent):
+        return parser.add_empty(parent)
+    return empty
+
+
+def compile_literal(lexeme, cells, guards):
+    def literal(parser, parent):
+        return parser.parse_literal(lexeme, parent)
+    return literal
+
+
+def compile_regex(lexeme, cells, guards):
+    def regex(parser, parent):
+        return parser.parse_regex(lexeme, parent)
+    return regex
+
+
+def compile_ident(lexeme, cells, guards):
+    name = lexeme.value
+    if name not in cells:
+        # undefined rules fail when they are reached, as they do in the interpreter
+        def undefined(parser, parent):
+            raise KeyError(name)
+        return undefined
+    cell = cells[name]
+
+    def ident(parser, parent):
+        return parser.apply_rule(name, cell[0], parser, parent)
+    return ident
+
+
+def compile_option(lexeme, cells, guards):
+    alts = lexeme.alts if lexeme.alts is not None else range(len(lexeme.value))
+    options = [(alt, compile_lexeme(option, cells, guards), guards.get(id(option)), option)
+               for alt, option in zip(alts, lexeme.value)]
+
+    def option(parser, parent):
+        char = parser.peek()
+        for idx, option, guard, skipped in options:
+            if guard is not None and char not in guard:
+                if parser.cursor >= parser.farthest:
+                    parser.fail(skipped)
+                continue
+            parser.push_state()
+            matched = option(parser, parent)
+            if matched:
+                parser.drop_state()
+                parser.set_alt(parent, idx)
+                return True
+            parser.pop_state()
+            if matched is None:
+                # the alternative failed past its cut, the others are never tried
+                return False
+        return False
+    return option
+
+
+def compile_literal_option(lexeme, cells, guards):
+    def literal_option(parser, parent):
+        return parser.parse_literal_option(lexeme, parent)
+    return literal_option
+
+
+def compile_precedence(lexeme, cells, guards):
+    name = lexeme.value.value
+    if name not in cells:
+        return compile_ident(lexeme.value, cells, guards)
+    cell = cells[name]
+
+    def precedence(parser, parent):
+        return parser.climb(lexeme, cell[0], parser, parent)
+    return precedence
+
+
+def compile_concat(lexeme, cells, guards):
+    lexemes = [compile_lexeme(child, cells, guards) for child in lexeme.value]
+    if lexeme.cut is not None:
+        return compile_cut_concat(lexemes, lexeme.cut)
+
+    def concat(parser, parent):
+        parser.push_state()
+        mark = parser.mark(parent)
+        for lexeme in lexemes:
+            if not lexeme(parser, parent):
+                parser.pop_state()
+                parser.release(parent, mark)
+                return False
+        parser.drop_state()
+        return True
+    return concat
+
+
+def compile_cut_concat(lexemes, cut):
+    def concat(parser, parent):
+        parser.push_state()
+        mark = parser.mark(parent)
+        for idx, lexeme in enumerate(lexemes):
+            matched = lexeme(parser, parent)
+            if not matched:
+                parser.pop_state()
+                parser.release(parent, mark)
+                # only the child at the cut can fail with None, see table_descriptor.Concat
+                return None if idx > cut else matched
+        parser.drop_state()
+        return True
+    return concat
+
+
+def compile_optional(lexeme, cells, guards):
+    body = compile_lexeme(lexeme.value, cells, guards)
+    type = lexeme.value.type
+
+    def optional(parser, parent):
+        if not body(parser, parent):
+            parser.add_missing(type, parent)
+        else:
+            parser.set_matched(parent)
+        return True
+    return optional
+
+
+def compile_repeat(lexeme, cells, guards):
+    body = compile_lexeme(lexeme.value, cells, guards)
+    type = lexeme.value.type
+    guard = guards.get(id(lexeme.value))
+
+    def repeat(parser, parent):
+        node = parser.new_collector(type)
+        parser.push_state()
+        while True:
+            if guard is not None and parser.peek() not in guard:
+                if parser.cursor >= parser.farthest:
+                    parser.fail(lexeme.value)
+                break
+            if not body(parser, node):
+                break
+            parser.drop_state()
+            parser.push_state()
+        parser.pop_state()
+        return parser.add_repeat(type, node, parent)
+    return repeat
+
+
+def compile_optional_repeat(lexeme, cells, guards):
+    body = compile_lexeme(lexeme.value, cells, guards)
+    type = lexeme.value.type
+    guard = guards.get(id(lexeme.value))
+
+    def optional_repeat(parser, parent):
+        node = parser.new_collector(type)
+        parser.push_state()
+        while True:
+            if guard is not None and parser.peek() not in guard:
+                if parser.cursor >= parser.farthest:
+                    parser.fail(lexeme.value)
+                break
+            if not body(parser, node):
+                break
+            parser.drop_state()
+            parser.push_state()
+        parser.pop_state()
+        return parser.add_optional_repeat(type, node, parent)
+    return optional_repeat
+
+
+def compile_positive_lookahead(lexeme, cells, guards):
+    body = compile_lexeme(lexeme.value, cells, guards)
+
+    def positive_lookahead(parser, parent):
+        parser.push_state()
+        matched = body(parser, parser.new_dummy())
+        parser.pop_state()
+        return bool(matched)
+    return positive_lookahead
+
+
+def compile_negative_lookahead(lexeme, cells, guards):
+    body = compile_lexeme(lexeme.value, cells, guards)
+
+    def negative_lookahead(parser, parent):
+        parser.push_state()
+        matched = body(parser, parser.new_dummy())
+        parser.pop_state()
+        return not matched
+    return negative_lookahead
+
+
+def compile_rule(lexeme, cells, guards):
+    return compile_lexeme(lexeme.value, cells, guards)
+
+
+def compile_eof(lexeme, cells, guards):
+    def eof(parser, parent):
+        return parser.end or parser.fail(lexeme)
+    return eof
+
+
+def compile_cut(lexeme, cells, guards):
+    def cut(parser, parent):
+        return parser.cut()
+    return cut
+
+
+def compile_abort(lexeme, cells, guards):
+    def abort(parser, parent):
+        parser.abort(lexeme)
+    return abort
+
+
+# same order as the isinstance chain in table_parser.Parser.parse_lexeme
+COMPILERS = [
+    (Empty, compile_empty),
+    (Literal, compile_literal),
+    (Regex, compile_regex),
+    (Ident, compile_ident),
+    (Option, compile_option),
+    (LiteralOption, compile_literal_option),
+    (Precedence, compile_precedence),
+    (Concat, compile_concat),
+    (Optional, compile_optional),
+    (Repeat, compile_repeat),
+    (OptionalRepeat, compile_optional_repeat),
+    (PositiveLookahead, compile_positive_lookahead),
+    (NegativeLookahead, compile_negative_lookahead),
+    (Rule, compile_rule),
+    (EOF, compile_eof),
+    (Cut, compile_cut),
+    (Abort, compile_abort),
+]
@@ -68,17 +68,65 @@ class Regex(Lexeme):
 
 
 class Option(Lexeme):
-    pass
+    # alt recorded for each alternative when it is not the alternative's index, set by
+    # grammar_optimizer when it flattens nested options
+    alts = None
+
+
+class LiteralOption(Lexeme):
+    """
+    Option whose alternatives are all non-empty literals, built by grammar_optimizer.  first maps each
+    first character to the (literal, alt) pairs of the literals starting with it, in order, so only the
+    literals that can match at the cursor are tried.  It builds exactly the nodes the option would.
+    """
+    alts = None
+
+    def init(self):
+        self.type = 'option'
+        alts = self.alts if self.alts is not None else range(len(self.value))
+        self.first = {}
+        for literal, alt in zip(self.value, alts):
+            self.first.setdefault(literal.value[0], []).append((literal, alt))
+
+
+class Precedence(Lexeme):
+    """
+    Binary operators of rule name over operands of the rule ident value, parsed by precedence
+    climbing.  levels lists (associativity, operators) from the loosest binding level to the tightest.
+    """
+
+    def init(self):
+        # every operator with its level and whether it is right associative, longest first so that
+        # an operator is never matched as a prefix of a longer one
+        operators = [(Literal(value=operator), level, assoc == 'right')
+                     for level, (assoc, values) in enumerate(self.levels) for operator in values]
+        self.operators = sorted(operators, key=lambda operator: -len(operator[0].value))
 
 
 class Concat(Lexeme):
-    pass
+    """
+    cut is the index of the first child that is a Cut or a concatenation holding one, None without.
+    Once a concatenation has matched past its cut a failure is None rather than False, telling the
+    enclosing option not to try its other alternatives; a cut concatenation at the cut fails with
+    whatever it failed with.
+    """
+    cut = None
+
+    def init(self):
+        for idx, child in enumerate(self.value):
+            if isinstance(child, Cut) or isinstance(child, Concat) and child.cut is not None:
+                self.cut = idx
+                break
 
 
 class EOF(Lexeme):
     value = None
 
 
+class Cut(Lexeme):
+    value = None
+
+
 class Empty(Lexeme):
     def init(self):
         self.value = 'empty'
@@ -0,0 +1,333 @@
+"""
+Generates a standalone Python parser module from an ActionBase subclass.
+
+    python table_generator.py package.module.ActionClass output.py
+
+The generated module holds the grammar descriptor table and one recursive descent function per rule,
+written out as straight-line code that builds exactly the CST table_parser.Parser builds.  Importing
+it skips the runtime grammar compile done by parser.Parser -
+
+    from output import Parser
+    parser = Parser(ActionClass, entry='program')
+"""
+
+import sys
+
+from first_sets import guards
+from table_descriptor import *
+from parser import Parser
+
+
+HEADER = '''"""
+Parser for {action} generated by table_generator - do not edit.
+"""
+
+from table_descriptor import *
+from parser import Parser as _Parser
+from error import ImproperlyConfigured
+import table_parser as _table_parser
+
+
+GRAMMAR_HASH = {grammar_hash!r}
+
+'''
+
+FOOTER = '''
+
+def Parser(action, **options):
+    if _Parser.grammar_hash(action) != GRAMMAR_HASH:
+        raise ImproperlyConfigured('Generated parser is out of date for {{0}}'.format(action.__name__))
+    return _table_parser.create_parser(TABLE, action, rules=RULES, **options)
+'''
+
+# while loops nested in one function before the next group gets a function of its own - CPython
+# rejects a function with more than 20 statically nested blocks
+MAX_LOOPS = 16
+# descriptors nested in one expression before the next is a constant of its own - the CPython 2 parser
+# runs out of stack on deeper expressions
+MAX_DESCRIPTORS = 8
+
+
+class Generator(object):
+    """
+    Writes the source of a parser module for a grammar descriptor table.  Each lexeme is emitted as a
+    block of statements leaving its result in a fresh okN variable; concatenations and options run
+    inside a single pass while loop so that failing lexemes break out instead of nesting deeper.
+    Groups nested more than MAX_LOOPS loops deep are emitted as functions of their own, called from
+    the loop around them, and descriptors nested more than MAX_DESCRIPTORS deep as constants.  Options and repetitions check the next character against first_sets.guards
+    constants.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.guards = guards(table)
+        self.lines = []
+        self.constants = []
+        self.names = {}
+        self.counter = 0
+        self.name = None
+        self.loops = 0
+        self.parts = []
+
+    def generate(self, action_name, grammar_hash):
+        rules = []
+        for name in sorted(self.table):
+            rules.append(self.rule(name, self.table[name]))
+        # descriptors too deep for one expression add constants TABLE refers to
+        descriptors = ['    {0!r}: {1},'.format(name, self.descriptor(self.table[name])) for name in sorted(self.table)]
+        source = [HEADER.format(action=action_name, grammar_hash=grammar_hash)]
+        source.extend(self.constants)
+        source.append('\n\nTABLE = {')
+        source.extend(descriptors)
+        source.append('}\n')
+        source.extend(rules)
+        source.append('\nRULES = {')
+        for name in sorted(self.table):
+            source.append('    {0!r}: parse_{0},'.format(name))
+        source.append('}')
+        source.append(FOOTER)
+        return '\n'.join(source)
+
+    def descriptor(self, lexeme, depth=0):
+        """Returns a Python expression rebuilding the descriptor lexeme"""
+        if isinstance(lexeme, (Literal, Regex, EOF, Abort, Precedence, LiteralOption)):
+            return self.constant(lexeme)
+        elif depth >= MAX_DESCRIPTORS and isinstance(lexeme, (Rule, Option, Concat, Optional, Repeat, OptionalRepeat,
+                                                              PositiveLookahead, NegativeLookahead)):
+            descriptor = self.descriptor(lexeme)
+            name = 'PART_{0}'.format(len(self.constants) + 1)
+            self.constants.append('{0} = {1}'.format(name, descriptor))
+            return name
+        elif isinstance(lexeme, Rule):
+            directives = [getattr(directive, 'value', directive) for directive in lexeme.directive]
+            return 'Rule(name={0!r}, value={1}, directive={2!r})'.format(
+                lexeme.name, self.descriptor(lexeme.value, depth + 1), directives)
+        elif isinstance(lexeme, (Option, Concat)):
+            values = ', '.join([self.descriptor(value, depth + 1) for value in lexeme.value])
+            if getattr(lexeme, 'alts', None) is not None:
+                return '{0}(value=[{1}], alts={2!r})'.format(lexeme.__class__.__name__, values, lexeme.alts)
+            return '{0}(value=[{1}])'.format(lexeme.__class__.__name__, values)
+        elif isinstance(lexeme, (Optional, Repeat, OptionalRepeat, PositiveLookahead, NegativeLookahead)):
+            return '{0}(value={1})'.format(lexeme.__class__.__name__, self.descriptor(lexeme.value, depth + 1))
+        elif isinstance(lexeme, (Ident, BackReference)):
+            return '{0}(value={1!r})'.format(lexeme.__class__.__name__, lexeme.value)
+        return '{0}()'.format(lexeme.__class__.__name__)
+
+    def constant(self, lexeme):
+        """Terminals are module level constants shared by TABLE and the rule functions"""
+        if id(lexeme) not in self.names:
+            name = '{0}_{1}'.format(lexeme.__class__.__name__.upper(), len(self.constants) + 1)
+            if isinstance(lexeme, Precedence):
+                self.constants.append('{0} = Precedence(name={1!r}, value={2}, levels={3!r})'.format(
+                    name, lexeme.name, self.descriptor(lexeme.value), lexeme.levels))
+            elif isinstance(lexeme, LiteralOption):
+                values = ', '.join([self.descriptor(value) for value in lexeme.value])
+                self.constants.append('{0} = LiteralOption(value=[{1}], alts={2!r})'.format(name, values, lexeme.alts))
+            else:
+                self.constants.append('{0} = {1}(value={2!r})'.format(name, lexeme.__class__.__name__, lexeme.value))
+            self.names[id(lexeme)] = name
+        return self.names[id(lexeme)]
+
+    def skipped(self, lexeme):
+        """Lexemes skipped by their guards are module level constants too, see Parser.fail"""
+        if id(lexeme) not in self.names:
+            descriptor = self.descriptor(lexeme)
+            name = 'SKIPPED_{0}'.format(len(self.constants) + 1)
+            self.constants.append('{0} = {1}'.format(name, descriptor))
+            self.names[id(lexeme)] = name
+        return self.names[id(lexeme)]
+
+    def guard(self, lexeme):
+        """Returns the constant holding the guard of lexeme, None when it has none"""
+        chars = self.guards.get(id(lexeme))
+        if chars is None:
+            return None
+        key = ('guard', chars)
+        if key not in self.names:
+            name = 'FIRST_{0}'.format(len(self.constants) + 1)
+            self.constants.append('{0} = frozenset({1!r})'.format(name, ''.join(sorted(chars))))
+            self.names[key] = name
+        return self.names[key]
+
+    def rule(self, name, rule):
+        self.lines = ['', '', 'def parse_{0}(parser, parent):'.format(name)]
+        self.name = name
+        self.counter = 0
+        self.loops = 0
+        self.parts = []
+        result = self.lexeme(rule.value, 'parent', 1)
+        self.emit(1, 'return {0}', result)
+        return '\n'.join(self.parts + self.lines)
+
+    def part(self, lexeme, parent, indent):
+        """Emits lexeme as a function of its own and a call to it, returns the variable holding the result"""
+        name = '_parse_{0}_{1}'.format(self.name, self.var('part'))
+        lines, loops = self.lines, self.loops
+        self.lines = ['', '', 'def {0}(parser, parent):'.format(name)]
+        self.loops = 0
+        result = self.lexeme(lexeme, 'parent', 1)
+        self.emit(1, 'return {0}', result)
+        self.parts.append('\n'.join(self.lines))
+        self.lines, self.loops = lines, loops
+        ok = self.var('ok')
+        self.emit(indent, '{0} = {1}(parser, {2})', ok, name, parent)
+        return ok
+
+    def emit(self, indent, line, *args):
+        self.lines.append('    ' * indent + line.format(*args))
+
+    def var(self, prefix):
+        self.counter += 1
+        return '{0}{1}'.format(prefix, self.counter)
+
+    def lexeme(self, lexeme, parent, indent):
+        """Emits the statements parsing lexeme into parent and returns the variable holding the result"""
+        if isinstance(lexeme, (Option, Concat, Repeat, OptionalRepeat)) and self.loops >= MAX_LOOPS:
+            return self.part(lexeme, parent, indent)
+        ok = self.var('ok')
+        if isinstance(lexeme, Empty):
+            self.emit(indent, '{0} = parser.add_empty({1})', ok, parent)
+        elif isinstance(lexeme, Literal):
+            self.emit(indent, '{0} = parser.parse_literal({1}, {2})', ok, self.constant(lexeme), parent)
+        elif isinstance(lexeme, Regex):
+            self.emit(indent, '{0} = parser.parse_regex({1}, {2})', ok, self.constant(lexeme), parent)
+        elif isinstance(lexeme, Ident):
+            if lexeme.value in self.table:
+                self.emit(indent, '{0} = parser.apply_rule({1!r}, parse_{1}, parser, {2})', ok, lexeme.value, parent)
+            else:
+                self.emit(indent, 'raise KeyError({0!r})', lexeme.value)
+        elif isinstance(lexeme, Precedence):
+            if lexeme.value.value in self.table:
+                self.emit(indent, '{0} = parser.climb({1}, parse_{2}, parser, {3})', ok, self.constant(lexeme),
+                          lexeme.value.value, parent)
+            else:
+                self.emit(indent, 'raise KeyError({0!r})', lexeme.value.value)
+        elif isinstance(lexeme, LiteralOption):
+            self.emit(indent, '{0} = parser.parse_literal_option({1}, {2})', ok, self.constant(lexeme), parent)
+        elif isinstance(lexeme, Option):
+            char = self.var('char')
+            self.emit(indent, '{0} = parser.peek()', char)
+            self.emit(indent, 'while True:')
+            self.loops += 1
+            alts = lexeme.alts if lexeme.alts is not None else range(len(lexeme.value))
+            for alt, option in zip(alts, lexeme.value):
+                inner = indent + 1
+                guard = self.guard(option)
+                if guard is not None:
+                    self.emit(inner, 'if {0} not in {1}:', char, guard)
+                    self.emit(inner + 1, 'if parser.cursor >= parser.farthest:')
+                    self.emit(inner + 2, 'parser.fail({0})', self.skipped(option))
+                    self.emit(inner, 'else:')
+                    inner += 1
+                self.emit(inner, 'parser.push_state()')
+                result = self.lexeme(option, parent, inner)
+                self.emit(inner, 'if {0}:', result)
+                self.emit(inner + 1, 'parser.drop_state()')
+                self.emit(inner + 1, 'parser.set_alt({0}, {1})', parent, alt)
+                self.emit(inner + 1, '{0} = True', ok)
+                self.emit(inner + 1, 'break')
+                self.emit(inner, 'parser.pop_state()')
+                if isinstance(option, Concat) and option.cut is not None:
+                    # failed past its cut, the other alternatives are never tried
+                    self.emit(inner, 'if {0} is None:', result)
+                    self.emit(inner + 1, '{0} = False', ok)
+                    self.emit(inner + 1, 'break')
+            self.loops -= 1
+            self.emit(indent + 1, '{0} = False', ok)
+            self.emit(indent + 1, 'break')
+        elif isinstance(lexeme, Concat):
+            mark = self.var('mark')
+            self.emit(indent, 'parser.push_state()')
+            self.emit(indent, '{0} = parser.mark({1})', mark, parent)
+            self.emit(indent, 'while True:')
+            self.loops += 1
+            for idx, child in enumerate(lexeme.value):
+                result = self.lexeme(child, parent, indent + 1)
+                self.emit(indent + 1, 'if not {0}:', result)
+                self.emit(indent + 2, 'parser.pop_state()')
+                self.emit(indent + 2, 'parser.release({0}, {1})', parent, mark)
+                if lexeme.cut is None or idx < lexeme.cut:
+                    self.emit(indent + 2, '{0} = False', ok)
+                else:
+                    # past the cut the concatenation fails with None, see table_descriptor.Concat
+                    self.emit(indent + 2, '{0} = {1}', ok, result if idx == lexeme.cut else None)
+                self.emit(indent + 2, 'break')
+            self.loops -= 1
+            self.emit(indent + 1, 'parser.drop_state()')
+            self.emit(indent + 1, '{0} = True', ok)
+            self.emit(indent + 1, 'break')
+        elif isinstance(lexeme, Optional):
+            result = self.lexeme(lexeme.value, parent, indent)
+            self.emit(indent, 'if not {0}:', result)
+            self.emit(indent + 1, 'parser.add_missing({0!r}, {1})', lexeme.value.type, parent)
+            self.emit(indent, 'else:')
+            self.emit(indent + 1, 'parser.set_matched({0})', parent)
+            self.emit(indent, '{0} = True', ok)
+        elif isinstance(lexeme, (Repeat, OptionalRepeat)):
+            node = self.var('node')
+            self.emit(indent, '{0} = parser.new_collector({1!r})', node, lexeme.value.type)
+            self.emit(indent, 'parser.push_state()')
+            self.emit(indent, 'while True:')
+            guard = self.guard(lexeme.value)
+            if guard is not None:
+                self.emit(indent + 1, 'if parser.peek() not in {0}:', guard)
+                self.emit(indent + 2, 'if parser.cursor >= parser.farthest:')
+                self.emit(indent + 3, 'parser.fail({0})', self.skipped(lexeme.value))
+                self.emit(indent + 2, 'break')
+            self.loops += 1
+            result = self.lexeme(lexeme.value, node, indent + 1)
+            self.loops -= 1
+            self.emit(indent + 1, 'if not {0}:', result)
+            self.emit(indent + 2, 'break')
+            self.emit(indent + 1, 'parser.drop_state()')
+            self.emit(indent + 1, 'parser.push_state()')
+            self.emit(indent, 'parser.pop_state()')
+            add = 'add_repeat' if isinstance(lexeme, Repeat) else 'add_optional_repeat'
+            self.emit(indent, '{0} = parser.{1}({2!r}, {3}, {4})', ok, add, lexeme.value.type, node, parent)
+        elif isinstance(lexeme, (PositiveLookahead, NegativeLookahead)):
+            node = self.var('node')
+            self.emit(indent, 'parser.push_state()')
+            self.emit(indent, '{0} = parser.new_dummy()', node)
+            result = self.lexeme(lexeme.value, node, indent)
+            self.emit(indent, 'parser.pop_state()')
+            if isinstance(lexeme, NegativeLookahead):
+                self.emit(indent, '{0} = not {1}', ok, result)
+            else:
+                self.emit(indent, '{0} = bool({1})', ok, result)
+        elif isinstance(lexeme, Rule):
+            return self.lexeme(lexeme.value, parent, indent)
+        elif isinstance(lexeme, EOF):
+            self.emit(indent, '{0} = parser.end or parser.fail({1})', ok, self.constant(lexeme))
+        elif isinstance(lexeme, Cut):
+            self.emit(indent, '{0} = parser.cut()', ok)
+        elif isinstance(lexeme, Abort):
+            self.emit(indent, 'parser.abort({0})', self.constant(lexeme))
+            self.emit(indent, '{0} = False', ok)
+        else:
+            self.emit(indent, 'raise RuntimeError({0!r})', 'unsupported lexeme {0}'.format(lexeme))
+        return ok
+
+
+def generate(action):
+    """
+    Returns the source of a parser module for the grammar of ActionBase subclass action.
+    """
+    Parser.check_action(action)
+    table = Parser.compile_grammar(action)
+    return Generator(table).generate(action.__name__, Parser.grammar_hash(action))
+
+
+def write(action, path):
+    """
+    Writes the parser module for ActionBase subclass action to path.
+    """
+    with open(path, 'w') as f:
+        f.write(generate(action))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python table_generator.py package.module.ActionClass output.py')
+        sys.exit(1)
+    module, _, name = sys.argv[1].rpartition('.')
+    write(getattr(__import__(module, fromlist=[name]), name), sys.argv[2])
@@ -1,133 +1,404 @@
+import re
+import copy
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+
 from ast import AST
+from action import Binding
+from arena import Arena, encode, decode
+from error import ParseError
+from first_sets import first_terminals, guards
+from grammar_optimizer import optimize
+from memo import Memo
+from profiler import Profile, Recorder
+from push_parser import PushParser
+from scanner import Scanner
 from table_descriptor import *
+import table_compiler
+import table_vm
+
+
+# text skipped after every terminal unless the skip option or a grammar skip rule says otherwise
+SKIP = r'[ \t\r\n]'
 
 
 class Parser:
+    """
+    Parser for a grammar table.  Nothing set up by __init__ changes afterwards - each parse runs in a
+    context of its own holding the cursor, line and memo - so one parser can be used by any number of
+    threads at once.  Nodes are built from a subclass of the action class node bound to the table,
+    the action class itself is left untouched.
+    """
 
     def __init__(self, table, node, **options):
-        self.code = ""
-        self.lines = []
-        self.cursor = 0
-        self.line = 1
-        self.line_pos = 0
-        self._state = []
+        self.options = options
+        self.entry = options.get('entry', 'expr')
+        self.memoize = options.get('memoize', False)
+        self.memo_size = options.get('memo_size', 65536)
+        # rule statistics of every parse, see profiler
+        self.profile = Profile() if options.get('profile') else None
+        self.recorder = None
+        # what the optimize option rewrote, see grammar_optimizer
+        self.optimizations = None
+        if options.get('optimize'):
+            table, self.optimizations = optimize(table, options.get('entry'))
+        self.table = table
+        self.binding = Binding(node, table, options.get('ast_node', AST))
+        self.node = self.binding.node_class
+        # shared by every optional lexeme that did not match
+        self.empty = self.node(type='empty', value=False)
 
-        self.last_match = ''
-        self.last_pos = 0
-        self.last_line = 0
+        skip = options.get('skip')
+        if skip is None:
+            rule = self.table.get('skip')
+            skip = rule.value.value if rule is not None and isinstance(rule.value, Regex) else SKIP
+        # a single match consumes a whole run of skipped text
+        self.skip = re.compile('(?:{0})*'.format(skip))
+        # tokenises each input up front for the tokens option, see scanner
+        self.scanner = Scanner(self.table, self.skip) if options.get('tokens') else None
 
-        self.end = False
+        # first character sets of the lexemes options and repetitions can skip, generated rule
+        # functions have theirs built in
+        self.guards = {} if 'rules' in options else guards(self.table)
 
-        self.entry = options.get('entry', 'expr')
-        self.node = node
-        self.table = table
-        self.node.table = self.table
-        self.node.ast_node = options.get('ast_node', AST)
+        self.engine = options.get('engine', 'interpreter')
+        if 'rules' in options:
+            # rule functions compiled ahead of time by table_generator
+            self.engine = 'generated'
+            self.rules = options['rules']
+        elif self.engine == 'closure':
+            self.rules = table_compiler.compile_table(self.table, self.guards)
+        elif self.engine == 'vm':
+            self.rules = table_vm.compile_table(self.table, self.guards, self.profile is not None)
+        elif self.engine == 'interpreter':
+            self.rules = None
+        else:
+            raise ValueError('engine must be interpreter, closure or vm')
+
+    def context(self):
+        """Returns the parser to hold the state of a parse, a copy sharing the grammar and options"""
+        context = copy.copy(self)
+        if self.scanner is not None:
+            context.parse_literal = context.scan_literal
+            context.parse_regex = context.scan_regex
+        if self.profile is not None:
+            context.instrument()
+        return context
+
+    def instrument(self, allocated=None):
+        """
+        Hooks a profiler.Recorder into this context, recording the rules it parses until they are
+        added to the profile by record_profile.  Parsers without the profile option are never hooked.
+        """
+        recorder = self.recorder = Recorder(self, allocated)
+        if allocated is None:
+            node = self.node
+
+            def count_node(**fields):
+                recorder.nodes += 1
+                return node(**fields)
+            self.node = count_node
+        pop_state = self.pop_state
+
+        def profiled_pop_state():
+            recorder.backtrack()
+            return pop_state()
+        self.pop_state = profiled_pop_state
+        if self.engine != 'vm':
+            # the vm records its rule calls itself
+            apply_rule = self.apply_rule
+
+            def profiled_apply_rule(name, parse, lexeme, parent):
+                return apply_rule(name, recorder.body(name, parse), lexeme, parent)
+            self.apply_rule = profiled_apply_rule
+
+    def record_profile(self):
+        """Adds the rules recorded by this context to the parser's profile"""
+        if self.recorder is not None:
+            self.profile.merge(self.recorder)
 
     def initialise(self, code):
         self.code = code + '$'
-        self.lines = self.code.split('\n')
         self.cursor = 0
         self.line = 1
         self.line_pos = 0
         self._state = []
 
-        self.last_match = ''
-        self.last_pos = 0
-        self.last_line = 0
+        # the offset of the farthest failure and the lexemes that failed or were skipped there
+        self.farthest = -1
+        self.expected = []
 
         self.end = False
 
+        self.memo = Memo(self.memo_size) if self.memoize else None
+        self.tokens = self.scanner.tokenise(self.code) if self.scanner is not None else None
+
     def advance(self, amount):
-        self.cursor += amount
-        self.line_pos += amount
-        if self.code[self.cursor] in ' \r\n\t':
-            if self.code[self.cursor] == '\n':
-                self.line += 1
-                self.line_pos = 1
-            self.advance(1)
-        if self.cursor >= len(self.code) - 1:
+        """
+        Moves the cursor past amount matched characters and any skipped text after them, counting the
+        lines of the whole span at once
+        """
+        cursor = self.cursor
+        end = self.skip.match(self.code, cursor + amount).end()
+        newlines = self.code.count('\n', cursor, end)
+        if newlines:
+            self.line += newlines
+            self.line_pos = end - self.code.rfind('\n', cursor, end) - 1
+        else:
+            self.line_pos += end - cursor
+        self.cursor = end
+        if end >= len(self.code) - 1:
             self.end = True
 
+    def peek(self):
+        """Returns the next input character, the engines skip lexemes whose guard rules it out"""
+        return self.code[self.cursor:self.cursor + 1]
+
     def push_state(self):
-        self._state.append(self.cursor)
+        self._state.append((self.cursor, self.line, self.line_pos, self.end))
         return True
 
     def pop_state(self):
-        self.cursor = self._state.pop()
+        self.cursor, self.line, self.line_pos, self.end = self._state.pop()
+        return True
+
+    def drop_state(self):
+        self._state.pop()
         return True
 
     def parse_literal(self, literal, parent):
-        if self.code[self.cursor:].startswith(literal.value):
-            parent.add_child(self.node(type='literal', value=literal.value, leaf=True, line=self.line,
-                                       linepos=self.line_pos - len(literal.value)))
+        if self.code.startswith(literal.value, self.cursor):
+            self.add_leaf('literal', literal.value, parent)
             self.advance(len(literal.value))
-            self.last_match = literal.value
-            self.last_pos = self.line_pos - len(literal.value)
-            self.last_line = self.line
             return True
+        if self.cursor >= self.farthest:
+            self.fail(literal)
         return False
 
     def parse_regex(self, regex, parent):
-        matchobj = regex.re.match(self.code[self.cursor:])
+        matchobj = regex.re.match(self.code, self.cursor)
         if matchobj:
             match = matchobj.group()
-            parent.add_child(self.node(type='regex', value=match, leaf=True, line=self.line, linepos=self.line_pos))
+            self.add_leaf('regex', match, parent)
             self.advance(len(match))
-            self.last_match = match
-            self.last_pos = self.line_pos - len(match)
-            self.last_line = self.line
             return True
+        if self.cursor >= self.farthest:
+            self.fail(regex)
         return False
 
-    def parse_ident(self, ident, parent):
-        rule = self.table[ident.value]
-        node = self.node(type=ident.value, line=self.line, linepos=self.line_pos)
-        if self.parse_lexeme(rule, node):
-            parent.add_child(node)
-            return True
+    def scan_literal(self, literal, parent):
+        """parse_literal for the tokens option, matching the token at the cursor"""
+        tokens = self.tokens
+        index = tokens.index[self.cursor]
+        if tokens.kinds[index] != self.scanner.literals.get(literal.value):
+            if self.cursor >= self.farthest:
+                self.fail(literal)
+            return False
+        self.add_leaf('literal', literal.value, parent)
+        self.next_token(index + 1)
+        return True
+
+    def scan_regex(self, regex, parent):
+        """parse_regex for the tokens option, matching the token at the cursor"""
+        tokens = self.tokens
+        scanner = self.scanner
+        index = tokens.index[self.cursor]
+        kind = tokens.kinds[index]
+        id = scanner.regexes.get(regex.value)
+        if kind == id or kind >= scanner.count and id in tokens.ties[kind - scanner.count]:
+            match = self.code[self.cursor:self.cursor + tokens.lengths[index]]
+        elif regex.value in scanner.nullable and regex.re.match(self.code, self.cursor, self.cursor):
+            # no token of its own starts here, but it can match nothing
+            match = ''
+        else:
+            if self.cursor >= self.farthest:
+                self.fail(regex)
+            return False
+        self.add_leaf('regex', match, parent)
+        if match:
+            self.next_token(index + 1)
+        return True
+
+    def fail(self, lexeme):
+        """
+        Records that lexeme failed, or was skipped by its guard, at the cursor when no failure so far
+        got further.  The engines only call it when the cursor is at least self.farthest, so failures
+        behind the farthest one cost a comparison.  Returns False.
+        """
+        if self.cursor > self.farthest:
+            self.farthest = self.cursor
+            self.expected = [lexeme]
+        elif self.cursor == self.farthest:
+            self.expected.append(lexeme)
         return False
 
-    def parse_subexpr(self, subexpr, parent):
-        node = self.node(type='subexpr', line=self.line, linepos=self.line_pos)
-        if self.parse_lexeme(subexpr.value, node):
-            parent.add_child(node)
+    def error(self):
+        """Returns the error.ParseError describing the farthest failure of the parse"""
+        # the farthest failure is never behind the state a failed parse restores
+        offset = max(self.farthest, self.cursor)
+        line, pos = self.line, self.line_pos
+        newlines = self.code.count('\n', self.cursor, offset)
+        if newlines:
+            line += newlines
+            pos = offset - self.code.rfind('\n', self.cursor, offset) - 1
+        else:
+            pos += offset - self.cursor
+        expected = []
+        for lexeme in self.expected:
+            for terminal in first_terminals(lexeme, self.table):
+                if isinstance(terminal, Literal):
+                    name = "'{0}'".format(terminal.value)
+                elif isinstance(terminal, Regex):
+                    name = '/{0}/'.format(terminal.value)
+                else:
+                    name = 'end of input'
+                if name not in expected:
+                    expected.append(name)
+        end = self.code.find('\n', offset)
+        text = self.code[offset - pos:end if end != -1 else len(self.code) - 1]
+        return ParseError(offset, line, pos, expected, text)
+
+    def next_token(self, index):
+        """Moves the cursor to token index, the skipped text before it already passed"""
+        tokens = self.tokens
+        self.cursor = tokens.starts[index]
+        self.line = tokens.lines[index]
+        self.line_pos = tokens.positions[index]
+        self.end = self.cursor >= len(self.code) - 1
+
+    def parse_ident(self, ident, parent):
+        return self.apply_rule(ident.value, self.parse_lexeme, self.table[ident.value], parent)
+
+    def apply_rule(self, name, parse, lexeme, parent):
+        """
+        Parses rule name into a new node and attaches it to parent on success.  The rule body is parsed
+        by calling parse(lexeme, node) - the interpreter passes parse_lexeme and the rule descriptor,
+        compiled engines pass the rule's compiled body and the parser.
+        """
+        if self.memo is not None:
+            return self.apply_memo_rule(name, parse, lexeme, parent)
+        node = self.new_node(name)
+        if parse(lexeme, node):
+            self.attach(parent, node)
             return True
+        self.discard(node)
         return False
 
-    def parse_optional(self, optional, parent):
-        if not self.parse_lexeme(optional.value, parent):
-            node = self.node(type=optional.value.type, alt=1, match=False, line=self.line, linepos=self.line_pos)
-            empty = self.node(type='empty', value=False)
-            node.add_child(empty)
-            parent.add_child(node)
+    def apply_memo_rule(self, name, parse, lexeme, parent):
+        key = (name, self.cursor)
+        matched = self.recall(key, parent)
+        if matched is None:
+            node = self.new_node(name)
+            # a body failing past a cut fails like any other, cuts only stop the options of their rule
+            matched = parse(lexeme, node) or False
+            self.remember(key, matched, node, parent)
+        return matched
+
+    def recall(self, key, parent):
+        """
+        Replays the memo entry for key, a (rule name, cursor) pair, attaching its node to parent when
+        it matched.  Returns whether the rule matched, None when there is no entry.
+        """
+        entry = self.memo.get(key)
+        if entry is None:
+            return None
+        if entry[0]:
+            self.cursor, self.line, self.line_pos, self.end = entry[1:5]
+            self.attach(parent, self.replay(entry[5]))
+        return entry[0]
+
+    def remember(self, key, matched, node, parent):
+        """Stores the outcome of parsing a rule into node, attaching node to parent when it matched"""
+        if matched:
+            self.memo.put(key, (True, self.cursor, self.line, self.line_pos, self.end, node))
+            self.attach(parent, self.replay(node))
         else:
-            parent.children[-1].alt = 0
-            parent.children[-1].match = True
+            self.memo.put(key, (False, None, None, None, None, None))
+
+    #===========================================================================
+    #
+    #   tree building - shared by the interpreter and the compiled engines
+    #
+    #===========================================================================
+
+    def new_node(self, type):
+        return self.node(type=type, line=self.line, linepos=self.line_pos)
+
+    def attach(self, parent, child):
+        parent.add_child(child)
+
+    def add_leaf(self, type, value, parent):
+        """Adds the text matched by a terminal, called before the cursor moves past it"""
+        parent.add_child(self.node(type=type, value=value, leaf=True, line=self.line, linepos=self.line_pos))
+
+    def set_alt(self, parent, alt):
+        parent.alt = alt
+
+    def add_empty(self, parent):
+        parent.add_child(self.node(type='empty', value=False, line=self.line, linepos=self.line_pos))
         return True
 
-    def parse_repeat(self, repeat, parent):
-        node = self.node(type=repeat.value.type, line=self.line, linepos=self.line_pos)
-        self.push_state()
-        while self.parse_lexeme(repeat.value, node):
-            self.push_state()
-        self.pop_state()
+    def add_missing(self, type, parent):
+        """Records an optional lexeme that did not match"""
+        node = self.node(type=type, alt=1, match=False, line=self.line, linepos=self.line_pos)
+        node.add_child(self.empty)
+        parent.add_child(node)
+
+    def set_matched(self, parent):
+        """Records an optional lexeme that matched"""
+        if self.memo is not None:
+            # the child may be the node of a memoized rule, replayed wherever the rule matches at the
+            # same place again - only this use of it is marked
+            self.copy_last(parent)
+        parent.children[-1].alt = 0
+        parent.children[-1].match = True
+
+    def copy_last(self, parent):
+        """Replaces the last child of parent with a shallow copy"""
+        parent.children[-1] = copy.copy(parent.children[-1])
+        parent._index = None
+
+    def replay(self, node):
+        """Returns the node of a memoized rule to attach where the rule matched"""
+        return node
+
+    def mark(self, parent):
+        """
+        Returns a mark of the children and repetitions of parent, taken along with the parser state
+        when a concatenation starts.  Concatenations are the only lexemes that can add to parent and
+        still fail, every other lexeme adds nothing unless it matches.
+        """
+        return len(parent.children), len(parent._sets) if parent._sets else 0
+
+    def release(self, parent, mark):
+        """Drops the children and repetitions added to parent since mark, the concatenation failed"""
+        children, sets = mark
+        if len(parent.children) > children:
+            del parent.children[children:]
+            parent._index = None
+        if parent._sets and len(parent._sets) > sets:
+            del parent._sets[sets:]
+
+    def discard(self, node):
+        """Drops the node of a rule that failed, memoized rules keep theirs in the memo"""
+
+    def new_collector(self, type):
+        """Returns a node to collect the items of a repetition"""
+        return self.node(type=type, line=self.line, linepos=self.line_pos)
+
+    def add_repeat(self, type, node, parent):
         if not node.children:
             return False
         parent.count = len(node.children)
-        setattr(parent, parent.unique_id(repeat.value.type + '_set'), node.children)
+        parent.add_set(type, node.children)
         for child in node.children:
             parent.add_child(child)
         return True
 
-    def parse_optional_repeat(self, repeat, parent):
-        node = self.node(type=repeat.value.type, line=self.line, linepos=self.line_pos)
-        self.push_state()
-        while self.parse_lexeme(repeat.value, node):
-            self.push_state()
-        self.pop_state()
+    def add_optional_repeat(self, type, node, parent):
         parent.count = len(node.children)
-        setattr(parent, parent.unique_id(repeat.value.type + '_set'), node.children)
+        parent.add_set(type, node.children)
         if not node.children:
             empty = self.node(type='empty', value=False, line=self.line, linepos=self.line_pos)
             parent.alt = 1
@@ -138,9 +409,91 @@ class Parser:
             parent.add_child(child)
         return True
 
+    def new_dummy(self):
+        """Returns a throwaway parent for lookahead matches"""
+        return self.node(type='dummy')
+
+    def collected(self, collector):
+        """Returns the list of nodes added to a collector"""
+        return collector.children
+
+    def new_binary(self, type, left, operator, right):
+        """Returns a node for the binary operation left operator right"""
+        node = self.node(type=type, line=left.line, linepos=left.linepos)
+        node.add_child(left)
+        node.add_child(operator)
+        node.add_child(right)
+        return node
+
+    def cut(self):
+        """
+        Passes a cut, which always matches.  The parser never backtracks behind the oldest state it
+        has saved, so with memoize the memo entries before it are dropped - for a repetition of items
+        committed by cuts the memo holds little more than the entries of the item being parsed.
+        """
+        if self.memo is not None:
+            self.memo.release(self._state[0][0] if self._state else self.cursor)
+        return True
+
+    def abort(self, lexeme):
+        raise SyntaxError('{0}\nLine: {1}, Pos: {2}\n{3}\n{4}'.format(lexeme.value, self.line, self.line_pos,
+                                                                      self.current_line(), self.line_pos * ' ' + '^'))
+
+    def current_line(self):
+        start = self.code.rfind('\n', 0, self.cursor) + 1
+        end = self.code.find('\n', self.cursor)
+        # the input ends with a character the parser added
+        return self.code[start:end if end != -1 else len(self.code) - 1]
+
+    def parse_subexpr(self, subexpr, parent):
+        node = self.node(type='subexpr', line=self.line, linepos=self.line_pos)
+        if self.parse_lexeme(subexpr.value, node):
+            parent.add_child(node)
+            return True
+        return False
+
+    def parse_optional(self, optional, parent):
+        if not self.parse_lexeme(optional.value, parent):
+            self.add_missing(optional.value.type, parent)
+        else:
+            self.set_matched(parent)
+        return True
+
+    def parse_repeat(self, repeat, parent):
+        node = self.new_collector(repeat.value.type)
+        guard = self.guards.get(id(repeat.value))
+        self.push_state()
+        while True:
+            if guard is not None and self.peek() not in guard:
+                if self.cursor >= self.farthest:
+                    self.fail(repeat.value)
+                break
+            if not self.parse_lexeme(repeat.value, node):
+                break
+            self.drop_state()
+            self.push_state()
+        self.pop_state()
+        return self.add_repeat(repeat.value.type, node, parent)
+
+    def parse_optional_repeat(self, repeat, parent):
+        node = self.new_collector(repeat.value.type)
+        guard = self.guards.get(id(repeat.value))
+        self.push_state()
+        while True:
+            if guard is not None and self.peek() not in guard:
+                if self.cursor >= self.farthest:
+                    self.fail(repeat.value)
+                break
+            if not self.parse_lexeme(repeat.value, node):
+                break
+            self.drop_state()
+            self.push_state()
+        self.pop_state()
+        return self.add_optional_repeat(repeat.value.type, node, parent)
+
     def parse_positive_lookahead(self, lookahead, parent):
         self.push_state()
-        dummy = self.node(type='dummy')
+        dummy = self.new_dummy()
         if self.parse_lexeme(lookahead.value, dummy):
             self.pop_state()
             return True
@@ -149,28 +502,111 @@ class Parser:
 
     def parse_negative_lookahead(self, lookahead, parent):
         self.push_state()
-        dummy = self.node(type='dummy')
+        dummy = self.new_dummy()
         if not self.parse_lexeme(lookahead.value, dummy):
             self.pop_state()
             return True
         self.pop_state()
         return False
 
+    def parse_precedence(self, precedence, parent):
+        name = precedence.value.value
+        return self.climb(precedence, self.parse_lexeme, self.table[name], parent)
+
+    def climb(self, precedence, parse, lexeme, parent):
+        """
+        Parses the binary operators of a precedence lexeme over operands of its operand rule, whose
+        body is parsed by calling parse(lexeme, node) as in apply_rule.  Each operator becomes a node of
+        the rule's type holding the left operand, the operator leaf and the right operand, the tightest
+        binding operators deepest; the outermost operation is added straight to parent.  Operands and
+        pending operators are kept on stacks so any number of operators parse in one loop.
+        """
+        name = precedence.value.value
+        collector = self.new_collector(precedence.name)
+        items = self.collected(collector)
+        if not self.apply_rule(name, parse, lexeme, collector):
+            return False
+        operands = [items[-1]]
+        # pending operators as (level, operator leaf)
+        operators = []
+        while True:
+            self.push_state()
+            count = len(items)
+            for literal, level, right in precedence.operators:
+                if self.parse_literal(literal, collector):
+                    break
+            else:
+                self.pop_state()
+                break
+            if not self.apply_rule(name, parse, lexeme, collector):
+                # an operator without a right operand is left to whatever follows the rule
+                self.pop_state()
+                del items[count:]
+                break
+            self.drop_state()
+            while operators and (operators[-1][0] > level or operators[-1][0] == level and not right):
+                self.reduce(precedence.name, operands, operators)
+            operators.append((level, items[-2]))
+            operands.append(items[-1])
+        while len(operators) > 1:
+            self.reduce(precedence.name, operands, operators)
+        if operators:
+            self.attach(parent, operands[0])
+            self.attach(parent, operators[0][1])
+            self.attach(parent, operands[1])
+        else:
+            self.attach(parent, operands[0])
+        return True
+
+    def reduce(self, type, operands, operators):
+        right = operands.pop()
+        operands.append(self.new_binary(type, operands.pop(), operators.pop()[1], right))
+
     def parse_option(self, option, parent):
+        char = self.peek()
+        guards = self.guards
+        alts = option.alts
         for idx, option in enumerate(option.value):
+            guard = guards.get(id(option))
+            if guard is not None and char not in guard:
+                # cannot start with the next character, skipped without a failed descent
+                if self.cursor >= self.farthest:
+                    self.fail(option)
+                continue
             self.push_state()
-            if self.parse_lexeme(option, parent):
-                parent.alt = idx
+            matched = self.parse_lexeme(option, parent)
+            if matched:
+                self.drop_state()
+                self.set_alt(parent, idx if alts is None else alts[idx])
                 return True
             self.pop_state()
+            if matched is None:
+                # the alternative failed past its cut, the others are never tried
+                return False
+        return False
+
+    def parse_literal_option(self, option, parent):
+        # a literal that fails leaves the state as it was, there is nothing to restore
+        for literal, alt in option.first.get(self.peek(), ()):
+            if self.parse_literal(literal, parent):
+                self.set_alt(parent, alt)
+                return True
+        if self.cursor >= self.farthest:
+            self.fail(option)
         return False
 
     def parse_concat(self, concat, parent):
         self.push_state()
+        mark = self.mark(parent)
+        cut = concat.cut
         for idx, lexeme in enumerate(concat.value):
-            if not self.parse_lexeme(lexeme, parent):
+            matched = self.parse_lexeme(lexeme, parent)
+            if not matched:
                 self.pop_state()
-                return False
+                self.release(parent, mark)
+                # only the child at the cut can fail with None, see table_descriptor.Concat
+                return None if cut is not None and idx > cut else matched
+        self.drop_state()
         return True
 
     def parse_rule(self, rule, parent):
@@ -178,8 +614,7 @@ class Parser:
 
     def parse_lexeme(self, lexeme, parent):
         if isinstance(lexeme, Empty):
-            parent.add_child(self.node(type='empty', value=False, line=self.line, linepos=self.line_pos))
-            return True
+            return self.add_empty(parent)
         elif isinstance(lexeme, Literal):
             return self.parse_literal(lexeme, parent)
         elif isinstance(lexeme, Regex):
@@ -188,6 +623,10 @@ class Parser:
             return self.parse_ident(lexeme, parent)
         elif isinstance(lexeme, Option):
             return self.parse_option(lexeme, parent)
+        elif isinstance(lexeme, LiteralOption):
+            return self.parse_literal_option(lexeme, parent)
+        elif isinstance(lexeme, Precedence):
+            return self.parse_precedence(lexeme, parent)
         elif isinstance(lexeme, Concat):
             return self.parse_concat(lexeme, parent)
         elif isinstance(lexeme, Optional):
@@ -203,22 +642,314 @@ class Parser:
         elif isinstance(lexeme, Rule):
             return self.parse_rule(lexeme, parent)
         elif isinstance(lexeme, EOF):
-            return self.end
+            return self.end or self.fail(lexeme)
+        elif isinstance(lexeme, Cut):
+            return self.cut()
         elif isinstance(lexeme, Abort):
-            raise SyntaxError('{0}\nLine: {1}, Pos: {2}\n{3}\n{4}'.format(lexeme.msg, self.line, self.line_pos,
-                                                                          self.lines[self.line - 1],
-                                                                          self.line_pos * ' ' + '^'))
+            self.abort(lexeme)
         else:
             print('lexeme', lexeme, type(lexeme))
             raise RuntimeError
 
-    def parse(self, code, rule=None):
-        self.initialise(code)
+    def entry_rule(self, rule):
         if not rule:
             if not self.entry:
                 raise ValueError('Expected rule or grammar entry directive set')
             rule = self.entry
-        node = self.node(type=rule)
-        if self.parse_lexeme(self.table[rule], node):
-            return node
-        return False
+        if rule not in self.table:
+            removed = '{0}: removed, unreachable from {1}'.format(rule, self.entry)
+            if self.optimizations is not None and removed in self.optimizations:
+                raise ValueError('rule {0} was removed by optimize, it is unreachable from entry {1}'.format(
+                    rule, self.entry))
+            raise ValueError('grammar has no rule {0}'.format(rule))
+        return rule
+
+    def parse(self, code, rule=None):
+        return self.context().run(code, rule)
+
+    def run(self, code, rule=None):
+        self.initialise(code)
+        self.advance(0)
+        rule = self.entry_rule(rule)
+        node = self.new_node(rule)
+        if self.rules is not None:
+            parse, lexeme = self.rules[rule], self
+        else:
+            parse, lexeme = self.parse_lexeme, self.table[rule]
+        if self.recorder is not None:
+            if self.engine != 'vm':
+                parse = self.recorder.body(rule, parse)
+            try:
+                matched = parse(lexeme, node)
+            finally:
+                self.record_profile()
+        else:
+            matched = parse(lexeme, node)
+        if matched:
+            return self.finish(node)
+        return self.error()
+
+    def finish(self, root):
+        """Returns the result of a successful parse from its root node"""
+        return root
+
+    def parse_many(self, inputs, rule=None, workers=None, mode='process', ordered=True, chunksize=1):
+        """
+        Parses every input in inputs with a pool of workers parsers, one per CPU when workers is None,
+        running in processes (mode='process') or threads (mode='thread').  Each process builds its
+        parser once from this parser's grammar table and options, threads all use this parser.  Results
+        are yielded as they arrive - in input order, or as (index, result) pairs in completion order
+        when ordered is False.
+
+        Process workers send each CST back as an arena, a handful of strings however large the tree, so
+        their results are read only arena node views.
+        """
+        rule = self.entry_rule(rule)
+        options = dict(self.options)
+        if mode == 'process':
+            options['tree'] = 'arena'
+            # a worker's profile would stay in the worker
+            options.pop('profile', None)
+            pool = multiprocessing.Pool(workers, start_worker, (self.table, self.binding.action, options))
+        elif mode == 'thread':
+            # parses run in contexts of their own, the threads share this parser
+            pool = ThreadPool(workers, share_parser, (self,))
+        else:
+            raise ValueError('mode must be either process or thread')
+        try:
+            jobs = ((index, code, rule) for index, code in enumerate(inputs))
+            if ordered:
+                results = pool.imap(parse_job, jobs, chunksize)
+            else:
+                results = pool.imap_unordered(parse_job, jobs, chunksize)
+            for index, result in results:
+                if mode == 'process' and result:
+                    arena = decode(result, self.binding)
+                    result = arena.view(arena.root)
+                yield result if ordered else (index, result)
+        finally:
+            pool.terminate()
+
+    def iterparse(self, fileobj, rule=None, chunk_size=65536):
+        """
+        Parses rule, whose body must be a repetition such as statement_list = *statement, from the file
+        like fileobj and yields each item of the repetition as soon as it has been parsed.  The input is
+        read chunk_size characters at a time and pushed to a push_parser.PushParser, so neither the
+        items nor the input they were parsed from are kept and memory does not grow with the input.
+
+        An item is accepted once its parse did not look past the input read so far, see PushParser.
+        Raises SyntaxError when input is left that is not an item.
+        """
+        push = self.push_parser(rule, chunk_size)
+        while True:
+            data = fileobj.read(chunk_size)
+            if data:
+                push.feed(data)
+            else:
+                push.close()
+            for item in push:
+                yield item
+            if not data:
+                break
+
+    def push_parser(self, rule=None, chunk_size=65536):
+        """Returns a push_parser.PushParser for rule, fed the input as it arrives"""
+        if self.scanner is not None:
+            raise ValueError('push parsing reads the input as it arrives, it is not supported with tokens')
+        return PushParser(self, rule, chunk_size)
+
+
+class ArenaParser(Parser):
+    """
+    Parser building the CST into an arena.Arena instead of one node object per CST node.  Nodes are
+    arena indexes while parsing; repetition collectors and lookahead dummies are plain lists as their
+    own fields are discarded anyway.  parse returns a view of the root node.
+
+    With the parse_cache option, a parse_cache.ParseCache, trees of input parsed before are taken
+    from the cache.
+    """
+
+    def __init__(self, table, node, **options):
+        Parser.__init__(self, table, node, **options)
+        self.parse_cache = options.get('parse_cache')
+        # what identifies the trees of this parser in the cache
+        self.grammar_key = self.parse_cache.grammar_key(self) if self.parse_cache is not None else None
+
+    def parse(self, code, rule=None):
+        if self.parse_cache is not None:
+            return self.parse_cache.parse(self, code, rule)
+        return Parser.parse(self, code, rule)
+
+    def initialise(self, code):
+        Parser.initialise(self, code)
+        self.arena = Arena(self.code, self.binding)
+        # nodes dropped from the end of the arena by failed concatenations
+        self.released = 0
+
+    def instrument(self, allocated=None):
+        # every node is allocated in the arena
+        Parser.instrument(self, lambda: len(self.arena) + self.released)
+
+    def new_node(self, type):
+        return self.arena.new(type, Arena.RULE, self.cursor)
+
+    def attach(self, parent, child):
+        arena = self.arena
+        if arena.end[child] == -1:
+            arena.end[child] = self.cursor
+        if parent.__class__ is list:
+            parent.append(child)
+            return child
+        return arena.attach(parent, child)
+
+    def add_leaf(self, type, value, parent):
+        self.attach(parent, self.arena.new(type, Arena.LEAF, self.cursor, self.cursor + len(value)))
+
+    def set_alt(self, parent, alt):
+        if parent.__class__ is not list:
+            self.arena.alt[parent] = alt
+
+    def add_empty(self, parent):
+        self.attach(parent, self.arena.new('empty', Arena.EMPTY, self.cursor, self.cursor))
+        return True
+
+    def add_missing(self, type, parent):
+        arena = self.arena
+        node = arena.new(type, Arena.RULE, self.cursor, self.cursor)
+        arena.alt[node] = 1
+        arena.match[node] = 0
+        self.add_empty(node)
+        self.attach(parent, node)
+
+    def replay(self, node):
+        # the memo keeps a node that is never attached, every use of it attaching a copy that
+        # set_matched can mark
+        return self.arena.copy(node)
+
+    def set_matched(self, parent):
+        arena = self.arena
+        last = parent[-1] if parent.__class__ is list else arena.last_child[parent]
+        arena.alt[last] = 0
+        arena.match[last] = 1
+
+    def mark(self, parent):
+        arena = self.arena
+        if parent.__class__ is list:
+            return len(arena), len(arena.set_type), len(parent), -1
+        return len(arena), len(arena.set_type), arena.last_child[parent], arena.sets[parent]
+
+    def release(self, parent, mark):
+        arena = self.arena
+        nodes, sets, last, first_set = mark
+        if parent.__class__ is list:
+            del parent[last:]
+        else:
+            arena.last_child[parent] = last
+            if last == -1:
+                arena.first_child[parent] = -1
+            else:
+                arena.next_sibling[last] = -1
+            arena.sets[parent] = first_set
+        if self.memo is None:
+            # only the failed concatenation refers to the nodes allocated since the mark, memoized
+            # nodes outlive it
+            self.released += len(arena) - nodes
+            arena.truncate(nodes, sets)
+
+    def discard(self, node):
+        if self.memo is None:
+            # the node was never attached, every node allocated since belongs to it
+            self.released += len(self.arena) - node
+            self.arena.truncate(node)
+
+    def new_collector(self, type):
+        return []
+
+    def add_repeat(self, type, node, parent):
+        if not node:
+            return False
+        self.add_items(type, node, parent)
+        return True
+
+    def add_optional_repeat(self, type, node, parent):
+        if not node:
+            self.set_alt(parent, 1)
+            self.add_empty(parent)
+            if parent.__class__ is not list:
+                self.arena.add_set(parent, type, -1, 0)
+            return True
+        self.set_alt(parent, 0)
+        self.add_items(type, node, parent)
+        return True
+
+    def add_items(self, type, items, parent):
+        if parent.__class__ is list:
+            parent.extend(items)
+            return
+        first = self.attach(parent, items[0])
+        for child in items[1:]:
+            self.attach(parent, child)
+        self.arena.add_set(parent, type, first, len(items))
+
+    def new_dummy(self):
+        return []
+
+    def collected(self, collector):
+        return collector
+
+    def new_binary(self, type, left, operator, right):
+        arena = self.arena
+        node = arena.new(type, Arena.RULE, arena.start[left], arena.end[right])
+        arena.attach(node, left)
+        arena.attach(node, operator)
+        arena.attach(node, right)
+        return node
+
+    def iterparse(self, fileobj, rule=None, chunk_size=65536):
+        raise ValueError('iterparse builds node objects, it is not supported with tree=arena')
+
+    def push_parser(self, rule=None, chunk_size=65536):
+        raise ValueError('push parsing builds node objects, it is not supported with tree=arena')
+
+    def finish(self, root):
+        self.arena.end[root] = self.cursor
+        self.arena.finish(root)
+        return self.arena.view(root)
+
+
+# the parser of each parse_many worker
+_worker = threading.local()
+
+
+def start_worker(table, node, options):
+    _worker.parser = create_parser(table, node, **options)
+    _worker.transfer = True
+
+
+def share_parser(parser):
+    _worker.parser = parser
+    _worker.transfer = False
+
+
+def parse_job(job):
+    index, code, rule = job
+    result = _worker.parser.parse(code, rule)
+    if _worker.transfer and result:
+        # the encoded arena is a single string however large the tree, and leaves out the binding
+        result = encode(result.arena)
+    return index, result
+
+
+def create_parser(table, node, **options):
+    """
+    Returns a parser for table building the CST selected by the tree option - 'objects' for a node
+    object per CST node or 'arena' for flat arrays with node views created on access.
+    """
+    tree = options.get('tree', 'objects')
+    if tree == 'objects':
+        if options.get('parse_cache') is not None:
+            raise ValueError('the parse cache stores arenas, it needs tree=arena')
+        return Parser(table, node, **options)
+    elif tree == 'arena':
+        return ArenaParser(table, node, **options)
+    raise ValueError('tree must be either objects or arena')
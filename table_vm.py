@@ -0,0 +1,405 @@
+"""
+Compiles a grammar descriptor table into a flat instruction array run by a single loop.
+
+Every rule body becomes a run of instructions ending in RETURN; lexemes leave whether they matched
+in a result register and control flow branches on it, so nothing recurses however deeply the input
+nests.  Backtrack points are the parser's own state stack - CHOICE saves the cursor, COMMIT drops
+the saved state and BACKTRACK restores it - and rule calls, repetitions, lookaheads and operator
+rules keep what they need to resume on an explicit frame stack.  Nesting is limited by memory
+rather than the Python stack.
+
+The tree is built through the parser exactly as table_parser.Parser.parse_* and the closure engine
+build it, so every engine produces the same CST.  Options and repetitions are guarded by the first
+character sets of first_sets.guards.
+
+Instructions are (opcode, a, b) tuples -
+
+    LITERAL lexeme          match a literal into the parent
+    REGEX lexeme            match a regular expression into the parent
+    LITERALS lexeme         match the first matching literal of a LiteralOption into the parent
+    EMPTY                   add an empty node
+    EOF lexeme              match the end of the input
+    ABORT lexeme            raise the abort's SyntaxError
+    UNSUPPORTED lexeme      raise RuntimeError for a lexeme no engine parses
+    UNDEFINED name          raise KeyError for an undefined rule
+    CALL name               parse rule name into a new node, replaying the memo when there is one
+    RETURN                  return from a rule, attaching its node when it matched
+    JUMP target
+    JUMP_IF_FALSE target
+    GUARD chars target      fail and jump to target unless the next character is in chars, recording
+                            the lexeme skipped in the program's skipped
+    CHOICE                  save the parser state
+    COMMIT                  drop the saved state
+    BACKTRACK               restore the saved state
+    MARK                    save the parser state and a mark of the parent's children
+    UNMARK                  drop the saved state and mark
+    RELEASE                 restore the saved state, dropping the children added since the mark
+    PRUNE                   set the result to None, the failure of a concatenation past its cut
+    PRUNED target           set the result to False and jump to target when it is None
+    CUT                     pass a cut
+    RECHOICE                drop the saved state and save the current one
+    FAIL                    set the result to False
+    SET_ALT idx             record the matching alternative of an option
+    OPTIONAL type           record an optional lexeme as matched or missing, always matches
+    COLLECT type            start collecting the items of a repetition
+    REPEAT type optional    end a repetition, adding its items to the parent
+    LOOK                    start a lookahead
+    LOOK_END negate         end a lookahead, restoring the parser state
+    PREC_BEGIN lexeme       start an operator rule, the operand is parsed into a collector
+    PREC_FIRST target       keep the first operand, jump to target when there is none
+    PREC_OPERATOR target    match an operator, jump to target when there is none
+    PREC_OPERAND target     keep an operand and its operator and jump back to target
+    PREC_END                add the operations to the parent
+    ENTER name              start recording a call of rule name in the parser's profiler.Recorder
+    EXIT                    end recording the call, only emitted when profiling
+"""
+
+from table_descriptor import *
+
+
+(LITERAL, REGEX, EMPTY, EOF_, ABORT, UNSUPPORTED, UNDEFINED, CALL, RETURN, JUMP, JUMP_IF_FALSE, GUARD, CHOICE, COMMIT,
+ BACKTRACK, RECHOICE, FAIL, SET_ALT, OPTIONAL, COLLECT, REPEAT, LOOK, LOOK_END, PREC_BEGIN, PREC_FIRST,
+ PREC_OPERATOR, PREC_OPERAND, PREC_END, ENTER, EXIT, LITERALS, MARK, UNMARK, RELEASE, PRUNE, PRUNED, CUT) = range(37)
+
+
+class Program(object):
+    """
+    The instructions of a compiled table, the address each rule body starts at and the lexeme each
+    GUARD skips by address
+    """
+
+    def __init__(self):
+        self.code = []
+        self.entries = {}
+        self.skipped = {}
+
+    def emit(self, op, a=None, b=None):
+        self.code.append((op, a, b))
+        return len(self.code) - 1
+
+    def label(self):
+        return len(self.code)
+
+    def patch(self, address, target):
+        """Points the jump emitted at address to target"""
+        op, a, b = self.code[address]
+        if op == GUARD:
+            self.code[address] = (op, a, target)
+        else:
+            self.code[address] = (op, target, b)
+
+
+def compile_table(table, guards, profile=False):
+    """
+    Compiles every rule in table and returns a dict of rule name to a function parse(parser, parent)
+    running the rule's body, as table_compiler.compile_table does.  guards is first_sets.guards(table).
+    With profile each rule body is bracketed by ENTER and EXIT, recording it in parser.recorder.
+    """
+    program = Program()
+    for name in sorted(table):
+        program.entries[name] = program.label()
+        if profile:
+            program.emit(ENTER, name)
+        compile_lexeme(program, table[name], table, guards)
+        if profile:
+            program.emit(EXIT)
+        program.emit(RETURN)
+    program.code = tuple(program.code)
+    return dict((name, _rule_runner(program, entry)) for name, entry in program.entries.items())
+
+
+def _rule_runner(program, entry):
+    def parse(parser, parent):
+        return run(parser, program, entry, parent)
+    return parse
+
+
+def compile_lexeme(program, lexeme, table, guards):
+    """Emits the instructions parsing lexeme into the current parent, leaving whether it matched"""
+    emit = program.emit
+    if isinstance(lexeme, Empty):
+        emit(EMPTY)
+    elif isinstance(lexeme, Literal):
+        emit(LITERAL, lexeme)
+    elif isinstance(lexeme, Regex):
+        emit(REGEX, lexeme)
+    elif isinstance(lexeme, Ident):
+        if lexeme.value in table:
+            emit(CALL, lexeme.value)
+        else:
+            emit(UNDEFINED, lexeme.value)
+    elif isinstance(lexeme, LiteralOption):
+        emit(LITERALS, lexeme)
+    elif isinstance(lexeme, Option):
+        ends = []
+        pruned = []
+        alts = lexeme.alts if lexeme.alts is not None else range(len(lexeme.value))
+        for alt, option in zip(alts, lexeme.value):
+            guard = guards.get(id(option))
+            skip = emit(GUARD, guard) if guard is not None else None
+            if skip is not None:
+                program.skipped[skip] = option
+            emit(CHOICE)
+            compile_lexeme(program, option, table, guards)
+            failed = emit(JUMP_IF_FALSE)
+            emit(COMMIT)
+            emit(SET_ALT, alt)
+            ends.append(emit(JUMP))
+            program.patch(failed, emit(BACKTRACK))
+            if isinstance(option, Concat) and option.cut is not None:
+                pruned.append(emit(PRUNED))
+            if skip is not None:
+                program.patch(skip, program.label())
+        fail = emit(FAIL)
+        for address in pruned:
+            program.patch(address, fail)
+        for end in ends:
+            program.patch(end, program.label())
+    elif isinstance(lexeme, Precedence):
+        emit(PREC_BEGIN, lexeme)
+        operand = lexeme.value.value
+        call = (CALL, operand) if operand in table else (UNDEFINED, operand)
+        emit(*call)
+        first = emit(PREC_FIRST)
+        loop = emit(PREC_OPERATOR)
+        emit(*call)
+        emit(PREC_OPERAND, loop)
+        program.patch(loop, emit(PREC_END))
+        program.patch(first, program.label())
+    elif isinstance(lexeme, Concat):
+        emit(MARK)
+        failures = []
+        for child in lexeme.value:
+            compile_lexeme(program, child, table, guards)
+            failures.append(emit(JUMP_IF_FALSE))
+        emit(UNMARK)
+        end = emit(JUMP)
+        cut = lexeme.cut
+        if cut is not None and cut + 1 < len(failures):
+            # past the cut the concatenation fails with None, see table_descriptor.Concat
+            prune = emit(RELEASE)
+            emit(PRUNE)
+            for failure in failures[cut + 1:]:
+                program.patch(failure, prune)
+            failures = failures[:cut + 1]
+            ends = [end, emit(JUMP)]
+        else:
+            ends = [end]
+        backtrack = emit(RELEASE)
+        for failure in failures:
+            program.patch(failure, backtrack)
+        for end in ends:
+            program.patch(end, program.label())
+    elif isinstance(lexeme, Optional):
+        compile_lexeme(program, lexeme.value, table, guards)
+        emit(OPTIONAL, lexeme.value.type)
+    elif isinstance(lexeme, (Repeat, OptionalRepeat)):
+        emit(COLLECT, lexeme.value.type)
+        loop = program.label()
+        guard = guards.get(id(lexeme.value))
+        skip = emit(GUARD, guard) if guard is not None else None
+        if skip is not None:
+            program.skipped[skip] = lexeme.value
+        compile_lexeme(program, lexeme.value, table, guards)
+        done = emit(JUMP_IF_FALSE)
+        emit(RECHOICE)
+        emit(JUMP, loop)
+        end = emit(REPEAT, lexeme.value.type, isinstance(lexeme, OptionalRepeat))
+        program.patch(done, end)
+        if skip is not None:
+            program.patch(skip, end)
+    elif isinstance(lexeme, (PositiveLookahead, NegativeLookahead)):
+        emit(LOOK)
+        compile_lexeme(program, lexeme.value, table, guards)
+        emit(LOOK_END, isinstance(lexeme, NegativeLookahead))
+    elif isinstance(lexeme, Rule):
+        compile_lexeme(program, lexeme.value, table, guards)
+    elif isinstance(lexeme, EOF):
+        emit(EOF_, lexeme)
+    elif isinstance(lexeme, Cut):
+        emit(CUT)
+    elif isinstance(lexeme, Abort):
+        emit(ABORT, lexeme)
+    else:
+        emit(UNSUPPORTED, lexeme)
+
+
+def run(parser, program, pc, parent):
+    """Runs program from address pc with parent as the current parent node, returns whether it matched"""
+    code = program.code
+    entries = program.entries
+    memo = parser.memo
+    # frames of the rule calls, repetitions, lookaheads and operator rules being parsed
+    stack = []
+    result = False
+    while True:
+        op, a, b = code[pc]
+        pc += 1
+        # most frequent first
+        if op == JUMP_IF_FALSE:
+            if not result:
+                pc = a
+        elif op == JUMP:
+            pc = a
+        elif op == GUARD:
+            if parser.peek() not in a:
+                if parser.cursor >= parser.farthest:
+                    parser.fail(program.skipped[pc - 1])
+                result = False
+                pc = b
+        elif op == MARK:
+            parser.push_state()
+            stack.append(parser.mark(parent))
+        elif op == UNMARK:
+            parser.drop_state()
+            stack.pop()
+        elif op == CHOICE:
+            parser.push_state()
+        elif op == COMMIT:
+            parser.drop_state()
+        elif op == RETURN:
+            if not stack:
+                return result
+            pc, parent, node, key = stack.pop()
+            if result is None:
+                # a body failing past a cut fails like any other, cuts only stop the options of their rule
+                result = False
+            if key is not None:
+                parser.remember(key, result, node, parent)
+            elif result:
+                parser.attach(parent, node)
+            else:
+                parser.discard(node)
+        elif op == CALL:
+            if memo is not None:
+                key = (a, parser.cursor)
+                matched = parser.recall(key, parent)
+                if matched is not None:
+                    result = matched
+                    continue
+            else:
+                key = None
+            node = parser.new_node(a)
+            stack.append((pc, parent, node, key))
+            parent = node
+            pc = entries[a]
+        elif op == SET_ALT:
+            parser.set_alt(parent, a)
+        elif op == LITERAL:
+            result = parser.parse_literal(a, parent)
+        elif op == REGEX:
+            result = parser.parse_regex(a, parent)
+        elif op == BACKTRACK:
+            parser.pop_state()
+        elif op == RELEASE:
+            parser.pop_state()
+            parser.release(parent, stack.pop())
+        elif op == LITERALS:
+            result = parser.parse_literal_option(a, parent)
+        elif op == COLLECT:
+            stack.append(parent)
+            parent = parser.new_collector(a)
+            parser.push_state()
+        elif op == REPEAT:
+            parser.pop_state()
+            node = parent
+            parent = stack.pop()
+            if b:
+                result = parser.add_optional_repeat(a, node, parent)
+            else:
+                result = parser.add_repeat(a, node, parent)
+        elif op == RECHOICE:
+            parser.drop_state()
+            parser.push_state()
+        elif op == FAIL:
+            result = False
+        elif op == OPTIONAL:
+            if result:
+                parser.set_matched(parent)
+            else:
+                parser.add_missing(a, parent)
+            result = True
+        elif op == EMPTY:
+            result = parser.add_empty(parent)
+        elif op == LOOK:
+            parser.push_state()
+            stack.append(parent)
+            parent = parser.new_dummy()
+        elif op == LOOK_END:
+            parser.pop_state()
+            parent = stack.pop()
+            if a:
+                result = not result
+            elif not result:
+                result = False
+        elif op == PREC_BEGIN:
+            collector = parser.new_collector(a.name)
+            # lexeme, parent, collector items, operands, pending (level, operator) pairs, and the items
+            # count, level and associativity of the operator being parsed
+            stack.append([a, parent, parser.collected(collector), [], [], 0, 0, False])
+            parent = collector
+        elif op == PREC_FIRST:
+            frame = stack[-1]
+            if not result:
+                stack.pop()
+                parent = frame[1]
+                pc = a
+            else:
+                frame[3].append(frame[2][-1])
+        elif op == PREC_OPERATOR:
+            frame = stack[-1]
+            parser.push_state()
+            frame[5] = len(frame[2])
+            for literal, level, right in frame[0].operators:
+                if parser.parse_literal(literal, parent):
+                    frame[6] = level
+                    frame[7] = right
+                    break
+            else:
+                parser.pop_state()
+                pc = a
+        elif op == PREC_OPERAND:
+            frame = stack[-1]
+            lexeme, saved, items, operands, operators, count, level, right = frame
+            if not result:
+                # an operator without a right operand is left to whatever follows the rule
+                parser.pop_state()
+                del items[count:]
+            else:
+                parser.drop_state()
+                while operators and (operators[-1][0] > level or operators[-1][0] == level and not right):
+                    parser.reduce(lexeme.name, operands, operators)
+                operators.append((level, items[-2]))
+                operands.append(items[-1])
+                pc = a
+        elif op == PREC_END:
+            lexeme, parent, items, operands, operators = stack.pop()[:5]
+            while len(operators) > 1:
+                parser.reduce(lexeme.name, operands, operators)
+            if operators:
+                parser.attach(parent, operands[0])
+                parser.attach(parent, operators[0][1])
+                parser.attach(parent, operands[1])
+            else:
+                parser.attach(parent, operands[0])
+            result = True
+        elif op == ENTER:
+            parser.recorder.enter(a)
+        elif op == EXIT:
+            parser.recorder.exit(result)
+        elif op == EOF_:
+            result = parser.end or parser.fail(a)
+        elif op == CUT:
+            result = parser.cut()
+        elif op == PRUNED:
+            if result is None:
+                result = False
+                pc = a
+        elif op == PRUNE:
+            result = None
+        elif op == ABORT:
+            parser.abort(a)
+        elif op == UNSUPPORTED:
+            raise RuntimeError('unsupported lexeme {0}: {1}'.format(type(a).__name__, a))
+        elif op == UNDEFINED:
+            raise KeyError(a)
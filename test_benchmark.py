@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from parser import Parser
+import benchmark
+import benchmark_grammars
+
+
+class BenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # the commands print their tables
+        self.stdout, sys.stdout = sys.stdout, StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+
+    def write(self, name, results, format=benchmark.FORMAT):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            json.dump({'format': format, 'python': '2.7', 'results': results}, f)
+        return path
+
+    def test_generators(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            for size in ('16K', '100K'):
+                code = generate(benchmark.parse_size(size))
+                # inputs come within a block of the size asked for
+                self.assertLess(abs(len(code) - benchmark.parse_size(size)), benchmark.parse_size(size) // 4,
+                                (name, size))
+                tree = Parser(action, entry=entry).parse(code)
+                self.assertTrue(tree, (name, size))
+                evaluate(tree)
+
+    def test_run_case(self):
+        result = benchmark.run_case(('json', 'vm', '10K'))
+        self.assertEqual((result['grammar'], result['engine'], result['size']), ('json', 'vm', '10K'))
+        self.assertEqual(result['bytes'], len(benchmark_grammars.generate_json(benchmark.parse_size('10K'))))
+        for field, higher in benchmark.CHECKED:
+            self.assertGreaterEqual(result[field], 0, field)
+
+    def test_suite_output(self):
+        path = os.path.join(self.directory, 'results.json')
+        benchmark.main(['suite', '--max-size', '1K', '--grammars', 'json,config', '--engines', 'closure',
+                        '--output', path])
+        with open(path) as f:
+            document = json.load(f)
+        self.assertEqual(document['format'], benchmark.FORMAT)
+        self.assertEqual(sorted(document['results']), ['config closure 1K', 'json closure 1K'])
+
+    def test_compare(self):
+        case = {'parse_mbps': 10.0, 'eval_mbps': 20.0, 'peak_kb': 1000}
+        baseline = self.write('baseline.json', {'json vm 1K': case, 'json vm 10K': case})
+        same = self.write('same.json', {'json vm 1K': dict(case, parse_mbps=9.5), 'json vm 100K': case})
+        slower = self.write('slower.json', {'json vm 1K': dict(case, parse_mbps=8.0)})
+        larger = self.write('larger.json', {'json vm 1K': dict(case, peak_kb=1200, eval_mbps=40.0)})
+        self.assertEqual(benchmark.main(['compare', baseline, same]), 0)
+        self.assertIn('json vm 100K', sys.stdout.getvalue())
+        self.assertEqual(benchmark.main(['compare', baseline, slower]), 1)
+        self.assertEqual(benchmark.main(['compare', baseline, slower, '--threshold', '0.3']), 0)
+        self.assertEqual(benchmark.main(['compare', baseline, larger]), 1)
+        self.assertIn('improved', sys.stdout.getvalue())
+
+    def test_compare_format(self):
+        baseline = self.write('baseline.json', {})
+        with self.assertRaises(ValueError):
+            benchmark.main(['compare', baseline, self.write('old.json', {}, format=0)])
+
+    def test_best_time(self):
+        runs = []
+        benchmark.best_time(lambda: runs.append(1), min_time=0, min_runs=3)
+        self.assertEqual(len(runs), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from arena import encode, decode
+from grammar_cache import GrammarCache
+from parse_cache import ParseCache
+from test_engines import dump
+import benchmark_grammars
+
+
+class Unswapped(ActionBase):
+    _a = "'p'\n'x'"
+    _b = "'p'\n'y'"
+
+
+class Swapped(ActionBase):
+    _a = "'p'\n'y'"
+    _b = "'p'\n'x'"
+
+
+class GrammarCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        action = benchmark_grammars.Json
+        cache = GrammarCache(self.directory)
+        table = Parser(action, entry='document', cache=cache).table
+        cache = GrammarCache(self.directory)
+        parser = Parser(action, entry='document', cache=cache)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 0})
+        self.assertEqual(sorted(parser.table), sorted(table))
+        self.assertEqual(parser.parse('[1, {"a": true}]')(), [1, {'a': True}])
+
+    def test_rule_order(self):
+        grammar = Parser.generate_grammar(benchmark_grammars.Config)
+        names = [rule.split(' = ')[0] for rule in grammar.split(';\n')]
+        self.assertEqual(names, sorted(names))
+
+    def test_swapped_rule_lines(self):
+        # the two grammars have the same lines, in different rules
+        cache = GrammarCache(self.directory)
+        self.assertNotEqual(Parser.grammar_hash(Swapped), Parser.grammar_hash(Unswapped))
+        self.assertTrue(Parser(Unswapped, entry='a', cache=cache).parse('p x'))
+        self.assertFalse(Parser(Swapped, entry='a', cache=cache).parse('p x'))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 2})
+
+    def test_unreadable_entry(self):
+        cache = GrammarCache(self.directory)
+        grammar = Parser.generate_grammar(benchmark_grammars.Config)
+        with open(cache.path(grammar), 'wb') as f:
+            f.write('not a table')
+        self.assertIsNone(cache.get(grammar))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1})
+
+    def test_removed_directory(self):
+        cache = GrammarCache(self.directory)
+        shutil.rmtree(self.directory)
+        self.assertTrue(Parser(benchmark_grammars.Json, entry='document', cache=cache).parse('[1]'))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1})
+        os.mkdir(self.directory)
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.action, self.entry, generate, evaluate = benchmark_grammars.GRAMMARS['json']
+        self.inputs = ['[{0}, {1}]'.format(idx, generate(1000)) for idx in range(8)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parser(self, cache, **options):
+        return Parser(self.action, entry=self.entry, tree='arena', parse_cache=cache, **options)
+
+    def test_hit(self):
+        cache = ParseCache()
+        parser = self.parser(cache)
+        expected = [dump(parser.parse(code)) for code in self.inputs]
+        self.assertEqual([dump(parser.parse(code)) for code in self.inputs], expected)
+        self.assertEqual(cache.stats(), {'hits': 8, 'misses': 8, 'entries': 8})
+        plain = Parser(self.action, entry=self.entry)
+        self.assertEqual(expected, [dump(plain.parse(code)) for code in self.inputs])
+
+    def test_directory(self):
+        expected = [dump(self.parser(ParseCache(self.directory)).parse(code)) for code in self.inputs]
+        cache = ParseCache(self.directory, size=2)
+        parser = self.parser(cache)
+        self.assertEqual([dump(parser.parse(code)) for code in self.inputs], expected)
+        self.assertEqual(cache.stats(), {'hits': 8, 'misses': 0, 'entries': 2})
+        cache.invalidate()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_unreadable_entry(self):
+        cache = ParseCache(self.directory)
+        parser = self.parser(cache)
+        key = cache.key(parser.grammar_key, self.entry, self.inputs[0])
+        with open(cache.path(key), 'wb') as f:
+            f.write('not an arena')
+        self.assertEqual(dump(parser.parse(self.inputs[0])), dump(self.parser(None).parse(self.inputs[0])))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_removed_directory(self):
+        cache = ParseCache(self.directory)
+        parser = self.parser(cache)
+        shutil.rmtree(self.directory)
+        self.assertEqual(dump(parser.parse(self.inputs[0])), dump(self.parser(None).parse(self.inputs[0])))
+        # the entry is still kept in memory
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1, 'entries': 1})
+        os.mkdir(self.directory)
+
+    def test_errors_not_cached(self):
+        cache = ParseCache()
+        parser = self.parser(cache)
+        self.assertFalse(parser.parse('[1, '))
+        self.assertFalse(parser.parse('[1, '))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 2, 'entries': 0})
+
+    def test_encode(self):
+        parser = self.parser(None)
+        tree = parser.parse(self.inputs[0])
+        arena = decode(encode(tree.arena), parser.binding)
+        self.assertEqual(dump(arena.view(arena.root)), dump(tree))
+        with self.assertRaises(ValueError):
+            decode(encode(tree.arena)[:-1], parser.binding)
+
+    def test_threads(self):
+        cache = ParseCache(size=3)
+        parser = self.parser(cache)
+        expected = [dump(parser.parse(code)) for code in self.inputs]
+        failures = []
+
+        def work(offset):
+            for idx in range(40):
+                code = (idx + offset) % len(self.inputs)
+                if dump(parser.parse(self.inputs[code])) != expected[code]:
+                    failures.append(code)
+        threads = [threading.Thread(target=work, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8 + 8 * 40)
+        self.assertLessEqual(stats['entries'], 3)
+
+    def test_pickle(self):
+        cache = ParseCache(self.directory)
+        self.parser(cache).parse(self.inputs[0])
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(copy.entries), 0)
+        self.assertTrue(copy.get(cache.key(self.parser(cache).grammar_key, self.entry, self.inputs[0])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from test_engines import dump, generated, outcome, parse, ENGINES, TREES
+
+
+class Statements(ActionBase):
+    _program = "statement_list $$"
+    _statement_list = "*statement"
+    _statement = r"(/for\b/ ~ ident '=' expr 'to' expr '{' statement_list '}' | /if\b/ ~ expr 'then' '{' statement_list '}' | assign) ';'"
+    _assign = "ident '=' expr"
+    _expr = "/[0-9]+/ | ident"
+    _ident = "/[a-z]+/"
+
+
+class Committed(ActionBase):
+    _s = "*stmt $$"
+    _stmt = "('for' ~ ident '=' ident | 'if' ~ ('(' ident ')' ~ ident | ident) | (ident '=' ~ ident | ident ';' ~ 'x') | ident) ';'"
+    _ident = "/[a-z]+/"
+
+
+CODE = 'iffy = 2; format = 1; for i = 1 to 3 { if i then { x = i; }; }; forty = if1;'
+
+
+class CutTest(unittest.TestCase):
+    def test_keyword_prefixed_identifiers(self):
+        tree = Parser(Statements, entry='statement_list').parse('iffy = 2; format = 1; fort = for;')
+        self.assertTrue(tree)
+        self.assertEqual([statement.alt for statement in tree.children], [2, 2, 2])
+
+    def test_cut_fails_statement(self):
+        # a broken loop is not tried as an assignment, its error is where the loop went wrong
+        result = Parser(Statements, entry='program').parse('x = 1; for i = 1 { };')
+        self.assertFalse(result)
+        self.assertEqual((result.offset, result.expected), (17, ["'to'"]))
+
+    def test_engines_match(self):
+        for code in (CODE, 'for i = 1 { };', 'if x then { for = 1; };'):
+            expected = parse(Statements, code, entry='program')
+            for tree in TREES:
+                for engine in ENGINES:
+                    for memoize in (False, True):
+                        self.assertEqual(parse(Statements, code, entry='program', tree=tree, engine=engine,
+                                               memoize=memoize), expected, (code, tree, engine, memoize))
+                        self.assertEqual(parse(Statements, code, entry='program', tree=tree, engine=engine,
+                                               memoize=memoize, optimize=True), expected, (code, tree, engine))
+
+    def test_committed_alternatives(self):
+        module = generated(Committed)
+        for code, parsed in (('for a = b;', True), ('for = b;', False), ('if (a) b;', True), ('if (a b;', False),
+                             ('if a;', True), ('a = b;', True), ('a;', True), ('a; x;', True), ('a = ;', False)):
+            expected = parse(Committed, code, entry='s')
+            self.assertEqual(bool(Parser(Committed, entry='s').parse(code)), parsed, code)
+            self.assertEqual(outcome(module.Parser(Committed, entry='s').parse(code)), expected, code)
+            for engine in ENGINES:
+                self.assertEqual(parse(Committed, code, entry='s', engine=engine, memoize=True), expected,
+                                 (code, engine))
+
+    def test_memo_released(self):
+        code = ' '.join(['for i = 1 to 3 { x = i; };'] * 500)
+        for engine in ENGINES:
+            context = Parser(Statements, entry='statement_list', engine=engine, memoize=True).context()
+            tree = context.run(code, 'statement_list')
+            self.assertEqual(len(tree.children), 500)
+            # the memo holds the entries of the last statement, not those of the whole input
+            self.assertLess(len(context.memo), 50, engine)
+            self.assertEqual(dump(tree), dump(Parser(Statements, entry='statement_list').parse(code)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,501 @@
+import imp
+import operator
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from error import ImproperlyConfigured, ParseError
+from incremental import Document
+from memo import Memo
+from table_descriptor import Lexeme, Rule
+import benchmark
+import benchmark_grammars
+import table_generator
+import table_parser
+
+
+ENGINES = ('interpreter', 'closure', 'vm')
+TREES = ('objects', 'arena')
+
+
+def dump(node, missing=False):
+    """
+    Returns the fields of the subtree of node, a node object or an arena view, as nested tuples.  The
+    empty node under an optional that did not match is shared by node object trees and has no position.
+    """
+    value = node.value if getattr(node, 'leaf', False) or node.type == 'empty' else None
+    match = getattr(node, 'match', None)
+    position = (None, None) if missing else (node.line, node.linepos)
+    return (node.type,) + position + (getattr(node, 'alt', None), match, value,
+                                      [dump(child, match is False) for child in node.children])
+
+
+def outcome(result):
+    """Returns the dump of a tree, or the position and expected terminals of a parse error"""
+    if result:
+        return dump(result)
+    return result.offset, result.line, result.pos, result.expected
+
+
+def parse(action, code, **options):
+    return outcome(Parser(action, **options).parse(code))
+
+
+def generated(action):
+    """Returns the module table_generator writes for action, imported without a file"""
+    source = table_generator.generate(action)
+    module = imp.new_module('generated_' + action.__name__)
+    exec source in module.__dict__
+    return module
+
+
+class Terminals(ActionBase):
+    _s = "*(word | number | anchored) $$"
+    _word = "/[a-z]+/"
+    _number = "'0x' /[0-9a-f]+/ | /[0-9]+/"
+    _anchored = "'@' /^x/"
+    _start = "/^x/ '@'"
+
+
+class Aborted(ActionBase):
+    _s = "*item $$"
+    _item = "'a' ?'b' | 'c' +('d' | 'e') | ?=('f' 'g') 'f' 'g' | ?!='h' /[i-k]+/ | 'h' !<h is reserved>"
+
+
+class Commented(ActionBase):
+    _s = "*word $$"
+    _word = "/[a-z]+/"
+    _skip = r"/\s|#[^\n]*/"
+
+
+class Calculator(ActionBase):
+    _lines = "*line $$"
+    _line = "expr ';'"
+
+    operators = {'+': operator.add, '-': operator.sub, '*': operator.mul, '//': operator.floordiv, '^': operator.pow,
+                 '<': operator.lt}
+
+    def _expr(expr):
+        """factor [left '<', left '+' '-', left '*' '//', right '^']"""
+        # operands are factors, or nested exprs for the operators of a level
+        if len(expr.children) == 1:
+            return expr.factor()
+        left, op, right = expr.children
+        return Calculator.operators[op.value](left(), right())
+
+    def _factor(factor):
+        """/[0-9]+/ | '(' expr ')'"""
+        return int(factor.regex.value) if factor.alt == 0 else factor.expr()
+
+
+def evaluates(text):
+    try:
+        eval(text)
+    except ZeroDivisionError:
+        return False
+    return True
+
+
+def expression(generator, depth):
+    """Returns a random expression over the Calculator operators, written so Python reads it the same"""
+    if depth == 0 or generator.random() < 0.3:
+        return str(generator.randint(1, 9))
+    if generator.random() < 0.2:
+        return '(' + expression(generator, depth - 1) + ')'
+    # no powers, a random tower of them is too large to compute
+    op = generator.choice([' + ', ' - ', ' * ', ' // '])
+    return expression(generator, depth - 1) + op + expression(generator, depth - 1)
+
+
+class Unsupported(Lexeme):
+    pass
+
+
+class Replayed(ActionBase):
+    _a = "?b 'x' | b 'y'"
+    _b = "'q'"
+
+
+class TerminalsTest(unittest.TestCase):
+    def test_match_at_cursor(self):
+        tree = Parser(Terminals, entry='s').parse(' ab\n  0x1f 42\n\n c')
+        leaves = [(leaf.value, leaf.line, leaf.linepos) for item in tree.children for leaf in item.children]
+        self.assertEqual(leaves, [('ab', 1, 1), ('0x', 2, 2), ('1f', 2, 4), ('42', 2, 7), ('c', 4, 1)])
+
+    def test_anchor_at_cursor(self):
+        # a leading ^ is dropped, the terminal matches at the cursor wherever it is
+        for engine in ENGINES:
+            self.assertTrue(Parser(Terminals, entry='start', engine=engine).parse('x@'))
+            self.assertTrue(Parser(Terminals, entry='anchored', engine=engine).parse('@x'))
+            self.assertFalse(Parser(Terminals, entry='anchored', engine=engine).parse('@@x'))
+
+    def test_unicode(self):
+        code = u'abc 12 \u00e9'
+        for tree in TREES:
+            result = Parser(Terminals, entry='s', tree=tree).parse(code)
+            self.assertFalse(result)
+            self.assertEqual((result.offset, result.line, result.pos), (7, 1, 7))
+            self.assertEqual(parse(Terminals, code[:7], entry='s', tree=tree), parse(Terminals, code[:7], entry='s'))
+
+
+class SkipTest(unittest.TestCase):
+    def test_skip_rule(self):
+        code = '# leading comment\n  ab # trailing\n\n\tcd\n# end'
+        for tree in TREES:
+            for engine in ENGINES:
+                words = Parser(Commented, entry='s', tree=tree, engine=engine).parse(code).children
+                self.assertEqual([(word.regex.value, word.line, word.linepos) for word in words],
+                                 [('ab', 2, 2), ('cd', 4, 1)], (tree, engine))
+
+    def test_skip_option(self):
+        parser = Parser(Terminals, entry='s', skip='[ .]')
+        self.assertEqual(outcome(parser.parse('..ab . 12.')), parse(Terminals, '  ab   12 ', entry='s'))
+        self.assertFalse(parser.parse('ab\n12'))
+        # the option wins over the grammar's skip rule
+        self.assertFalse(Parser(Commented, entry='s', skip=' ').parse('ab # c'))
+
+    def test_long_skipped_runs(self):
+        code = '\n' * 100000 + 'ab' + ' ' * 100000 + 'cd'
+        for tree in TREES:
+            words = Parser(Commented, entry='s', tree=tree).parse(code).children
+            self.assertEqual([(word.line, word.linepos) for word in words], [(100001, 0), (100001, 100002)])
+
+
+class PrecedenceTest(unittest.TestCase):
+    def test_evaluation(self):
+        generator = random.Random(3)
+        expressions = [expression(generator, 5) for idx in range(200)]
+        expressions = [text for text in expressions if evaluates(text)]
+        code = ' '.join(text + ';' for text in expressions)
+        expected = [eval(text) for text in expressions]
+        module = generated(Calculator)
+        parsers = [Parser(Calculator, entry='lines', tree=tree, engine=engine, memoize=memoize)
+                   for tree in TREES for engine in ENGINES for memoize in (False, True)]
+        parsers.append(module.Parser(Calculator, entry='lines'))
+        for parser in parsers:
+            lines = parser.parse(code)
+            self.assertEqual([line.expr() for line in lines.children], expected, (parser.engine, parser.memoize))
+
+    def test_associativity(self):
+        lines = Parser(Calculator, entry='lines').parse('8 - 4 - 2; 2 ^ 3 ^ 2; 1 + 2 * 3 < 8;')
+        self.assertEqual([line.expr() for line in lines.children], [2, 512, True])
+        left, op, right = lines.children[0].expr.children
+        self.assertEqual((op.value, right()), ('-', 2))
+        left, op, right = lines.children[1].expr.children
+        self.assertEqual((left(), op.value), (2, '^'))
+
+    def test_trees_match(self):
+        for code in ('1 + 2 * 3 ^ 4 ^ 5 - 6 // 7;', '(1 + 2) * 3;', '1 +;', '1 + 2', '1 // 2 / 3;'):
+            expected = parse(Calculator, code, entry='lines')
+            for tree in TREES:
+                for engine in ENGINES:
+                    self.assertEqual(parse(Calculator, code, entry='lines', tree=tree, engine=engine), expected,
+                                     (code, tree, engine))
+
+    def test_dangling_operator(self):
+        # an operator without a right operand is left for what follows the rule
+        for engine in ENGINES:
+            self.assertEqual(Parser(Calculator, entry='expr', engine=engine).parse('1 + 2 -')(), 3)
+            result = Parser(Calculator, entry='lines', engine=engine).parse('1 + 2 -;')
+            self.assertFalse(result)
+            self.assertEqual(result.offset, 7)
+
+    def test_long_expression(self):
+        # the parser loops over the operators of a level, it does not recurse once per operator
+        code = ' + '.join(['1 * 2'] * 20000) + ';'
+        for engine in ENGINES:
+            expr = Parser(Calculator, entry='lines', engine=engine).parse(code).children[0].expr
+            total = 0
+            while expr.children[1].value == '+':
+                total += expr.children[2]()
+                expr = expr.children[0]
+            self.assertEqual(total + expr(), 40000, engine)
+
+
+class ClosureTest(unittest.TestCase):
+    def test_trees_match(self):
+        grammars = sorted(benchmark_grammars.GRAMMARS.items()) + [
+            ('program', (benchmark.Program, 'statement_list', benchmark.generate_program, None))]
+        for name, (action, entry, generate, evaluate) in grammars:
+            code = generate(3000)
+            for tree in TREES:
+                # cut short, the input fails somewhere inside
+                for text in (code, code[:len(code) * 2 // 3]):
+                    self.assertEqual(parse(action, text, entry=entry, tree=tree, engine='closure'),
+                                     parse(action, text, entry=entry, tree=tree), (name, tree))
+
+    def test_lexemes(self):
+        for code in ('a ab c d e cde fg ij', 'c', 'f', 'i fg ab', ''):
+            for tree in TREES:
+                self.assertEqual(parse(Aborted, code, entry='s', tree=tree, engine='closure'),
+                                 parse(Aborted, code, entry='s', tree=tree), (code, tree))
+
+    def test_unsupported_lexeme(self):
+        table = {'s': Rule(name='s', value=Unsupported(value='x'), directive=[])}
+        with self.assertRaises(RuntimeError) as raised:
+            table_parser.create_parser(table, Terminals, engine='closure').parse('x', 's')
+        self.assertIn('Unsupported', str(raised.exception))
+
+    def test_abort(self):
+        for engine in ENGINES:
+            with self.assertRaises(SyntaxError) as raised:
+                Parser(Aborted, entry='s', engine=engine).parse('a\n ij h')
+            self.assertEqual(str(raised.exception), 'h is reserved\nLine: 2, Pos: 5\n ij h\n     ^', engine)
+
+
+class VmTest(unittest.TestCase):
+    def test_trees_match(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(3000)
+            for tree in TREES:
+                for text in (code, code[:len(code) * 2 // 3]):
+                    self.assertEqual(parse(action, text, entry=entry, tree=tree, engine='vm'),
+                                     parse(action, text, entry=entry, tree=tree), (name, tree))
+
+    def test_lexemes(self):
+        for code in ('a ab c d e cde fg ij', 'c', 'f', 'i fg ab', ''):
+            for memoize in (False, True):
+                self.assertEqual(parse(Aborted, code, entry='s', engine='vm', memoize=memoize),
+                                 parse(Aborted, code, entry='s'), (code, memoize))
+
+    def test_deep_nesting(self):
+        code = '(' * 3000 + '7' + ')' * 3000 + ';'
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(1000)
+        try:
+            for tree in TREES:
+                factor = Parser(Calculator, entry='lines', tree=tree, engine='vm').parse(code).children[0].expr.factor
+                depth = 0
+                while factor.alt == 1:
+                    factor = factor.expr.factor
+                    depth += 1
+                self.assertEqual((depth, factor.regex.value), (3000, '7'), tree)
+            with self.assertRaises(RuntimeError):
+                Parser(Calculator, entry='lines', engine='closure').parse(code)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def test_incremental(self):
+        with self.assertRaises(ValueError):
+            Document(Parser(Calculator, entry='lines', engine='vm'), '1;', 'lines')
+
+    def test_unsupported_lexeme(self):
+        table = {'s': Rule(name='s', value=Unsupported(value='x'), directive=[])}
+        with self.assertRaises(RuntimeError) as raised:
+            table_parser.create_parser(table, Terminals, engine='vm').parse('x', 's')
+        self.assertIn('Unsupported', str(raised.exception))
+
+
+class GeneratorTest(unittest.TestCase):
+    def test_trees_match(self):
+        grammars = sorted(benchmark_grammars.GRAMMARS.items()) + [
+            ('program', (benchmark.Program, 'statement_list', benchmark.generate_program, None))]
+        for name, (action, entry, generate, evaluate) in grammars:
+            module = generated(action)
+            code = generate(3000)
+            for text in (code, code[:len(code) * 2 // 3]):
+                for tree in TREES:
+                    for memoize in (False, True):
+                        self.assertEqual(
+                            outcome(module.Parser(action, entry=entry, tree=tree, memoize=memoize).parse(text)),
+                            parse(action, text, entry=entry, tree=tree), (name, tree, memoize))
+
+    def test_lexemes(self):
+        module = generated(Aborted)
+        for code in ('a ab c d e cde fg ij', 'c', 'f', 'i fg ab', ''):
+            self.assertEqual(outcome(module.Parser(Aborted, entry='s').parse(code)), parse(Aborted, code, entry='s'),
+                             code)
+        with self.assertRaises(SyntaxError):
+            module.Parser(Aborted, entry='s').parse('h')
+
+    def test_nested_groups(self):
+        rule = "'x'"
+        for idx in range(30):
+            # options, concatenations and repetitions each open a loop in the generated code
+            rule = "('a{0}' *('c' {1}) | 'b{0}' | 'b')".format(idx, rule)
+        Nested = type('Nested', (ActionBase,), {'_s': rule + ' $$'})
+        module = generated(Nested)
+        for code in ('b', 'a29 c b28', 'a29 c a28 c a27 c b26', 'a29 c a28 c b b', 'a29 c a28 c b27 c b',
+                     'a29 c a28 c a27 a26 y'):
+            self.assertEqual(outcome(module.Parser(Nested, entry='s').parse(code)), parse(Nested, code, entry='s'),
+                             code)
+
+    def test_out_of_date(self):
+        module = generated(Aborted)
+
+        class Aborted_(ActionBase):
+            _s = "*item $$"
+            _item = "'a'"
+        with self.assertRaises(ImproperlyConfigured):
+            module.Parser(Aborted_, entry='s')
+
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'generated_terminals.py')
+            table_generator.write(Terminals, path)
+            module = imp.load_source('generated_terminals', path)
+            self.assertEqual(outcome(module.Parser(Terminals, entry='s').parse('ab 0x1f')),
+                             parse(Terminals, 'ab 0x1f', entry='s'))
+        finally:
+            shutil.rmtree(directory)
+
+
+class ReentrantTest(unittest.TestCase):
+    def test_threads_share_a_parser(self):
+        action, entry, generate, evaluate = benchmark_grammars.GRAMMARS['json']
+        inputs = ['[{0}, {1}]'.format(idx, generate(300)) for idx in range(6)] + ['[1, ']
+        for options in ({}, {'engine': 'closure'}, {'engine': 'vm', 'memoize': True}, {'tree': 'arena'}):
+            parser = Parser(action, entry=entry, **options)
+            expected = [outcome(parser.parse(code)) for code in inputs]
+            failures = []
+
+            def work(offset):
+                for idx in range(10):
+                    code = (idx + offset) % len(inputs)
+                    if outcome(parser.parse(inputs[code])) != expected[code]:
+                        failures.append(code)
+            threads = [threading.Thread(target=work, args=(offset,)) for offset in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(failures, [], options)
+
+    def test_action_class_untouched(self):
+        first = Parser(Terminals, entry='s')
+        second = Parser(Terminals, entry='word', skip='[.]')
+        self.assertNotIn('table', Terminals.__dict__)
+        self.assertNotIn('ast_node', Terminals.__dict__)
+        self.assertIsNot(first.node, second.node)
+        self.assertTrue(first.parse('ab cd'))
+        self.assertTrue(second.parse('..ab'))
+        self.assertIsInstance(first.parse('ab'), Terminals)
+
+    def test_parse_inside_action(self):
+        parser = Parser(Terminals, entry='s')
+
+        class Nested(ActionBase):
+            _s = "*word $$"
+
+            def _word(word):
+                """/[a-z]+/"""
+                return dump(parser.parse(word.regex.value + ' 12'))
+
+        nested = Parser(Nested, entry='s').parse('ab cd')
+        self.assertEqual([word() for word in nested.children], [parse(Terminals, 'ab 12', entry='s'),
+                                                                parse(Terminals, 'cd 12', entry='s')])
+
+
+class MemoTest(unittest.TestCase):
+    def test_memoized_trees_match(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(2000)
+            expected = parse(action, code, entry=entry)
+            self.assertTrue(expected)
+            for tree in TREES:
+                for engine in ENGINES:
+                    self.assertEqual(parse(action, code, entry=entry, tree=tree, engine=engine, memoize=True),
+                                     expected, (name, tree, engine))
+
+    def test_replayed_node_is_not_marked(self):
+        # b is replayed from the memo after the optional that matched it failed
+        for tree in TREES:
+            for engine in ENGINES:
+                expected = parse(Replayed, 'q y', entry='a', tree=tree, engine=engine)
+                self.assertEqual(expected[6][0][3:5], (None, None))
+                self.assertEqual(parse(Replayed, 'q y', entry='a', tree=tree, engine=engine, memoize=True),
+                                 expected, (tree, engine))
+
+    def test_bounded(self):
+        memo = Memo(2)
+        memo.put(('a', 0), 1)
+        memo.put(('b', 0), 2)
+        memo.get(('a', 0))
+        memo.put(('c', 0), 3)
+        self.assertEqual(len(memo), 2)
+        self.assertIsNone(memo.get(('b', 0)))
+        self.assertEqual(memo.get(('a', 0)), 1)
+
+    def test_release(self):
+        memo = Memo()
+        for cursor in range(5):
+            memo.put(('a', cursor), cursor)
+        memo.release(3)
+        self.assertEqual(sorted(memo.entries), [('a', 3), ('a', 4)])
+
+
+class Guarded(ActionBase):
+    _s = "*item ';'"
+    _item = "'a' 'b' | 'a' 'c' | /[0-9]+/ | ?'-' /[xyz]/"
+
+
+class GuardsTest(unittest.TestCase):
+    def test_engines_match(self):
+        for code in ('ab ac 12 -x y;', 'ab ad;', 'ab 12', '-;', ''):
+            expected = parse(Guarded, code, entry='s')
+            for tree in TREES:
+                for engine in ENGINES:
+                    self.assertEqual(parse(Guarded, code, entry='s', tree=tree, engine=engine), expected,
+                                     (code, tree, engine))
+
+    def test_guards_skip_failures(self):
+        # the expected terminals are those of every option, guarded out or tried
+        result = Parser(Guarded, entry='s').parse('ab q;')
+        self.assertFalse(result)
+        self.assertEqual(result.offset, 3)
+        self.assertEqual(sorted(result.expected), sorted(["'a'", '/[0-9]+/', "'-'", '/[xyz]/', "';'"]))
+
+    def test_generated_parser(self):
+        # generated rule functions check their own guards, the parser does not work them out
+        module = generated(Guarded)
+        parser = module.Parser(Guarded, entry='s')
+        self.assertEqual(parser.engine, 'generated')
+        self.assertEqual(parser.guards, {})
+        for code in ('ab ac 12 -x y;', 'ab ad;', ''):
+            self.assertEqual(outcome(parser.parse(code)), parse(Guarded, code, entry='s'), code)
+
+
+class ErrorTest(unittest.TestCase):
+    def test_attributes(self):
+        result = Parser(Calculator, entry='lines').parse('1 + 2;\n3 * ;')
+        self.assertIsInstance(result, ParseError)
+        self.assertIsInstance(result, SyntaxError)
+        self.assertFalse(result)
+        self.assertEqual((result.offset, result.line, result.pos, result.text), (11, 2, 4, '3 * ;'))
+        self.assertEqual(result.expected, ['/[0-9]+/', "'('"])
+        self.assertEqual(str(result), "Expected /[0-9]+/ or '('\nLine: 2, Pos: 4\n3 * ;\n    ^")
+        copy = pickle.loads(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual((copy.offset, copy.expected, str(copy)), (result.offset, result.expected, str(result)))
+
+    def test_farthest_failure(self):
+        # the operators tried after the operand are expected as well as the end of the line
+        result = Parser(Calculator, entry='lines').parse('1 + 2;\n3 4;')
+        self.assertEqual((result.line, result.pos), (2, 2))
+        self.assertEqual(sorted(result.expected), sorted(["'<'", "'+'", "'-'", "'*'", "'//'", "'^'", "';'"]))
+
+    def test_engines_match(self):
+        generator = random.Random(5)
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(2000)
+            module = generated(action)
+            for idx in range(5):
+                text = code[:generator.randint(0, len(code) - 1)]
+                expected = parse(action, text, entry=entry)
+                self.assertEqual(outcome(module.Parser(action, entry=entry).parse(text)), expected, (name, idx))
+                for tree in TREES:
+                    for engine in ENGINES:
+                        for memoize in (False, True):
+                            self.assertEqual(parse(action, text, entry=entry, tree=tree, engine=engine,
+                                                   memoize=memoize), expected, (name, idx, tree, engine, memoize))
+
+
+if __name__ == '__main__':
+    unittest.main()
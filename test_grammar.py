@@ -0,0 +1,84 @@
+import gc
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from error import GrammarError
+from first_sets import guards
+from grammar_lexer import Lexer, Token
+from grammar_parser import GrammarParser
+from table_descriptor import Concat, Literal, Regex, NegativeLookahead, Precedence
+import benchmark
+
+
+class Empty(ActionBase):
+    pass
+
+
+class Escapes(ActionBase):
+    # a comment, and a quote and a slash escaped
+    _s = "'it\\'s' /a\\/b/ # not a lexeme 'x'\n ?!='q'"
+
+
+class GrammarTest(unittest.TestCase):
+    def test_tokens(self):
+        tokens = Lexer("a = ?!='it\\'s' # comment\n /x\\/y/ [left '+'];").tokenise()
+        self.assertEqual([(token.type, token.value) for token in tokens], [
+            (Token.IDENT, 'a'), ('=', '='), ('?!=', '?!='), (Token.LITERAL, "it's"), (Token.REGEX, 'x/y'),
+            ('[', '['), (Token.IDENT, 'left'), (Token.LITERAL, '+'), (']', ']'), (';', ';'), (Token.END, '')])
+        self.assertEqual(tokens[3].offset, 7)
+
+    def test_table(self):
+        table = Parser(Escapes).table
+        body = table['s'].value
+        self.assertIsInstance(body, Concat)
+        literal, regex, lookahead = body.value
+        self.assertIsInstance(literal, Literal)
+        self.assertEqual(literal.value, "it's")
+        self.assertIsInstance(regex, Regex)
+        self.assertEqual(regex.value, 'a/b')
+        self.assertIsInstance(lookahead, NegativeLookahead)
+        self.assertTrue(Parser(Escapes, entry='s').parse("it's a/b"))
+
+    def test_precedence(self):
+        table = GrammarParser("e = n [left '+' '-', right '^']; n = /[0-9]+/;").parse().table()
+        self.assertIsInstance(table['e'].value, Precedence)
+        self.assertEqual(table['e'].value.levels, [('left', ['+', '-']), ('right', ['^'])])
+        with self.assertRaises(GrammarError):
+            GrammarParser("e = n [up '+']; n = /[0-9]+/;").parse().table()
+        with self.assertRaises(GrammarError):
+            GrammarParser("e = n n [left '+']; n = /[0-9]+/;").parse().table()
+
+    def test_regex_anchors(self):
+        table = GrammarParser("a = /^x/ /\\Ay/ /[^z]/ /(?m)^#/;").parse().table()
+        self.assertEqual([regex.value for regex in table['a'].value.value], ['x', 'y', '[^z]', '(?m)^#'])
+        # only the start of the input matches these, never the cursor of a terminal
+        for pattern in ('a|^b', '(^a)', '^^a', 'a\\A'):
+            with self.assertRaises(GrammarError):
+                GrammarParser('a = /{0}/;'.format(pattern)).parse()
+
+    def test_syntax_error(self):
+        with self.assertRaises(SyntaxError) as raised:
+            GrammarParser("a = 'x';\nb = 'y' | ;").parse()
+        self.assertIn('Line: 2, Pos: 10', str(raised.exception))
+        with self.assertRaises(SyntaxError) as raised:
+            GrammarParser("a = 'x' @;").parse()
+        self.assertIn('Line: 1, Pos: 8', str(raised.exception))
+
+    def test_no_rules(self):
+        with self.assertRaises(GrammarError) as raised:
+            Parser(Empty)
+        self.assertIn('Line: 1, Pos: 0', str(raised.exception))
+
+    def test_large_grammar(self):
+        code = benchmark.generate_rules(200)
+        self.assertTrue(gc.isenabled())
+        table = GrammarParser(code).parse().table()
+        self.assertEqual(len(table), 401)
+        self.assertTrue(guards(table))
+        # the collector is turned off while compiling and back on after
+        self.assertTrue(gc.isenabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import random
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from incremental import Document
+from first_sets import regex_looked, regex_reach
+from test_engines import dump, outcome, Replayed
+import benchmark_grammars
+
+
+class Calculator(ActionBase):
+    _lines = "*line $$"
+    _line = "expr ';'"
+    _expr = "factor [left '+' '-', left '*' '/', right '^']"
+    _factor = "/[0-9]+/ | '(' expr ')'"
+
+
+class DocumentTest(unittest.TestCase):
+    def check(self, action, entry, code, seed):
+        parser = Parser(action, entry=entry)
+        document = Document(parser, code, entry)
+        generator = random.Random(seed)
+        for step in range(40):
+            spaces = [idx for idx, char in enumerate(document.code) if char in ' \n']
+            offset = generator.choice(spaces)
+            document.edit(offset, 1, generator.choice([' ', '\n', '\n\n  ', ' \n ']))
+            if step % 3 == 0:
+                # positions read after several edits are moved past all of them
+                self.assertEqual(dump(document.tree), dump(parser.parse(document.code, entry)), step)
+
+    def test_edits(self):
+        action, entry, generate, evaluate = benchmark_grammars.GRAMMARS['interpreter']
+        self.check(action, entry, generate(3000), 1)
+        action, entry, generate, evaluate = benchmark_grammars.GRAMMARS['json']
+        self.check(action, entry, generate(3000), 2)
+
+    def test_precedence(self):
+        self.check(Calculator, 'lines', ' '.join(['1 + 2 * (3 - 4) ^ 2 ^ 1;'] * 40), 3)
+
+    def test_text_edit(self):
+        parser = Parser(Calculator, entry='lines')
+        document = Document(parser, '1 + 2;\n3 * 4;\n5;')
+        self.assertEqual(dump(document.edit(4, 1, '(7 +\n 8)')), dump(parser.parse('1 + (7 +\n 8);\n3 * 4;\n5;')))
+        self.assertFalse(document.edit(0, 1, '+'))
+        self.assertEqual(dump(document.edit(0, 1, '1')), dump(parser.parse(document.code)))
+
+    def test_later_nodes_untouched(self):
+        parser = Parser(Calculator, entry='lines')
+        document = Document(parser, '1;\n' * 200)
+        last = document.tree.children[-1]
+        self.assertEqual(last.line, 200)
+        moved = last._moved
+        document.edit(0, 0, '\n\n')
+        self.assertIs(document.tree.children[-1], last)
+        self.assertEqual(last._moved, moved)
+        self.assertEqual((last.line, last.linepos), (202, 0))
+
+    def test_replayed_node_is_not_marked(self):
+        document = Document(Parser(Replayed, entry='a'), 'q x')
+        self.assertEqual(dump(document.edit(2, 1, 'y')), dump(Parser(Replayed, entry='a').parse('q y')))
+
+    def test_regex_tail(self):
+        # the number regex looked past '1' into its exponent, which the edit completes
+        action, entry, generate, evaluate = benchmark_grammars.GRAMMARS['json']
+        parser = Parser(action, entry=entry)
+        document = Document(parser, '[1e]', entry)
+        self.assertEqual(outcome(document.edit(3, 0, '5')), outcome(parser.parse('[1e5]')))
+        self.assertEqual(document.tree(), [100000.0])
+
+    def test_regex_reach(self):
+        number = regex_reach(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?')
+        # the exponent it gives up on may have been looked at as far as its first digit
+        self.assertEqual(regex_looked(number, '1e+]', 0, 1), 4)
+        # nothing in the pattern matches ']', it looked no further
+        self.assertEqual(regex_looked(number, '1]', 0, 1), 2)
+        self.assertEqual(regex_looked(regex_reach('[a-z][a-z0-9]*'), 'ab1 ', 0, 3), 4)
+        # [a-z]+ gives back what b needs, only the width of a finite pattern bounds the others
+        self.assertIsNone(regex_looked(regex_reach('[a-z]+b'), 'abcab', 0, 2))
+        self.assertEqual(regex_looked(regex_reach('(?:a|ab)c'), 'acabc', 0, 2), 4)
+
+    def test_number_edits(self):
+        # each number is given a tail it first gives up on, then completed, then removed again
+        action, entry, generate, evaluate = benchmark_grammars.GRAMMARS['json']
+        parser = Parser(action, entry=entry)
+        document = Document(parser, generate(2000), entry)
+        generator = random.Random(4)
+        ends = [idx + 1 for idx, char in enumerate(document.code) if char.isdigit() and
+                not document.code[idx + 1].isdigit()]
+        for step, offset in enumerate(generator.sample(ends, 40)):
+            tail = generator.choice(['e', '.', 'e-'])
+            for edit in ((offset, 0, tail), (offset + len(tail), 0, '5'), (offset, len(tail) + 1, '')):
+                tree, expected = document.edit(*edit), parser.parse(document.code)
+                # a failed reparse does not try reused failures again, its error can differ
+                self.assertEqual(bool(tree), bool(expected), (step, edit))
+                if tree:
+                    self.assertEqual(dump(tree), dump(expected), (step, edit))
+
+    def test_arena(self):
+        with self.assertRaises(ValueError):
+            Document(Parser(Calculator, entry='lines', tree='arena'), '1;')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import pickle
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from test_engines import dump, generated, ENGINES, TREES
+import benchmark_grammars
+
+
+class Sums(ActionBase):
+    _sums = "*sum $$"
+
+    def _sum(node):
+        """number *('+' number) ';'"""
+        return node.number() + sum([item() for item in node.concat_set_1[1::2]])
+
+    def _number(number):
+        """/[0-9]+/"""
+        return int(number.regex.value)
+
+
+class Pairs(ActionBase):
+    _pairs = "number number ?(number number) $$"
+    _number = "/[0-9]+/"
+
+
+class Braces(ActionBase):
+    _object = "'{' members '}' | '{' '}'"
+    _members = "pair *(',' pair)"
+    _pairs = "*(pair ';') pair $$"
+    _pair = "/[a-z]+/ ':' /[0-9]+/"
+
+
+class NodesTest(unittest.TestCase):
+    def test_accessors(self):
+        for tree in TREES:
+            pairs = Parser(Pairs, entry='pairs', tree=tree).parse('1 2 3 4')
+            self.assertEqual(pairs.number.regex.value, '1')
+            self.assertEqual(pairs.number_1.regex.value, '1')
+            self.assertEqual(pairs.number_2.regex.value, '2')
+            # the numbers of the optional group are children of pairs
+            self.assertEqual(pairs.number_4.regex.value, '4')
+            with self.assertRaises(AttributeError):
+                pairs.number_5
+            self.assertEqual(Parser(Pairs, entry='pairs', tree=tree).parse('1 2').concat.match, False)
+            with self.assertRaises(AttributeError):
+                pairs.missing
+
+    def test_repetition_sets(self):
+        code = '1 + 2 + 3; 4;'
+        for tree in TREES:
+            sums = Parser(Sums, entry='sums', tree=tree).parse(code)
+            self.assertEqual([item() for item in sums.sum_set_1], [6, 4])
+            self.assertEqual(len(sums.sum_1.concat_set_1), 4)
+            self.assertEqual(sums.sum_2.concat_set_1, [])
+
+    def test_many_children(self):
+        # every child of a type has an accessor, however many there are
+        code = ' '.join(['1'] * 200) + ';'
+        for tree in TREES:
+            sums = Parser(Sums, entry='sums', tree=tree).parse(code.replace(' ', ' + '))
+            self.assertEqual(sums.sum(), 200)
+            self.assertEqual(sums.sum.concat_set_1[-1].regex.value, '1')
+
+    def test_slots(self):
+        node = Parser(Sums, entry='sums').parse('1;')
+        self.assertFalse(hasattr(node, '__dict__') and node.__dict__)
+        node.extra = 1
+        self.assertEqual(node.extra, 1)
+        # optionals that did not match share their empty node
+        pairs = Parser(Pairs, entry='pairs')
+        self.assertIs(pairs.parse('1 2').children[2].children[0], pairs.parse('3 4').children[2].children[0])
+
+    def test_pickle(self):
+        for tree in TREES:
+            sums = Parser(Sums, entry='sums', tree=tree).parse('1 + 2; 3;')
+            if tree == 'objects':
+                sums.sum.extra = 'kept'
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                copy = pickle.loads(pickle.dumps(sums, protocol))
+                self.assertEqual(dump(copy), dump(sums), (tree, protocol))
+                self.assertEqual([item() for item in copy.sum_set_1], [3, 3])
+                if tree == 'objects':
+                    self.assertEqual(copy.sum.extra, 'kept')
+
+
+def count(node):
+    return 1 + sum([count(child) for child in node.children])
+
+
+class ArenaTest(unittest.TestCase):
+    def test_actions(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(3000)
+            tree = Parser(action, entry=entry).parse(code)
+            view = Parser(action, entry=entry, tree='arena').parse(code)
+            self.assertEqual(evaluate(view), evaluate(tree), name)
+
+    def test_arrays(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(3000)
+            view = Parser(action, entry=entry, tree='arena').parse(code)
+            arena = view.arena
+            # failed branches are dropped, the arena holds exactly the nodes of the tree
+            self.assertEqual(len(arena), count(Parser(action, entry=entry).parse(code)), name)
+            self.assertEqual(arena.type_name(arena.root), entry)
+            self.assertEqual(arena.span(arena.root)[0], 0)
+            self.assertEqual([view.arena.type_name(child) for child in arena.children(arena.root)],
+                             [child.type for child in view.children])
+
+    def test_views(self):
+        arena = Parser(Sums, entry='sums', tree='arena').parse('1 + 2;\n 30;').arena
+        root = arena.root
+        second = arena.children(root)[1]
+        self.assertEqual(arena.value(arena.children(arena.children(second)[0])[0]), '30')
+        self.assertEqual(arena.position(arena.start[second]), (2, 1))
+        self.assertEqual(arena.repetitions(root), [('sum', arena.children(root)[0], 2)])
+        view = arena.view(second)
+        self.assertEqual((view.line, view.linepos, view()), (2, 1, 30))
+        with self.assertRaises(TypeError):
+            view.add_child(view)
+
+
+class FailedBranchTest(unittest.TestCase):
+    def test_failed_alternative(self):
+        # the '{' of the first alternative is not left behind when members fails
+        module = generated(Braces)
+        parsers = [Parser(Braces, entry='object', tree=tree, engine=engine, memoize=memoize, optimize=optimize)
+                   for tree in TREES for engine in ENGINES for memoize in (False, True) for optimize in (False, True)]
+        parsers.append(module.Parser(Braces, entry='object'))
+        for idx, parser in enumerate(parsers):
+            node = parser.parse('{}')
+            self.assertEqual((node.alt, [child.value for child in node.children]), (1, ['{', '}']), idx)
+
+    def test_half_matched_item(self):
+        # the last pair is tried as a repetition item and then parsed again after it
+        for tree in TREES:
+            for engine in ENGINES:
+                pairs = Parser(Braces, entry='pairs', tree=tree, engine=engine).parse('a: 1; b: 2; c: 3')
+                self.assertEqual([child.type for child in pairs.children], ['pair', 'literal'] * 2 + ['pair'])
+                self.assertEqual([child.type for child in pairs.concat_set_1], ['pair', 'literal'] * 2)
+
+    def test_arena_released(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(3000)
+            nodes = count(Parser(action, entry=entry).parse(code))
+            for engine in ENGINES:
+                arena = Parser(action, entry=entry, tree='arena', engine=engine).parse(code).arena
+                self.assertEqual(len(arena), nodes, (name, engine))
+                # memo entries may still refer to the nodes of failed branches, they are kept
+                view = Parser(action, entry=entry, tree='arena', engine=engine, memoize=True).parse(code)
+                self.assertGreaterEqual(len(view.arena), nodes, (name, engine))
+                self.assertEqual(count(view), nodes, (name, engine))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from grammar_optimizer import optimize
+from table_descriptor import Option, LiteralOption
+from test_engines import parse, ENGINES, TREES
+import benchmark_grammars
+
+
+class Nested(ActionBase):
+    _s = "*(item | group) $$"
+    _item = "('a' | 'b' | ('c' | 'd')) ((word))"
+    _group = "'(' (('x' ~ word) | 'x' 'y') ')'"
+    _word = "/[a-z]+/"
+    _unused = "'u' word"
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_trees_match(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(2000)
+            for tree in TREES:
+                for engine in ENGINES:
+                    expected = parse(action, code, entry=entry, tree=tree, engine=engine)
+                    self.assertEqual(parse(action, code, entry=entry, tree=tree, engine=engine, optimize=True),
+                                     expected, (name, tree, engine))
+
+    def test_nested_trees_match(self):
+        for code in ('a q b r (x w) d s', 'c z (x y)', '(x y) a', 'e'):
+            for engine in ENGINES:
+                self.assertEqual(parse(Nested, code, entry='s', engine=engine, optimize=True),
+                                 parse(Nested, code, entry='s', engine=engine), (code, engine))
+
+    def test_rewrites(self):
+        table = Parser(Nested).table
+        optimized, report = optimize(table, 's')
+        self.assertIsInstance(optimized['item'].value.value[0], LiteralOption)
+        # the cut alternative keeps its option
+        self.assertIsInstance(optimized['group'].value.value[1], Option)
+        self.assertIn('unused: removed, unreachable from s', report)
+        self.assertNotIn('unused', optimized)
+        self.assertIn('unused', table)
+
+    def test_removed_rule(self):
+        parser = Parser(Nested, entry='s', optimize=True)
+        with self.assertRaises(ValueError) as raised:
+            parser.parse('u w', 'unused')
+        self.assertIn('removed by optimize', str(raised.exception))
+        # rules the entry reaches can still be parsed on their own
+        self.assertTrue(parser.parse('w', 'word'))
+
+    def test_unknown_rule(self):
+        for options in ({}, {'optimize': True}):
+            with self.assertRaises(ValueError):
+                Parser(Nested, entry='s', **options).parse('a', 'missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from parser import Parser
+from test_engines import outcome
+import benchmark_grammars
+
+
+class ParseManyTest(unittest.TestCase):
+    def setUp(self):
+        action, entry, generate, evaluate = benchmark_grammars.GRAMMARS['json']
+        self.inputs = ['[{0}, {1}]'.format(idx, generate(1000)) for idx in range(6)] + ['[1, ']
+        self.parser = Parser(action, entry=entry)
+        self.expected = [outcome(self.parser.parse(code)) for code in self.inputs]
+
+    def results(self, **options):
+        return [outcome(result) for result in self.parser.parse_many(self.inputs, **options)]
+
+    def test_process(self):
+        self.assertEqual(self.results(workers=2), self.expected)
+
+    def test_thread(self):
+        self.assertEqual(self.results(workers=3, mode='thread'), self.expected)
+
+    def test_unordered(self):
+        results = dict(self.parser.parse_many(self.inputs, workers=2, mode='thread', ordered=False))
+        self.assertEqual([outcome(results[index]) for index in range(len(self.inputs))], self.expected)
+
+    def test_mode(self):
+        with self.assertRaises(ValueError):
+            list(self.parser.parse_many(self.inputs, mode='fork'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import threading
+import unittest
+
+from parser import Parser
+from grammar_parser import GrammarParser
+from incremental import Document
+from profiler import Profile, FIELDS
+from test_engines import dump, ENGINES, TREES
+from test_nodes import Sums
+import benchmark_grammars
+
+
+# counters that do not depend on timing or on how the tree is stored
+COUNTS = ('calls', 'matched', 'failed', 'backtracks', 'bytes')
+
+
+def counts(profile, fields=COUNTS):
+    return dict((name, [stats[field] for field in fields]) for name, stats in profile.as_dict().items())
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_counts(self):
+        parser = Parser(Sums, entry='sums', profile=True)
+        self.assertFalse(parser.parse('1 + 2; 3 +; 4;'))
+        stats = counts(parser.profile, ('calls', 'matched', 'failed'))
+        self.assertEqual(stats, {'sums': [1, 0, 1], 'sum': [2, 1, 1], 'number': [4, 3, 1]})
+        self.assertEqual(parser.profile.as_dict()['number']['nodes'], 3)
+
+    def test_engines_match(self):
+        for name, (action, entry, generate, evaluate) in sorted(benchmark_grammars.GRAMMARS.items()):
+            code = generate(2000)
+            parser = Parser(action, entry=entry, profile=True)
+            parser.parse(code)
+            expected = counts(parser.profile, COUNTS + ('nodes',))
+            for tree in TREES:
+                for engine in ENGINES:
+                    for memoize in (False, True):
+                        parser = Parser(action, entry=entry, tree=tree, engine=engine, memoize=memoize, profile=True)
+                        parser.parse(code)
+                        fields = COUNTS + ('nodes',) if tree == 'objects' and not memoize else COUNTS
+                        self.assertEqual(counts(parser.profile, fields),
+                                         dict((rule, stats[:len(fields)]) for rule, stats in expected.items()),
+                                         (name, tree, engine, memoize))
+
+    def test_trees_unchanged(self):
+        code = '1 + 2; 3;\n 4 + 5 + 6;'
+        for engine in ENGINES:
+            self.assertEqual(dump(Parser(Sums, entry='sums', engine=engine, profile=True).parse(code)),
+                             dump(Parser(Sums, entry='sums', engine=engine).parse(code)), engine)
+
+    def test_report(self):
+        parser = Parser(Sums, entry='sums', profile=True)
+        parser.parse('1 + 2; 3;')
+        lines = parser.profile.report(sort='calls').splitlines()
+        self.assertEqual(lines[0].split(), ['rule'] + list(FIELDS))
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['number', 'sum', 'sums'])
+        self.assertEqual(len(parser.profile.report(limit=1).splitlines()), 2)
+        with self.assertRaises(ValueError):
+            parser.profile.report(sort='name')
+
+    def test_json(self):
+        parser = Parser(Sums, entry='sums', profile=True)
+        parser.parse('1 + 2; 3;')
+        self.assertEqual(json.loads(parser.profile.to_json()), parser.profile.as_dict())
+        parser.profile.clear()
+        self.assertEqual(parser.profile.as_dict(), {})
+
+    def test_parses_add_up(self):
+        parser = Parser(Sums, entry='sums', profile=True)
+        parser.parse('1 + 2; 3;')
+        once = counts(parser.profile)
+        threads = [threading.Thread(target=parser.parse, args=('1 + 2; 3;',)) for idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counts(parser.profile), dict((name, [value * 5 for value in stats])
+                                                      for name, stats in once.items()))
+
+    def test_grammar_parser(self):
+        profile = Profile()
+        GrammarParser("a = 'x' b; b = /y/;", profile).parse()
+        stats = profile.as_dict()
+        self.assertEqual((stats['rule']['calls'], stats['rule']['matched']), (2, 2))
+        self.assertEqual(stats['rules']['bytes'], 19)
+
+    def test_incremental(self):
+        with self.assertRaises(ValueError):
+            Document(Parser(Sums, entry='sums', profile=True), '1;', 'sums')
+
+
+if __name__ == '__main__':
+    unittest.main()
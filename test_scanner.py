@@ -0,0 +1,85 @@
+import unittest
+
+from parser import Parser
+from action import ActionBase
+from incremental import Document
+from parse_cache import ParseCache
+from test_engines import dump, generated, outcome, parse, ENGINES, TREES
+import benchmark
+import benchmark_grammars
+
+
+class Keywords(ActionBase):
+    _s = "*(statement ';') $$"
+    _statement = "'if' name | 'i' ?='f' name | name '=' (number | name)"
+    _name = "/[a-z]+/"
+    _number = "/[0-9]+(?:\\.[0-9]+)?/ | /[0-9a-f]+/"
+    _word = "/[a-z]*/ '.'"
+
+
+class ScannerTest(unittest.TestCase):
+    def test_trees_match(self):
+        grammars = sorted(benchmark_grammars.GRAMMARS.items()) + [
+            ('program', (benchmark.Program, 'statement_list', benchmark.generate_program, None))]
+        for name, (action, entry, generate, evaluate) in grammars:
+            code = generate(3000)
+            module = generated(action)
+            # cut short, the error is the same too
+            for text in (code, code[:len(code) * 2 // 3]):
+                expected = parse(action, text, entry=entry)
+                self.assertEqual(outcome(module.Parser(action, entry=entry, tokens=True).parse(text)), expected, name)
+                self.assertEqual(parse(action, text, entry=entry, tokens=True, optimize=True), expected, name)
+                for tree in TREES:
+                    for engine in ENGINES:
+                        for memoize in (False, True):
+                            self.assertEqual(parse(action, text, entry=entry, tree=tree, engine=engine,
+                                                   memoize=memoize, tokens=True), expected,
+                                             (name, tree, engine, memoize))
+
+    def test_longest_match(self):
+        parser = Parser(Keywords, entry='s', tokens=True)
+        tree = parser.parse('if x; iffy = 12.5; g = 1f;')
+        self.assertEqual([statement.alt for statement in tree.children[::2]], [0, 2, 2])
+        self.assertEqual(tree.children[2].children[0].children[0].value, 'iffy')
+        # 12.5 is longer as a decimal, 1f as a hexadecimal number
+        self.assertEqual([tree.children[idx].children[2].alt for idx in (2, 4)], [0, 1])
+        # the literal 'f' is a keyword, never a name
+        self.assertFalse(parser.parse('f = 1;'))
+        self.assertTrue(Parser(Keywords, entry='s').parse('f = 1;'))
+
+    def test_whole_tokens(self):
+        # a terminal never matches part of a longer token, 'i' is not the start of 'if'
+        self.assertTrue(Parser(Keywords, entry='s').parse('if;'))
+        self.assertFalse(Parser(Keywords, entry='s', tokens=True).parse('if;'))
+
+    def test_nullable_regex(self):
+        for tokens in (False, True):
+            tree = Parser(Keywords, entry='word', tokens=tokens).parse('.')
+            self.assertEqual([leaf.value for leaf in tree.children], ['', '.'], tokens)
+
+    def test_tokens(self):
+        parser = Parser(Keywords, entry='s', tokens=True)
+        code = 'a = 1;\n  b = c;$'
+        tokens = parser.scanner.tokenise(code)
+        self.assertEqual(list(tokens.starts), [0, 2, 4, 5, 9, 11, 13, 14, 15])
+        self.assertEqual(list(tokens.lines), [1, 1, 1, 1, 2, 2, 2, 2, 2])
+        self.assertEqual(list(tokens.positions[4:]), [2, 4, 6, 7, 8])
+        self.assertEqual(tokens.kinds[-1], -1)
+        self.assertEqual(tokens.index[9], 4)
+        self.assertEqual(tokens.index[10], -1)
+
+    def test_unsupported(self):
+        parser = Parser(Keywords, entry='s', tokens=True)
+        with self.assertRaises(ValueError):
+            parser.push_parser()
+        with self.assertRaises(ValueError):
+            Document(parser, 'a = b;')
+
+    def test_parse_cache(self):
+        cache = ParseCache()
+        self.assertNotEqual(cache.grammar_key(Parser(Keywords, tree='arena', tokens=True)),
+                            cache.grammar_key(Parser(Keywords, tree='arena')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import random
+import unittest
+from StringIO import StringIO
+
+from parser import Parser
+from action import ActionBase
+from test_engines import dump, ENGINES
+import benchmark
+
+
+class Lines(ActionBase):
+    _lines = "*line"
+    _line = "expr ';'"
+    _expr = "factor [left '+' '-', left '*' '/', right '^']"
+    _factor = "/[0-9]+(\\.[0-9]+)?/ | /[a-z]+/ | '(' expr ')'"
+
+
+class Tails(ActionBase):
+    _words = "*word"
+    _word = "/a(?:bc)?/"
+
+
+class IterparseTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser(benchmark.Program, entry='statement_list')
+        self.code = benchmark.generate_program(20000)
+
+    def test_items(self):
+        expected = [dump(item) for item in self.parser.parse(self.code).children]
+        for chunk_size in (64, 4096, 65536):
+            items = [dump(item) for item in self.parser.iterparse(StringIO(self.code), chunk_size=chunk_size)]
+            self.assertEqual(items, expected, chunk_size)
+
+    def test_stream(self):
+        items = list(self.parser.iterparse(benchmark.ProgramStream(200000)))
+        self.assertTrue(items)
+        self.assertTrue(all(item.type == 'statement' for item in items))
+
+    def test_error(self):
+        with self.assertRaises(SyntaxError):
+            list(self.parser.iterparse(StringIO(self.code + ' x = ;')))
+
+
+class PushParserTest(unittest.TestCase):
+    code = ' '.join('{0} + 2.5 * (x - {0}) ^ 2;'.format(i) for i in range(300))
+
+    def test_request_fed_whole(self):
+        for engine in ENGINES:
+            parser = Parser(Lines, entry='lines', engine=engine)
+            expected = [dump(item) for item in parser.parse(self.code).children]
+            push = parser.push_parser()
+            first = self.code.index(';') + 1
+            push.feed(self.code[:first])
+            self.assertEqual([dump(item) for item in push], expected[:1], engine)
+            push.feed(self.code[first:self.code.index(';', first) + 1] + '\n')
+            self.assertEqual([dump(item) for item in push], expected[1:2], engine)
+
+    def test_random_feeds(self):
+        generator = random.Random(2)
+        for engine in ENGINES:
+            for memoize in (False, True):
+                parser = Parser(Lines, entry='lines', engine=engine, memoize=memoize)
+                expected = [dump(item) for item in parser.parse(self.code).children]
+                for low, high in ((1, 5), (1, 300)):
+                    push = parser.push_parser(chunk_size=32)
+                    items = []
+                    offset = 0
+                    while offset < len(self.code):
+                        size = generator.randint(low, high)
+                        push.feed(self.code[offset:offset + size])
+                        offset += size
+                        items.extend(dump(item) for item in push)
+                    push.close()
+                    items.extend(dump(item) for item in push)
+                    self.assertEqual(items, expected, (engine, memoize, low, high))
+
+    def test_number_cut_short(self):
+        # 12 may go on as 123 until more input shows where it ends
+        parser = Parser(Lines, entry='lines')
+        push = parser.push_parser()
+        push.feed('1 + 12')
+        self.assertEqual(list(push), [])
+        push.feed('3;')
+        self.assertEqual([dump(item) for item in push], [dump(item) for item in parser.parse('1 + 123;').children])
+
+    def test_optional_tail_cut_short(self):
+        # /a(?:bc)?/ looked at 'b' and then the end of the input, ab may still go on as abc
+        for engine in ENGINES:
+            push = Parser(Tails, entry='words', engine=engine).push_parser()
+            push.feed('ab')
+            self.assertEqual(list(push), [])
+            push.feed('c a')
+            items = [item.regex.value for item in push]
+            push.close()
+            items.extend(item.regex.value for item in push)
+            self.assertEqual(items, ['abc', 'a'], engine)
+
+    def test_error_on_close(self):
+        push = Parser(Lines, entry='lines').push_parser()
+        push.feed('1; 2 +')
+        self.assertEqual(len(list(push)), 1)
+        push.close()
+        with self.assertRaises(SyntaxError):
+            list(push)
+
+    def test_feed_after_close(self):
+        push = Parser(Lines, entry='lines').push_parser()
+        push.close()
+        self.assertEqual(list(push), [])
+        with self.assertRaises(ValueError):
+            push.feed('1;')
+
+
+if __name__ == '__main__':
+    unittest.main()